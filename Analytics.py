@@ -0,0 +1,103 @@
+# pylint: disable=W1203 # Use lazy % formatting...
+# pylint: disable=C0301 # Line too long
+'''Cross-relationship analytics: joins the friends, followers and followings of one user.
+
+The three lists are sorted ID arrays, so every derived set is a single sorted-array operation.
+The derived sets of the previous run are kept as snapshot files next to the tracker state, which
+turns each run into a list of users who entered or left a set (e.g. "started following you back").
+'''
+import os
+import json
+import logging
+import tempfile
+from array import array
+from typing import Dict, Optional, Sequence
+
+from Snapshot import difference_sorted, intersect_sorted, diff_sorted, read_snapshot_ids, write_snapshot, SnapshotError, SNAPSHOT_EXTENSION
+
+logger = logging.getLogger("RobloxTracker")
+
+# Derived sets reported by every run, in display order
+DERIVED_SET_NAMES = ("not_followed_back", "not_following_back", "mutuals_not_friends")
+
+class RelationshipIndex:
+    '''Sorted ID arrays of one user's friends, followers and followings'''
+    def __init__(self, friends: Sequence[int], followers: Sequence[int], followings: Sequence[int]):
+        self.friends = friends
+        self.followers = followers
+        self.followings = followings
+        self.mutuals = intersect_sorted(followers, followings)
+
+    def derived_sets(self) -> Dict[str, array]:
+        """Followers you don't follow back, followings who don't follow you and mutuals who are not friends."""
+        return {
+            "not_followed_back": difference_sorted(self.followers, self.followings),
+            "not_following_back": difference_sorted(self.followings, self.followers),
+            "mutuals_not_friends": difference_sorted(self.mutuals, self.friends),
+        }
+
+    def counts(self) -> Dict[str, int]:
+        """Sizes of the three lists and of the mutual follows."""
+        return {"friends": len(self.friends), "followers": len(self.followers),
+                "followings": len(self.followings), "mutuals": len(self.mutuals)}
+
+def derived_set_file(state_prefix: str, name: str) -> str:
+    """Snapshot file that keeps derived set `name` between runs."""
+    return f"{state_prefix}.{name}{SNAPSHOT_EXTENSION}"
+
+def load_previous_sets(state_prefix: str) -> Optional[Dict[str, array]]:
+    """Derived sets saved by the previous run, None before the first run (or if one is unreadable)."""
+    previous = {}
+    for name in DERIVED_SET_NAMES:
+        path = derived_set_file(state_prefix, name)
+        if not os.path.isfile(path):
+            return None
+        try:
+            previous[name] = read_snapshot_ids(path)
+        except (SnapshotError, OSError) as e:
+            logger.warning(f"Cannot read {path}, starting a new analytics baseline: {e}")
+            return None
+    return previous
+
+def save_sets(state_prefix: str, sets: Dict[str, array]) -> None:
+    """Keep the derived sets for the next run to compare against."""
+    for name, ids in sets.items():
+        write_snapshot(derived_set_file(state_prefix, name), ids)
+
+def compute_deltas(previous: Dict[str, Sequence[int]], current: Dict[str, Sequence[int]]) -> Dict[str, Dict[str, array]]:
+    """Users who entered ("added") or left ("removed") every derived set since the previous run."""
+    deltas = {}
+    for name in DERIVED_SET_NAMES:
+        added, removed = diff_sorted(previous[name], current[name])
+        deltas[name] = {"added": added, "removed": removed}
+    return deltas
+
+def build_export(user_id: str, index: RelationshipIndex, sets: Dict[str, array],
+                 deltas: Optional[Dict[str, Dict[str, array]]], timestamp: int) -> Dict:
+    """JSON-serializable result of one analytics run, `deltas` is None for the first (baseline) run."""
+    counts = index.counts()
+    counts.update({name: len(ids) for name, ids in sets.items()})
+    return {
+        "user_id": int(user_id),
+        "generated": timestamp,
+        "baseline": deltas is None,
+        "counts": counts,
+        "sets": {name: ids.tolist() for name, ids in sets.items()},
+        "changes": {name: {"added": delta["added"].tolist(), "removed": delta["removed"].tolist()}
+                    for name, delta in (deltas or {}).items()},
+    }
+
+def write_export(path: str, export: Dict) -> None:
+    """Atomically replace the JSON export, readers never see a half-written file."""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(prefix=".analytics-", dir=directory)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as file:
+            json.dump(export, file)
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
@@ -0,0 +1,252 @@
+# pylint: disable=W1203 # Use lazy % formatting...
+# pylint: disable=C0301 # Line too long
+# pylint: disable=W0718 # Catching too general exception
+'''Offline benchmark: runs the tracker end-to-end against MockRobloxApi.py.
+
+The stand-in runs in a separate process so the peak RSS reported here belongs to the tracker.
+Every benchmark performs two runs in a fresh data directory:
+
+  initial  first crawl of the whole list, webhooks disabled (nothing to compare against yet)
+  update   after `--churn` entries were added and removed, with Discord webhooks enabled
+
+Example: python Benchmark.py --size 100k --latency-ms 20 --throttle-rate 0.01 --output results.json
+
+`--decode-pages N` instead times only the decoding of N stand-in pages with every installed JSON
+parser (see PageDecoder.py), the stdlib row is what every page cost before the fast path.
+'''
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import logging
+import argparse
+import tempfile
+import multiprocessing
+from typing import Dict, List, Optional
+import aiohttp
+
+import Main
+from MockRobloxApi import serve, parse_size, friends_page, follows_page, encode_cursor
+from PageDecoder import DECODERS, FRIENDS_PAGE, FOLLOWS_PAGE
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+logger = logging.getLogger("RobloxTracker")
+
+BENCHMARK_USER_ID = 1
+SERVER_START_TIMEOUT = 120  # Generating 1M entry lists takes a few seconds
+
+def peak_rss_mb() -> Optional[float]:
+    """Peak resident set size of this process so far, None where the platform cannot tell."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+def free_port() -> int:
+    """Ask the OS for a port that is free right now."""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+async def mock_request(method: str, url: str, payload: Optional[Dict] = None) -> Dict:
+    """Call one of the /_bench endpoints of the stand-in."""
+    async with aiohttp.ClientSession() as session:
+        async with session.request(method, url, json=payload) as response:
+            response.raise_for_status()
+            return await response.json()
+
+async def wait_for_server(base_url: str, process: multiprocessing.Process) -> None:
+    """Poll the stand-in until it answers."""
+    deadline = time.monotonic() + SERVER_START_TIMEOUT
+    while time.monotonic() < deadline:
+        if not process.is_alive():
+            raise RuntimeError("Mock server exited during startup")
+        try:
+            await mock_request("GET", f"{base_url}/_bench/stats")
+            return
+        except aiohttp.ClientError:
+            await asyncio.sleep(0.2)
+    raise RuntimeError("Mock server did not start in time")
+
+def build_config(args: argparse.Namespace, base_url: str) -> Dict:
+    """Tracker config pointing every API and the Discord webhook at the stand-in."""
+    # All APIs share one host here, so they share one rate limit bucket
+    rate_limit = {"rate": args.rate, "burst": max(1, int(args.rate))} if args.rate > 0 else {"rate": 1_000_000.0, "burst": 1_000}
+    return {
+        "targets": [{"user_id": BENCHMARK_USER_ID, "relationships": [args.relationship]}],
+        "discord_webhook_url": f"{base_url}/api/webhooks/1/benchmark",
+        "send_discord_log": True,
+        "send_guilded_log": False,
+        "api_base_urls": {api: base_url for api in Main.DEFAULT_API_BASE_URLS},
+        "rate_limits": {"127.0.0.1": rate_limit},
+        "enrichment_concurrency": args.enrichment_concurrency,
+        "metadata_cache": not args.no_metadata_cache,
+        "classify_removed": not args.no_classify_removed,
+    }
+
+async def measure_run(name: str, settings: Dict, base_url: str) -> Dict:
+    """Run the tracker once and combine its timing with the stand-in's counters."""
+    await mock_request("POST", f"{base_url}/_bench/stats")  # Reset counters
+
+    started = time.perf_counter()
+    failed = None
+    try:
+        await Main.run_tracker(settings=settings)
+    except SystemExit as e:
+        failed = str(e)
+    wall_time = time.perf_counter() - started
+
+    stats = await mock_request("GET", f"{base_url}/_bench/stats")
+    requests = sum(stats["requests"].values())
+    webhook_span = (stats["last_webhook"] - stats["first_webhook"]) if stats["webhooks"] > 1 else None
+    return {
+        "run": name,
+        "failed": failed,
+        "wall_time": round(wall_time, 3),
+        "requests": requests,
+        "requests_per_second": round(requests / wall_time, 1) if wall_time > 0 else None,
+        "requests_by_endpoint": stats["requests"],
+        "throttled": stats["throttled"],
+        "response_bytes": stats["bytes_sent"],
+        "webhooks": stats["webhooks"],
+        "webhook_embeds": stats["webhook_embeds"],
+        "webhook_throttled": stats["webhook_throttled"],
+        "webhook_rejected": stats["webhook_rejected"],
+        "thumbnails_pending": stats["thumbnails_pending"],
+        "webhooks_per_second": round((stats["webhooks"] - 1) / webhook_span, 2) if webhook_span else None,
+        "peak_rss_mb": peak_rss_mb(),
+        "stages": Main.METRICS.stages,
+    }
+
+async def run_benchmark(args: argparse.Namespace, base_url: str, data_directory: str) -> List[Dict]:
+    """Initial crawl without webhooks, churn, then an update run with webhooks."""
+    config = build_config(args, base_url)
+    results = []
+
+    settings = Main.parse_config(config, data_directory, os.path.join(data_directory, Main.CONFIG_FILE_NAME))
+    for target in settings["targets"]:
+        target["sinks"] = []
+    results.append(await measure_run("initial", settings, base_url))
+
+    for index in range(args.update_runs):
+        await mock_request("POST", f"{base_url}/_bench/churn",
+                           {"relationship": args.relationship, "added": args.churn, "removed": args.churn,
+                            "terminated": min(args.terminated, args.churn)})
+        settings = Main.parse_config(config, data_directory, os.path.join(data_directory, Main.CONFIG_FILE_NAME))
+        results.append(await measure_run("update" if args.update_runs == 1 else f"update{index + 1}", settings, base_url))
+    return results
+
+def benchmark_decoding(pages: int) -> List[Dict]:
+    """Time every installed page decoder on full-size friends and followers pages."""
+    bodies = {
+        "friends": (FRIENDS_PAGE, json.dumps(friends_page(list(range(10**9, 10**9 + Main.FRIENDS_LIMIT)), encode_cursor(50), None)).encode()),
+        "followers": (FOLLOWS_PAGE, json.dumps(follows_page(list(range(10**9, 10**9 + Main.FOLLOWERS_FOLLOWINGS_LIMIT)), encode_cursor(100), None)).encode()),
+    }
+    results = []
+    for kind, (layout, body) in bodies.items():
+        baseline = None
+        for backend, decode in DECODERS.items():
+            decode(body, layout)  # Warm up
+            started = time.perf_counter()
+            for _ in range(pages):
+                decode(body, layout)
+            per_page = (time.perf_counter() - started) / pages * 1_000_000
+            baseline = baseline or per_page  # "json" comes first
+            results.append({"page": kind, "backend": backend, "page_bytes": len(body),
+                            "microseconds_per_page": round(per_page, 2), "speedup": round(baseline / per_page, 2)})
+    return results
+
+def print_decoding_results(results: List[Dict]) -> None:
+    """Human readable table of the page decoding benchmark."""
+    print(f"{'page':<11}{'backend':<10}{'bytes':>8}{'us/page':>10}{'speedup':>9}")
+    for result in results:
+        print(f"{result['page']:<11}{result['backend']:<10}{result['page_bytes']:>8}"
+              f"{result['microseconds_per_page']:>10.1f}{result['speedup']:>8.2f}x")
+
+def print_results(results: List[Dict]) -> None:
+    """Human readable summary of every run."""
+    print(f"{'run':<10}{'wall s':>10}{'requests':>10}{'req/s':>10}{'429s':>7}{'webhooks':>10}{'wh/s':>8}{'peak RSS MB':>13}")
+    for result in results:
+        print(f"{result['run']:<10}{result['wall_time']:>10.2f}{result['requests']:>10}"
+              f"{result['requests_per_second'] or 0:>10.1f}{result['throttled']:>7}{result['webhooks']:>10}"
+              f"{result['webhooks_per_second'] or 0:>8.2f}{result['peak_rss_mb'] or 0:>13.1f}")
+        if result["failed"]:
+            print(f"  failed: {result['failed']}")
+
+def parse_arguments(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """Parse command line options."""
+    parser = argparse.ArgumentParser(description="Benchmark the tracker against a local stand-in of the Roblox APIs.")
+    parser.add_argument("--size", type=parse_size, default=1_000, help="Entries in the tracked list, e.g. 1k, 100k, 1m")
+    parser.add_argument("--relationship", choices=Main.VALID_RELATIONSHIP_TYPES, default="followers")
+    parser.add_argument("--churn", type=int, default=50, help="Entries added and removed before every update run")
+    parser.add_argument("--terminated", type=int, default=0, help="How many of the removed entries are terminated accounts")
+    parser.add_argument("--no-classify-removed", action="store_true", help="Announce terminated accounts like other removals")
+    parser.add_argument("--update-runs", type=int, default=1, help="Number of update runs after the initial crawl")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Delay the stand-in adds to every API response")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Fraction of API requests answered with 429")
+    parser.add_argument("--retry-after", type=float, default=0.5, help="Retry-After seconds sent with injected 429s")
+    parser.add_argument("--webhook-limit", type=int, default=5, help="Webhook requests allowed per window (Discord: 5)")
+    parser.add_argument("--webhook-window", type=float, default=2.0, help="Webhook rate limit window in seconds (Discord: 2)")
+    parser.add_argument("--pending-rate", type=float, default=0.0, help="Fraction of thumbnails the stand-in reports as Pending at first")
+    parser.add_argument("--rate", type=float, default=0.0, help="Tracker rate limit in requests/s, 0 for unlimited")
+    parser.add_argument("--enrichment-concurrency", type=int, default=Main.ENRICHMENT_CONCURRENCY)
+    parser.add_argument("--no-metadata-cache", action="store_true", help="Disable the SQLite metadata cache")
+    parser.add_argument("--decode-pages", type=int, default=0, help="Only time decoding this many pages with each JSON parser")
+    parser.add_argument("--output", help="Append the results as one JSON line to this file")
+    parser.add_argument("--verbose", action="store_true", help="Show the tracker's log output")
+    return parser.parse_args(argv)
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Start the stand-in, run the benchmark and report the results."""
+    args = parse_arguments(argv)
+    if not args.verbose:
+        logger.setLevel(logging.ERROR)
+
+    if args.decode_pages > 0:
+        results = benchmark_decoding(args.decode_pages)
+        print_decoding_results(results)
+        write_output(args, results)
+        return
+
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    process = multiprocessing.get_context("spawn").Process(
+        target=serve, daemon=True,
+        args=(port, args.size, args.latency_ms / 1000, args.throttle_rate, args.retry_after,
+              args.webhook_limit, args.webhook_window, 0, args.pending_rate))
+    process.start()
+
+    try:
+        with tempfile.TemporaryDirectory(prefix="tracker-benchmark-") as data_directory:
+            async def run() -> List[Dict]:
+                await wait_for_server(base_url, process)
+                return await run_benchmark(args, base_url, data_directory)
+            results = asyncio.run(run())
+    finally:
+        process.terminate()
+        process.join()
+
+    print_results(results)
+    write_output(args, results)
+
+def write_output(args: argparse.Namespace, results: List[Dict]) -> None:
+    """Append the results (with the script version) as one JSON line to `--output`, if given."""
+    if args.output:
+        record = {
+            "version": Main.APP_VERSION,
+            "timestamp": int(time.time()),
+            "parameters": {key: value for key, value in vars(args).items() if key not in ("output", "verbose")},
+            "runs": results,
+        }
+        with open(args.output, 'a', encoding='utf-8') as file:
+            file.write(json.dumps(record) + "\n")
+
+if __name__ == "__main__":
+    main()
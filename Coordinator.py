@@ -0,0 +1,188 @@
+# pylint: disable=W1203 # Use lazy % formatting...
+# pylint: disable=C0301 # Line too long
+'''Lease-based coordination of tracker workers through a shared SQLite file.
+
+The targets are grouped into work units, one per tracked user (all of the user's relationships and
+analytics), and every unit is a row in the lease table. A worker claims due units, renews its lease
+while it crawls and releases the unit with the time of its next run when done. The row also keeps
+the unit's adaptive poll interval, so whichever worker picks it up next continues the schedule.
+
+A worker that crashes or hangs stops renewing, and once its lease expired another worker takes the
+unit over. Every claim increments the unit's token. Renewals and releases only succeed with the
+current token, and a worker treats its lease as lost some time before it expires in the table. It
+checks that before sending notifications or saving a snapshot, so a worker that lost a unit stops
+before its successor can start, and the change is announced once.
+
+Workers on several machines need the file on a filesystem with working locks (SQLite over NFS is
+not reliable). For a quick look at the table: python Coordinator.py TrackerData/Coordinator.sqlite3
+'''
+import os
+import sys
+import time
+import socket
+import sqlite3
+import logging
+import argparse
+import threading
+from typing import Dict, Iterable, List, Optional
+
+logger = logging.getLogger("RobloxTracker")
+
+DEFAULT_LEASE_SECONDS = 120
+LEASE_SAFETY_FRACTION = 0.25  # Part of the lease a worker gives up early, covers clock skew and slow renewals
+
+class LeaseLost(Exception):
+    '''Raised when a worker no longer holds the lease of the unit it is working on'''
+
+def default_worker_id() -> str:
+    """Host name and process ID, unique among the workers sharing a lease file."""
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+class Lease:
+    '''A unit claimed by this worker'''
+    def __init__(self, unit_key: str, token: int, interval: float, lease_seconds: float):
+        self.unit_key = unit_key
+        self.token = token
+        self.interval = interval
+        self.lease_seconds = lease_seconds
+        self.valid_until = 0.0
+        self.lost = False
+        self.extend()
+
+    def extend(self) -> None:
+        """Called after the lease was written to the table (claim or renewal)."""
+        self.valid_until = time.monotonic() + self.lease_seconds * (1 - LEASE_SAFETY_FRACTION)
+
+    def held(self) -> bool:
+        """Whether the unit may still be worked on: not lost and within the local safety margin."""
+        return not self.lost and time.monotonic() < self.valid_until
+
+class LeaseStore:
+    '''SQLite table of work units and their leases'''
+    def __init__(self, path: str, worker_id: str, lease_seconds: float = DEFAULT_LEASE_SECONDS):
+        self.path = path
+        self.worker_id = worker_id
+        self.lease_seconds = lease_seconds
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # Autocommit mode, claims use explicit BEGIN IMMEDIATE transactions. The default rollback
+        # journal is used instead of WAL, which does not work across machines. The methods are
+        # called from worker threads (asyncio.to_thread), one at a time, and give up on a lock
+        # long before a lease could run out while waiting.
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, timeout=max(1.0, lease_seconds * LEASE_SAFETY_FRACTION / 4),
+                                          isolation_level=None, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS units (
+                unit_key TEXT PRIMARY KEY,
+                owner TEXT,
+                token INTEGER NOT NULL DEFAULT 0,
+                lease_expires REAL NOT NULL DEFAULT 0,
+                next_run REAL NOT NULL DEFAULT 0,
+                interval REAL NOT NULL DEFAULT 0,
+                last_finished REAL,
+                last_changes INTEGER
+            )""")
+
+    def close(self) -> None:
+        """Close the lease file."""
+        with self.lock:
+            self.connection.close()
+
+    def sync_units(self, unit_keys: Iterable[str]) -> None:
+        """Add units of the config that are missing and drop units no longer configured (unless leased)."""
+        with self.lock:
+            unit_keys = list(unit_keys)
+            now = time.time()
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                self.connection.executemany("INSERT OR IGNORE INTO units (unit_key) VALUES (?)", [(key,) for key in unit_keys])
+                placeholders = ",".join("?" * len(unit_keys))
+                self.connection.execute(f"DELETE FROM units WHERE unit_key NOT IN ({placeholders}) AND (owner IS NULL OR lease_expires < ?)",
+                                        (*unit_keys, now))
+                self.connection.execute("COMMIT")
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                raise
+
+    def claim(self, limit: int) -> List[Lease]:
+        """Lease up to `limit` due units that nobody holds, taking over expired leases of other workers."""
+        if limit <= 0:
+            return []
+        with self.lock:
+            now = time.time()
+            self.connection.execute("BEGIN IMMEDIATE")  # Only one worker at a time can pick units
+            try:
+                rows = self.connection.execute("""
+                    SELECT unit_key, owner, token, interval, lease_expires FROM units
+                    WHERE next_run <= ? AND (owner IS NULL OR lease_expires < ?) ORDER BY next_run LIMIT ?
+                    """, (now, now, limit)).fetchall()
+                for row in rows:
+                    self.connection.execute("UPDATE units SET owner = ?, token = token + 1, lease_expires = ? WHERE unit_key = ?",
+                                            (self.worker_id, now + self.lease_seconds, row["unit_key"]))
+                self.connection.execute("COMMIT")
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                raise
+
+        leases = []
+        for row in rows:
+            if row["owner"] is not None:
+                logger.warning(f"[{row['unit_key']}] Taking over from {row['owner']}, its lease expired "
+                               f"{now - row['lease_expires']:.0f}s ago")
+            leases.append(Lease(row["unit_key"], row["token"] + 1, row["interval"], self.lease_seconds))
+        return leases
+
+    def renew(self, lease: Lease) -> bool:
+        """Extend a lease. Returns False (and marks it lost) if another worker took the unit over."""
+        with self.lock:
+            cursor = self.connection.execute("UPDATE units SET lease_expires = ? WHERE unit_key = ? AND owner = ? AND token = ?",
+                                             (time.time() + self.lease_seconds, lease.unit_key, self.worker_id, lease.token))
+            if cursor.rowcount:
+                lease.extend()
+                return True
+            lease.lost = True
+            return False
+
+    def release(self, lease: Lease, next_run: float, interval: float, changes: Optional[int]) -> bool:
+        """Hand a finished unit back with the time of its next run. Returns False if the lease was lost meanwhile."""
+        with self.lock:
+            cursor = self.connection.execute("""
+                UPDATE units SET owner = NULL, lease_expires = 0, next_run = ?, interval = ?, last_finished = ?, last_changes = ?
+                WHERE unit_key = ? AND owner = ? AND token = ?
+                """, (next_run, interval, time.time(), changes, lease.unit_key, self.worker_id, lease.token))
+            return cursor.rowcount > 0
+
+    def next_due(self) -> Optional[float]:
+        """Earliest time a unit becomes claimable (due, or its lease expires), None without units."""
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT MIN(CASE WHEN owner IS NULL THEN next_run ELSE MAX(next_run, lease_expires) END) FROM units").fetchone()
+            return row[0]
+
+    def units(self) -> List[Dict]:
+        """Every unit with its lease and schedule, soonest first."""
+        with self.lock:
+            return [dict(row) for row in self.connection.execute("SELECT * FROM units ORDER BY next_run")]
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Print the units of a lease table, who holds them and when they run next."""
+    parser = argparse.ArgumentParser(description="Show the work units of the tracker workers.")
+    parser.add_argument("path", help="Lease file, e.g. TrackerData/Coordinator.sqlite3")
+    args = parser.parse_args(argv)
+    if not os.path.isfile(args.path):
+        print(f"Error: {args.path} does not exist", file=sys.stderr)
+        raise SystemExit(1)
+
+    store = LeaseStore(args.path, worker_id="")
+    now = time.time()
+    print(f"{'unit':<22}{'owner':<28}{'lease':>8}{'next run':>10}{'interval':>10}{'changes':>9}")
+    for unit in store.units():
+        lease = f"{unit['lease_expires'] - now:.0f}s" if unit["owner"] else "-"
+        print(f"{unit['unit_key']:<22}{unit['owner'] or '-':<28}{lease:>8}{max(0.0, unit['next_run'] - now):>9.0f}s"
+              f"{unit['interval']:>9.0f}s{unit['last_changes'] if unit['last_changes'] is not None else '-':>9}")
+    store.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+# pylint: disable=W1203 # Use lazy % formatting...
+# pylint: disable=C0301 # Line too long
+'''Flap suppression: holds back notifications until a change has lasted for a debounce window.
+
+Every detected add or remove of a user is kept as a pending change in the target's state file
+instead of being announced right away. When the opposite change of the same user shows up before
+the pending one was announced (a follow followed by an unfollow, or the reverse), the two cancel
+out: no lookups, no webhooks. Users that keep doing this are held back longer every time (the
+window doubles per recent flap, up to `max_hold`), which caps how often they can trigger messages.
+The snapshot and the change journal still record every change, only notifications are debounced.
+'''
+import logging
+from array import array
+from typing import Dict, Sequence, Tuple
+
+logger = logging.getLogger("RobloxTracker")
+
+OP_REMOVED = 0
+OP_ADDED = 1
+
+class FlapFilter:
+    '''Pending changes and flap counts of one target, loaded from and saved to its state dictionary'''
+    def __init__(self, state: Dict, window: float, max_hold: float, now: float):
+        self.window = window
+        self.max_hold = max(window, max_hold)
+        self.now = now
+        # "user_id" -> [operation, first seen], JSON object keys are strings
+        self.pending: Dict[str, list] = state.get("flap_pending", {})
+        # "user_id" -> [cancelled changes, last cancellation], forgotten after `max_hold` without flapping
+        self.flaps: Dict[str, list] = {key: entry for key, entry in state.get("flap_counts", {}).items()
+                                       if now - entry[1] < self.max_hold}
+        self.cancelled = 0
+
+    def hold_time(self, key: str) -> float:
+        """How long a change of this user has to last before it is announced."""
+        flaps = self.flaps.get(key, (0, 0))[0]
+        return min(self.max_hold, self.window * 2 ** flaps)
+
+    def observe(self, added: Sequence[int], removed: Sequence[int]) -> None:
+        """Queue the changes of this run, cancelling pending changes they revert."""
+        for operation, user_ids in ((OP_ADDED, added), (OP_REMOVED, removed)):
+            for user_id in user_ids:
+                key = str(user_id)
+                entry = self.pending.get(key)
+                if entry is None:
+                    self.pending[key] = [operation, self.now]
+                elif entry[0] != operation:
+                    # Reverts a change nobody was told about yet
+                    del self.pending[key]
+                    self.flaps[key] = [self.flaps.get(key, (0, 0))[0] + 1, self.now]
+                    self.cancelled += 1
+
+    def due(self) -> Tuple[array, array]:
+        """Remove and return the pending changes that lasted long enough, as sorted (added, removed) IDs."""
+        added, removed = array('q'), array('q')
+        for key, (operation, first_seen) in list(self.pending.items()):
+            if self.now - first_seen >= self.hold_time(key):
+                del self.pending[key]
+                (added if operation == OP_ADDED else removed).append(int(key))
+        return array('q', sorted(added)), array('q', sorted(removed))
+
+    def next_due(self) -> float:
+        """When the earliest pending change becomes due, 0 if nothing is pending."""
+        return min((first_seen + self.hold_time(key) for key, (_, first_seen) in self.pending.items()), default=0)
+
+    def save(self, state: Dict) -> None:
+        """Write the pending changes and flap counts back into the target state."""
+        state["flap_pending"] = self.pending
+        state["flap_counts"] = self.flaps
+        state["flap_next_due"] = self.next_due()
@@ -0,0 +1,307 @@
+# pylint: disable=W1203 # Use lazy % formatting...
+# pylint: disable=C0301 # Line too long
+'''Append-only change journal with snapshot checkpoints for point-in-time queries.
+
+Every target has a journal file of fixed-size records and a checkpoint directory. A checkpoint
+is a copy of the target's snapshot together with the number of journal records it already
+contains, so a query only replays the records written after the nearest checkpoint.
+'''
+import os
+import sys
+import mmap
+import shutil
+import struct
+import logging
+import argparse
+import tempfile
+from array import array
+from bisect import bisect_right
+from datetime import datetime
+from typing import Container, Iterator, List, Optional, Sequence, Tuple
+
+from Snapshot import load_snapshot, SNAPSHOT_EXTENSION
+
+logger = logging.getLogger("RobloxTracker")
+
+JOURNAL_EXTENSION = ".journal"
+CHECKPOINT_DIRECTORY_EXTENSION = ".checkpoints"
+CHECKPOINT_INDEX_NAME = "index"
+CHECKPOINT_EVERY_RECORDS = 50_000  # Upper bound for the number of records a query has to replay
+
+# timestamp, target user ID, user ID, relationship type, operation
+JOURNAL_RECORD = struct.Struct("<qqqBB")
+# timestamp, number of journal records included in the checkpoint
+CHECKPOINT_RECORD = struct.Struct("<qq")
+
+RELATIONSHIP_CODES = {'friends': 0, 'followers': 1, 'followings': 2}
+RELATIONSHIP_NAMES = {code: name for name, code in RELATIONSHIP_CODES.items()}
+OP_REMOVED = 0
+OP_ADDED = 1
+
+class JournalError(Exception):
+    '''Raised when the journal cannot answer a query'''
+
+def journal_paths(base_path: str) -> Tuple[str, str]:
+    """Return the journal file and checkpoint directory belonging to a target's data path."""
+    return base_path + JOURNAL_EXTENSION, base_path + CHECKPOINT_DIRECTORY_EXTENSION
+
+def _fsync_append(path: str, data: bytes) -> None:
+    with open(path, 'ab') as file:
+        file.write(data)
+        file.flush()
+        os.fsync(file.fileno())
+
+def _record_count(journal_file: str) -> int:
+    if not os.path.isfile(journal_file):
+        return 0
+    # A torn final record from a crash mid-append is ignored
+    return os.path.getsize(journal_file) // JOURNAL_RECORD.size
+
+def read_checkpoints(checkpoint_directory: str) -> List[Tuple[int, int]]:
+    """Return all (timestamp, record_count) checkpoints, oldest first."""
+    index_path = os.path.join(checkpoint_directory, CHECKPOINT_INDEX_NAME)
+    if not os.path.isfile(index_path):
+        return []
+    with open(index_path, 'rb') as file:
+        data = file.read()
+    usable = len(data) - len(data) % CHECKPOINT_RECORD.size
+    return [CHECKPOINT_RECORD.unpack_from(data, offset) for offset in range(0, usable, CHECKPOINT_RECORD.size)]
+
+def _checkpoint_file(checkpoint_directory: str, record_count: int) -> str:
+    return os.path.join(checkpoint_directory, f"{record_count:012d}{SNAPSHOT_EXTENSION}")
+
+def write_checkpoint(checkpoint_directory: str, snapshot_file: str, timestamp: int, record_count: int) -> None:
+    """Store a copy of `snapshot_file` as the state after the first `record_count` journal records."""
+    os.makedirs(checkpoint_directory, exist_ok=True)
+    target_path = _checkpoint_file(checkpoint_directory, record_count)
+
+    fd, temp_path = tempfile.mkstemp(prefix=".checkpoint-", dir=checkpoint_directory)
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            if os.path.isfile(snapshot_file):
+                with open(snapshot_file, 'rb') as source:
+                    shutil.copyfileobj(source, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, target_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    _fsync_append(os.path.join(checkpoint_directory, CHECKPOINT_INDEX_NAME), CHECKPOINT_RECORD.pack(timestamp, record_count))
+
+def append_changes(base_path: str, snapshot_file: str, timestamp: int, target_user_id: int,
+                   relationship: str, added: Sequence[int], removed: Sequence[int]) -> int:
+    """Append one run's changes to the journal and return the new record count.
+
+    Must be called before `snapshot_file` is replaced with the new list: the very first call
+    checkpoints the previous snapshot so the journal has a starting point.
+    """
+    journal_file, checkpoint_directory = journal_paths(base_path)
+    record_count = _record_count(journal_file)
+    checkpoints = read_checkpoints(checkpoint_directory)
+
+    if not checkpoints:
+        write_checkpoint(checkpoint_directory, snapshot_file, timestamp, record_count)
+    else:
+        # Keep timestamps monotonic so the journal stays binary searchable if the clock jumps back
+        timestamp = max(timestamp, checkpoints[-1][0], _last_timestamp(journal_file, record_count))
+
+    if not added and not removed:
+        return record_count
+
+    code = RELATIONSHIP_CODES[relationship]
+    pack = JOURNAL_RECORD.pack
+    data = bytearray()
+    for user_id in added:
+        data += pack(timestamp, target_user_id, user_id, code, OP_ADDED)
+    for user_id in removed:
+        data += pack(timestamp, target_user_id, user_id, code, OP_REMOVED)
+
+    with open(journal_file, 'ab') as file:
+        file.truncate(record_count * JOURNAL_RECORD.size)  # Drop a torn record left by a crash
+        file.write(data)
+        file.flush()
+        os.fsync(file.fileno())
+    return record_count + len(added) + len(removed)
+
+def drop_unsaved_changes(base_path: str, saved_count: Optional[int], snapshot: Container[int]) -> int:
+    """Truncate records appended by a run whose snapshot was not written, returns how many were dropped.
+
+    `saved_count` is the record count stored with the last saved snapshot (None if unknown, then
+    the latest checkpoint is used). The next run diffs against the same old snapshot and would
+    append these changes a second time. Records that `snapshot` already reflects are kept, only
+    the state update was lost after them.
+    """
+    journal_file, checkpoint_directory = journal_paths(base_path)
+    record_count = _record_count(journal_file)
+    checkpoints = read_checkpoints(checkpoint_directory)
+    saved_count = max(saved_count or 0, checkpoints[-1][1] if checkpoints else 0)
+    if record_count <= saved_count:
+        return 0
+
+    with open(journal_file, 'rb') as file:
+        file.seek(saved_count * JOURNAL_RECORD.size)
+        data = file.read((record_count - saved_count) * JOURNAL_RECORD.size)
+    if all((user_id in snapshot) == (operation == OP_ADDED) for _, _, user_id, _, operation in JOURNAL_RECORD.iter_unpack(data)):
+        return 0
+
+    with open(journal_file, 'r+b') as file:
+        file.truncate(saved_count * JOURNAL_RECORD.size)
+        file.flush()
+        os.fsync(file.fileno())
+    return record_count - saved_count
+
+def maybe_checkpoint(base_path: str, snapshot_file: str, timestamp: int) -> bool:
+    """Checkpoint the freshly written snapshot once enough records piled up since the last one."""
+    journal_file, checkpoint_directory = journal_paths(base_path)
+    record_count = _record_count(journal_file)
+    checkpoints = read_checkpoints(checkpoint_directory)
+    last_timestamp, last_count = checkpoints[-1] if checkpoints else (timestamp, -CHECKPOINT_EVERY_RECORDS)
+
+    if record_count - last_count < CHECKPOINT_EVERY_RECORDS:
+        return False
+    write_checkpoint(checkpoint_directory, snapshot_file, max(timestamp, last_timestamp), record_count)
+    logger.info(f"Journal checkpoint written for {base_path} at record {record_count}")
+    return True
+
+def _last_timestamp(journal_file: str, record_count: int) -> int:
+    if record_count == 0:
+        return 0
+    with open(journal_file, 'rb') as file:
+        file.seek((record_count - 1) * JOURNAL_RECORD.size)
+        return JOURNAL_RECORD.unpack(file.read(JOURNAL_RECORD.size))[0]
+
+class _JournalView:
+    '''Memory-mapped journal supporting binary search by timestamp'''
+    def __init__(self, journal_file: str):
+        self.count = _record_count(journal_file)
+        self._file = None
+        self._mapping = None
+        if self.count:
+            self._file = open(journal_file, 'rb')
+            self._mapping = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._mapping is not None:
+            self._mapping.close()
+            self._file.close()
+
+    def record(self, index: int) -> Tuple[int, int, int, int, int]:
+        """Fields of record `index` in JOURNAL_RECORD order."""
+        return JOURNAL_RECORD.unpack_from(self._mapping, index * JOURNAL_RECORD.size)
+
+    def first_after(self, timestamp: int, low: int = 0) -> int:
+        """Index of the first record with a timestamp greater than `timestamp`."""
+        high = self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self.record(middle)[0] <= timestamp:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+def members_at(base_path: str, timestamp: int) -> array:
+    """Rebuild the sorted list of IDs as it stood at `timestamp` (unix seconds)."""
+    journal_file, checkpoint_directory = journal_paths(base_path)
+    checkpoints = read_checkpoints(checkpoint_directory)
+    position = bisect_right([checkpoint[0] for checkpoint in checkpoints], timestamp)
+    if position == 0:
+        if not checkpoints:
+            raise JournalError(f"No history recorded for {base_path}")
+        raise JournalError(f"History for {base_path} starts at {format_timestamp(checkpoints[0][0])}")
+
+    _, start = checkpoints[position - 1]
+    with load_snapshot(_checkpoint_file(checkpoint_directory, start)) as checkpoint:
+        members = set(checkpoint.ids)
+
+    with _JournalView(journal_file) as journal:
+        end = journal.first_after(timestamp, min(start, journal.count))
+        for index in range(start, end):
+            _, _, user_id, _, op = journal.record(index)
+            if op == OP_ADDED:
+                members.add(user_id)
+            else:
+                members.discard(user_id)
+    return array('q', sorted(members))
+
+def changes_between(base_path: str, start: int, end: int) -> Iterator[Tuple[int, int, str, int, bool]]:
+    """Yield (timestamp, target_user_id, relationship, user_id, added) for start < timestamp <= end."""
+    journal_file, _ = journal_paths(base_path)
+    with _JournalView(journal_file) as journal:
+        first = journal.first_after(start)
+        for index in range(first, journal.count):
+            timestamp, target_user_id, user_id, code, op = journal.record(index)
+            if timestamp > end:
+                break
+            yield timestamp, target_user_id, RELATIONSHIP_NAMES.get(code, "unknown"), user_id, op == OP_ADDED
+
+def changes_page(base_path: str, limit: int, cursor: Optional[int] = None,
+                 since: Optional[int] = None) -> Tuple[List[Tuple[int, int, str, int, bool]], int]:
+    """At most `limit` changes in the order they were recorded, and the cursor of the next page.
+
+    The page starts at record `cursor` (returned by an earlier page), else at the first change after
+    `since`, else it holds the latest `limit` changes. Polling with the returned cursor yields only new changes.
+    """
+    journal_file, _ = journal_paths(base_path)
+    with _JournalView(journal_file) as journal:
+        if cursor is not None:
+            first = min(max(0, cursor), journal.count)
+        elif since is not None:
+            first = journal.first_after(since)
+        else:
+            first = max(0, journal.count - limit)
+        last = min(journal.count, first + limit)
+
+        changes = []
+        for index in range(first, last):
+            timestamp, target_user_id, user_id, code, op = journal.record(index)
+            changes.append((timestamp, target_user_id, RELATIONSHIP_NAMES.get(code, "unknown"), user_id, op == OP_ADDED))
+    return changes, last
+
+# --- Query entry point ---
+def format_timestamp(timestamp: int) -> str:
+    """Format unix seconds the same way as the rest of the script."""
+    return datetime.fromtimestamp(timestamp).strftime('%d.%m.%Y %H:%M:%S')
+
+def parse_timestamp(value: str) -> int:
+    """Accept unix seconds or an ISO 8601 date/time (local time)."""
+    if value.isdigit():
+        return int(value)
+    return int(datetime.fromisoformat(value).timestamp())
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Command line access to the journal of one target."""
+    parser = argparse.ArgumentParser(description="Query the change history of a tracked list.")
+    parser.add_argument("data_path", help="Target data path without extension, e.g. LocalData or TrackerData/1_followers")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    members_parser = subparsers.add_parser("members", help="List the IDs present at a point in time")
+    members_parser.add_argument("--at", type=parse_timestamp, default=None, help="Unix seconds or ISO date/time (default: now)")
+
+    changes_parser = subparsers.add_parser("changes", help="List adds and removes within a time window")
+    changes_parser.add_argument("--since", type=parse_timestamp, default=0, help="Unix seconds or ISO date/time")
+    changes_parser.add_argument("--until", type=parse_timestamp, default=None, help="Unix seconds or ISO date/time (default: now)")
+
+    args = parser.parse_args(argv)
+    now = int(datetime.now().timestamp())
+
+    try:
+        if args.command == "members":
+            for user_id in members_at(args.data_path, args.at if args.at is not None else now):
+                print(user_id)
+        else:
+            until = args.until if args.until is not None else now
+            for timestamp, _, relationship, user_id, added in changes_between(args.data_path, args.since, until):
+                print(f"{format_timestamp(timestamp)}  {'+' if added else '-'}  {relationship:<10}  {user_id}")
+    except JournalError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        raise SystemExit(1) from e
+
+if __name__ == "__main__":
+    main()
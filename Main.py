@@ -1,550 +1,1995 @@
-# pylint: disable=W1203 # Use lazy % formatting...
-# pylint: disable=C0114 # Missing module docstring
-# pylint: disable=C0301 # Line too long
-# pylint: disable=W0718 # Catching too general exception
-
-import os
-import sys
-import time
-import json
-import logging
-import asyncio
-from datetime import datetime
-from typing import List, Dict, Optional
-import aiohttp
-from sendembed import send_embed_group
-
-APP_VERSION = "2.1.0"  # Updated version
-LOG_LEVEL = "INFO" # INFO, DEBUG, WARNING, ERROR, CRITICAL
-ENABLE_LOG_COLORS = True  # Set to False if your terminal does not support ANSI colors
-
-CONFIG_FILE_NAME = "config.json"
-
-class ColoredFormatter(logging.Formatter):
-    '''Custom formatter to add colors to log messages based on their level.'''
-    GRAY = "\033[90m"
-    WHITE = "\033[97m"
-    RESET = "\033[0m"
-    LEVEL_COLORS = {
-        'DEBUG': "\033[94m",     # Blue
-        'INFO': "\033[96m",      # Light cyan
-        'WARNING': "\033[93m",   # Yellow
-        'ERROR': "\033[91m",     # Red
-        'CRITICAL': "\033[95m",  # Magenta
-    }
-    def format(self, record):
-        if ENABLE_LOG_COLORS:
-            level_color = self.LEVEL_COLORS.get(record.levelname, self.WHITE)
-            time_str = f"{self.GRAY}{self.formatTime(record)}{self.RESET}"
-            level_str = f"{level_color}[{record.levelname}]{self.RESET}"
-            msg_str = f"{self.WHITE}{record.getMessage()}{self.RESET}"
-            return f"{time_str} {level_str} {msg_str}"
-        else:
-            time_str = self.formatTime(record)
-            level_str = f"[{record.levelname}]"
-            msg_str = record.getMessage()
-            return f"{time_str} {level_str} {msg_str}"
-
-class RateLimiter:
-    '''Simple rate limiter with exponential backoff'''
-    def __init__(self, base_delay: float = 1.2, max_delay: float = 60.0):
-        self.base_delay = base_delay
-        self.max_delay = max_delay
-        self.current_delay = base_delay
-        self.last_request_time = 0
-
-    async def wait(self):
-        '''Wait for rate limit'''
-        now = time.time()
-        time_since_last = now - self.last_request_time
-        if time_since_last < self.current_delay:
-            await asyncio.sleep(self.current_delay - time_since_last)
-        self.last_request_time = time.time()
-
-    def reset_delay(self):
-        '''Reset delay to base value on successful request'''
-        self.current_delay = self.base_delay
-
-    def increase_delay(self):
-        '''Increase delay on failed request'''
-        self.current_delay = min(self.current_delay * 2, self.max_delay)
-
-# --- Logging Setup ---
-handler = logging.StreamHandler(sys.stdout)
-handler.setFormatter(ColoredFormatter())
-
-logger = logging.getLogger("RobloxTracker")
-logger.setLevel(LOG_LEVEL)
-logger.handlers.clear()
-logger.addHandler(handler)
-logger.propagate = False
-
-# --- Constants ---
-SHOW_LOADED_SETTINGS = False
-FRIENDS_LIMIT = 50
-FOLLOWERS_FOLLOWINGS_LIMIT = 100
-AVATAR_SIZE = "720x720"
-AVATAR_HEADSHOT_SIZE = "100x100"
-AVATAR_BATCH_LIMIT = 100
-USERNAME_BATCH_LIMIT = 100
-PROGRESS_INFO_EVERY = 5
-SHOW_PROGRESS_INFO = True
-MAX_CONCURRENT_REQUESTS = 10  # Limit concurrent requests
-REQUEST_TIMEOUT = 30  # Increased timeout for better reliability
-
-# --- Settings ---
-def load_settings() -> Dict:
-    """Load settings from the config.json file with validation."""
-    try:
-        script_directory = os.path.dirname(__file__)
-        config_path = os.path.join(script_directory, CONFIG_FILE_NAME)
-
-        with open(config_path, 'r', encoding='utf-8') as file:
-            config = json.load(file)
-
-        # Validate required fields
-        required_fields = ["discord_webhook_url", "guilded_webhook_url", "relationshipType", "Your_User_ID"]
-        for field in required_fields:
-            if field not in config:
-                raise ValueError(f"Missing required field: {field}")
-
-        # Validate user ID
-        try:
-            user_id = int(config["Your_User_ID"])
-            if user_id <= 0:
-                raise ValueError("User ID must be a positive integer")
-        except (ValueError, TypeError) as exc:
-            raise ValueError("Invalid user ID format") from exc
-
-        settings = {
-            "discord_webhook_url": config["discord_webhook_url"],
-            "guilded_webhook_url": config["guilded_webhook_url"],
-            "relationship_type_endpoint": config["relationshipType"],
-            "target_user_id": str(user_id),
-            "send_discord_log": config.get("send_discord_log", False),
-            "send_guilded_log": config.get("send_guilded_log", False),
-            "send_new_entries": config.get("send_new_entries", True),
-            "send_removed_entries": config.get("send_removed_entries", True),
-            "embed_wait_HTTP": max(0.1, config.get("embed_wait_HTTP", 1.0)),
-            "local_data_file": os.path.join(script_directory, "LocalData"),
-            "last_run_time_file": os.path.join(script_directory, "LastRunTime.txt"),
-            "config_file": config_path
-        }
-
-        return settings
-
-    except FileNotFoundError as exc:
-        logger.error("Config file not found. Please create config.json")
-        raise SystemExit("Configuration file missing") from exc
-    except json.JSONDecodeError as e:
-        logger.error(f"Invalid JSON in config file: {e}")
-        raise SystemExit("Invalid configuration file format") from e
-    except Exception as e:
-        logger.error(f"Configuration error: {e}")
-        raise SystemExit("Failed to load configuration") from e
-
-# --- Helper functions ---
-def validate_settings(settings: Dict) -> None:
-    """Validate and fix settings."""
-    # Check webhook URLs
-    if not settings["discord_webhook_url"].startswith("https://discord.com/api/webhooks/"):
-        logger.warning("Invalid Discord webhook URL. Discord webhooks disabled.")
-        settings["send_discord_log"] = False
-
-    if not settings["guilded_webhook_url"].startswith("https://media.guilded.gg/webhooks/"):
-        logger.warning("Invalid Guilded webhook URL. Guilded webhooks disabled.")
-        settings["send_guilded_log"] = False
-
-    # Check relationship type
-    valid_endpoints = ['friends', 'followers', 'followings']
-    if settings["relationship_type_endpoint"] not in valid_endpoints:
-        logger.error(f"Invalid relationship type: {settings['relationship_type_endpoint']}")
-        raise SystemExit(f"Valid options: {valid_endpoints}")
-
-def ensure_files_exist(files: List[str]) -> None:
-    """Ensure required files exist, create empty ones if needed."""
-    for file_path in files:
-        if not os.path.isfile(file_path):
-            logger.info(f"Creating missing file: {file_path}")
-            try:
-                with open(file_path, 'w', encoding='utf-8') as f:
-                    if file_path.endswith('.txt'):
-                        f.write(f"Created: {datetime.now().strftime('%d.%m.%Y %H:%M:%S')}\n")
-            except Exception as e:
-                logger.error(f"Failed to create file {file_path}: {e}")
-                raise SystemExit(f"Cannot create required file: {file_path}") from e
-
-def read_from_file(filename: str) -> List[str]:
-    """Read lines from a file safely."""
-    try:
-        if os.path.isfile(filename):
-            with open(filename, 'r', encoding='utf-8') as file:
-                return [line.strip() for line in file if line.strip()]
-        return []
-    except Exception as e:
-        logger.error(f"Error reading file {filename}: {e}")
-        return []
-
-def write_to_file(filename: str, data: List[str]) -> bool:
-    """Write data to file safely."""
-    try:
-        with open(filename, 'w', encoding='utf-8') as file:
-            for item in data:
-                file.write(f"{item}\n")
-        return True
-    except Exception as e:
-        logger.error(f"Error writing to file {filename}: {e}")
-        return False
-
-def write_last_run_time(file_path: str) -> None:
-    """Write the last execution time to a file."""
-    try:
-        with open(file_path, 'w', encoding='utf-8') as file:
-            file.write(f"Last execution: {datetime.now().strftime('%d.%m.%Y %H:%M:%S')}\n")
-    except Exception as e:
-        logger.error(f"Failed to write last run time: {e}")
-
-def chunk_data(data: List, chunk_size: int = 10) -> List[List]:
-    """Split data into chunks."""
-    return [data[i:i + chunk_size] for i in range(0, len(data), chunk_size)]
-
-# --- Async API Functions ---
-async def make_request_with_retry(session: aiohttp.ClientSession, url: str,
-                                  rate_limiter: RateLimiter, max_retries: int = 3) -> Optional[Dict]:
-    """Make HTTP request with retry logic and rate limiting."""
-    for attempt in range(max_retries):
-        try:
-            await rate_limiter.wait()
-
-            async with session.get(url, timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)) as response:
-                if response.status == 200:
-                    rate_limiter.reset_delay()
-                    return await response.json()
-                elif response.status == 429:  # Rate limited
-                    logger.warning(f"Rate limited, attempt {attempt + 1}/{max_retries}")
-                    rate_limiter.increase_delay()
-                    continue
-                else:
-                    logger.warning(f"HTTP {response.status} for {url}, attempt {attempt + 1}/{max_retries}")
-
-        except asyncio.TimeoutError:
-            logger.warning(f"Timeout for {url}, attempt {attempt + 1}/{max_retries}")
-        except Exception as e:
-            logger.error(f"Request error for {url}: {e}, attempt {attempt + 1}/{max_retries}")
-
-        if attempt < max_retries - 1:
-            await asyncio.sleep(2 ** attempt)  # Exponential backoff
-
-    logger.error(f"Failed to fetch data from {url} after {max_retries} attempts")
-    return None
-
-async def fetch_friends_ids(session: aiohttp.ClientSession, user_id: str) -> List[str]:
-    """Fetch all friend IDs for a user."""
-    logger.info("Fetching friends for user ID")
-    all_friend_ids = []
-    cursor = ""
-    rate_limiter = RateLimiter()
-    fetch_count = 0
-
-    while True:
-        url = f"https://friends.roblox.com/v1/users/{user_id}/friends/find?limit={FRIENDS_LIMIT}&cursor={cursor}&userSort="
-
-        data = await make_request_with_retry(session, url, rate_limiter)
-        if not data:
-            logger.error("Failed to fetch friends data")
-            raise SystemExit(f"Cannot fetch friends for user {user_id}")
-
-        page_items = data.get("PageItems", [])
-        all_friend_ids.extend([str(friend["id"]) for friend in page_items])
-        fetch_count += 1
-
-        if SHOW_PROGRESS_INFO and PROGRESS_INFO_EVERY > 0 and fetch_count % PROGRESS_INFO_EVERY == 0:
-            logger.info(f"Fetched {len(all_friend_ids)} friend IDs so far...")
-
-        next_cursor = data.get("NextCursor")
-        if not next_cursor:
-            break
-        cursor = next_cursor
-
-    logger.info(f"Fetched total {len(all_friend_ids)} friend IDs.")
-    return all_friend_ids
-
-async def fetch_followers_or_followings_ids(session: aiohttp.ClientSession,
-                                           user_id: str, endpoint: str) -> List[str]:
-    """Fetch all follower/following IDs for a user."""
-    logger.info(f"Fetching {endpoint} for user ID")
-    all_ids = []
-    cursor = None
-    rate_limiter = RateLimiter()
-    fetch_count = 0
-
-    while True:
-        url = f"https://friends.roblox.com/v1/users/{user_id}/{endpoint}?limit={FOLLOWERS_FOLLOWINGS_LIMIT}&sortOrder=Asc"
-        if cursor:
-            url += f"&cursor={cursor}"
-
-        data = await make_request_with_retry(session, url, rate_limiter)
-        if not data:
-            logger.error(f"Failed to fetch {endpoint} data")
-            raise SystemExit(f"Cannot fetch {endpoint} for user {user_id}")
-
-        ids = [str(user["id"]) for user in data.get("data", [])]
-        all_ids.extend(ids)
-        fetch_count += 1
-
-        if SHOW_PROGRESS_INFO and PROGRESS_INFO_EVERY > 0 and fetch_count % PROGRESS_INFO_EVERY == 0:
-            logger.info(f"Fetched {len(all_ids)} {endpoint} IDs so far...")
-
-        cursor = data.get("nextPageCursor")
-        if not cursor:
-            break
-
-    logger.info(f"Fetched total {len(all_ids)} {endpoint} IDs.")
-    return all_ids
-
-async def fetch_all_user_ids(session: aiohttp.ClientSession, settings: Dict) -> List[str]:
-    """Fetch all user IDs based on relationship type."""
-    endpoint = settings["relationship_type_endpoint"]
-    user_id = settings["target_user_id"]
-
-    if endpoint == "friends":
-        return await fetch_friends_ids(session, user_id)
-    else:
-        return await fetch_followers_or_followings_ids(session, user_id, endpoint)
-
-async def fetch_usernames_batch(session: aiohttp.ClientSession, user_ids: List[str]) -> Dict[str, str]:
-    """Fetch usernames for user IDs in batches."""
-    url = 'https://apis.roblox.com/user-profile-api/v1/user/profiles/get-profiles'
-    headers = {
-        'accept': 'application/json',
-        'Content-Type': 'application/json'
-    }
-
-    usernames = {}
-    rate_limiter = RateLimiter()
-    chunks = chunk_data(user_ids, USERNAME_BATCH_LIMIT)
-
-    for i, chunk in enumerate(chunks):
-        data = {
-            "fields": ["names.username"],
-            "userIds": chunk
-        }
-
-        try:
-            await rate_limiter.wait()
-
-            async with session.post(url, headers=headers, json=data,
-                                  timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)) as response:
-                if response.status == 200:
-                    response_data = await response.json()
-                    for user_data in response_data.get('profileDetails', []):
-                        user_id = str(user_data.get('userId'))
-                        username = user_data.get('names', {}).get('username', None)
-                        if user_id and username:
-                            usernames[user_id] = username
-                        else:
-                            logger.warning(f"User ID {user_id} has unknown username")
-                    rate_limiter.reset_delay()
-                else:
-                    logger.error(f"Username API error: {response.status}")
-                    rate_limiter.increase_delay()
-
-        except Exception as e:
-            logger.error(f"Error fetching usernames for chunk {i}: {e}")
-
-        if SHOW_PROGRESS_INFO and PROGRESS_INFO_EVERY > 0 and (i + 1) % PROGRESS_INFO_EVERY == 0:
-            logger.info(f"Fetched usernames for {len(usernames)}/{len(user_ids)} user IDs so far...")
-
-    logger.info(f"Fetched usernames for {len(usernames)}/{len(user_ids)} user IDs.")
-    return usernames
-
-async def fetch_avatars_batch(session: aiohttp.ClientSession, user_ids: List[str]) -> Dict[str, Dict[str, str]]:
-    """Fetch avatar and headshot URLs for user IDs."""
-    logger.info("Fetching avatars and headshots")
-    results = {}
-    rate_limiter = RateLimiter()
-    chunks = chunk_data(user_ids, AVATAR_BATCH_LIMIT)
-
-    for i, chunk in enumerate(chunks):
-        ids_str = ",".join(chunk)
-        avatar_url = f"https://thumbnails.roblox.com/v1/users/avatar?userIds={ids_str}&size={AVATAR_SIZE}&format=Png&isCircular=false"
-        headshot_url = f"https://thumbnails.roblox.com/v1/users/avatar-headshot?userIds={ids_str}&size={AVATAR_HEADSHOT_SIZE}&format=Png&isCircular=false"
-
-        # Fetch both avatar and headshot concurrently
-        tasks = [
-            make_request_with_retry(session, avatar_url, rate_limiter),
-            make_request_with_retry(session, headshot_url, rate_limiter)
-        ]
-
-        avatar_data, headshot_data = await asyncio.gather(*tasks)
-
-        if avatar_data:
-            for entry in avatar_data.get("data", []):
-                user_id = str(entry.get("targetId"))
-                results.setdefault(user_id, {})["avatar_url"] = entry.get("imageUrl")
-
-        if headshot_data:
-            for entry in headshot_data.get("data", []):
-                user_id = str(entry.get("targetId"))
-                results.setdefault(user_id, {})["headshot_url"] = entry.get("imageUrl")
-
-        if SHOW_PROGRESS_INFO and PROGRESS_INFO_EVERY > 0 and (i + 1) % PROGRESS_INFO_EVERY == 0:
-            logger.info(f"Fetched avatars/headshots for {len(results)}/{len(user_ids)} user IDs so far...")
-
-    logger.info(f"Fetched avatars and headshots for {len(results)}/{len(user_ids)} user IDs.")
-    return results
-
-# --- Webhook Processing ---
-def process_webhooks(settings: Dict, user_data_chunks: List[List[Dict]], webhook_type: str) -> None:
-    """Process webhook sending with better error handling."""
-    if not user_data_chunks:
-        return
-
-    webhook_count = 0
-    total_webhooks = len(user_data_chunks) * (
-        int(settings["send_discord_log"]) + int(settings["send_guilded_log"])
-    )
-
-    for chunk in user_data_chunks:
-        for platform, enabled in [("discord", settings["send_discord_log"]),
-                                 ("guilded", settings["send_guilded_log"])]:
-            if enabled:
-                try:
-                    send_embed_group(
-                        platform,
-                        settings[f"{platform}_webhook_url"],
-                        settings["relationship_type_endpoint"],
-                        chunk,
-                        APP_VERSION
-                    )
-                    webhook_count += 1
-
-                    if webhook_count % 5 == 0 or webhook_count == total_webhooks:
-                        logger.info(f"Sent {webhook_count}/{total_webhooks} {webhook_type} webhooks")
-
-                except Exception as e:
-                    logger.error(f"Failed to send {platform} webhook: {e}")
-
-        if settings["embed_wait_HTTP"] > 0:
-            time.sleep(settings["embed_wait_HTTP"])
-
-def prepare_embed_data(user_ids: List[str], usernames: Dict[str, str],
-                      avatars: Dict[str, Dict], is_removed: bool, total_count: int) -> List[Dict]:
-    """Prepare embed data for webhooks."""
-    embed_data_list = []
-    for user_id in user_ids:
-        embed_data = {
-            "username": usernames.get(user_id, "Unknown"),
-            "user_id": user_id,
-            "avatar_url": avatars.get(user_id, {}).get("avatar_url"),
-            "headshot_url": avatars.get(user_id, {}).get("headshot_url"),
-            "removed": is_removed,
-            "total_count": total_count
-        }
-        embed_data_list.append(embed_data)
-    return embed_data_list
-
-# --- Main Logic ---
-async def run_tracker() -> None:
-    """Main async function to run the tracker."""
-    settings = load_settings()
-    validate_settings(settings)
-
-    # Ensure required files exist
-    ensure_files_exist([
-        settings["last_run_time_file"],
-        settings["local_data_file"]
-    ])
-
-    if SHOW_LOADED_SETTINGS:
-        logger.info("=== Configuration ===")
-        logger.info(f"Discord: {'✓' if settings['send_discord_log'] else '✗'} | "
-                   f"Guilded: {'✓' if settings['send_guilded_log'] else '✗'}")
-        logger.info(f"Tracking: {settings['relationship_type_endpoint']}")
-        logger.info(f"New entries: {'✓' if settings['send_new_entries'] else '✗'} | "
-                   f"Removed entries: {'✓' if settings['send_removed_entries'] else '✗'}")
-
-    # Create session with connection limits
-    connector = aiohttp.TCPConnector(limit=MAX_CONCURRENT_REQUESTS, limit_per_host=5)
-
-    async with aiohttp.ClientSession(connector=connector) as session:
-        # Fetch current user data
-        logger.info("Starting data collection...")
-        current_user_ids = await fetch_all_user_ids(session, settings)
-        logger.info(f"Found {len(current_user_ids)} current users")
-
-        # Load previous data
-        previous_user_ids = set(read_from_file(settings["local_data_file"]))
-        current_user_set = set(current_user_ids)
-
-        # Calculate changes
-        new_user_ids = [uid for uid in current_user_ids if uid not in previous_user_ids]
-        removed_user_ids = [uid for uid in previous_user_ids if uid not in current_user_set]
-
-        logger.info(f"Changes detected - New: {len(new_user_ids)}, Removed: {len(removed_user_ids)}")
-
-        # Only fetch additional data if we need to send webhooks
-        need_webhooks = (
-            (settings["send_new_entries"] and new_user_ids) or
-            (settings["send_removed_entries"] and removed_user_ids)
-        ) and (settings["send_discord_log"] or settings["send_guilded_log"])
-
-        if need_webhooks:
-            # Fetch usernames and avatars for changed users
-            ids_to_fetch = list(set(new_user_ids + removed_user_ids))
-            logger.info(f"Fetching additional data for {len(ids_to_fetch)} users...")
-
-            usernames, avatars = await asyncio.gather(
-                fetch_usernames_batch(session, ids_to_fetch),
-                fetch_avatars_batch(session, ids_to_fetch)
-            )
-
-            # Process new entries
-            if settings["send_new_entries"] and new_user_ids:
-                logger.info(f"Processing {len(new_user_ids)} new entries...")
-                new_chunks = chunk_data(new_user_ids, 10)
-                new_embed_chunks = [
-                    prepare_embed_data(chunk, usernames, avatars, False, len(current_user_ids))
-                    for chunk in new_chunks
-                ]
-                process_webhooks(settings, new_embed_chunks, "new")
-
-            # Process removed entries
-            if settings["send_removed_entries"] and removed_user_ids:
-                logger.info(f"Processing {len(removed_user_ids)} removed entries...")
-                removed_chunks = chunk_data(removed_user_ids, 10)
-                removed_embed_chunks = [
-                    prepare_embed_data(chunk, usernames, avatars, True, len(current_user_ids))
-                    for chunk in removed_chunks
-                ]
-                process_webhooks(settings, removed_embed_chunks, "removed")
-
-        else:
-            logger.info("No webhooks needed or webhooks disabled")
-
-        # Update local data file
-        if previous_user_ids != current_user_set:
-            logger.info("Updating local data file...")
-            if write_to_file(settings["local_data_file"], current_user_ids):
-                logger.info("Local data updated successfully")
-            else:
-                logger.error("Failed to update local data file")
-        else:
-            logger.info("No changes detected, skipping data file update")
-
-        # Update last run time
-        write_last_run_time(settings["last_run_time_file"])
-        logger.info("Tracker run completed successfully")
-
-def main():
-    """Main synchronous entry point."""
-    try:
-        asyncio.run(run_tracker())
-    except KeyboardInterrupt:
-        logger.info("Script interrupted by user")
-    except Exception as e:
-        logger.error(f"Unexpected error: {e}")
-        raise SystemExit("Script failed due to unexpected error") from e
-
-if __name__ == "__main__":
-    main()
+# pylint: disable=W1203 # Use lazy % formatting...
+# pylint: disable=C0114 # Missing module docstring
+# pylint: disable=C0301 # Line too long
+# pylint: disable=W0718 # Catching too general exception
+
+import os
+import sys
+import time
+import random
+import signal
+import argparse
+import json
+import logging
+import asyncio
+import sqlite3
+import functools
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import urlsplit
+from array import array
+from typing import Any, AsyncIterator, Awaitable, Callable, List, Dict, Optional, Sequence, Set, Tuple, Union
+import aiohttp
+from SendEmbed import WebhookDispatcher, build_messages, build_analytics_messages, build_terminated_messages, SEND_DELIVERED, SEND_FAILED, SEND_REJECTED, ANALYTICS_MAX_LISTED_USERS
+from Snapshot import Snapshot, SnapshotError, SnapshotCache, load_snapshot, write_snapshot, diff_sorted, merge_sorted, sorted_unique, read_snapshot_ids, migrate_text_snapshot, SNAPSHOT_EXTENSION
+from Journal import append_changes, drop_unsaved_changes, maybe_checkpoint
+from MetadataCache import MetadataCache
+from PageDecoder import decode_friends_page, decode_follows_page, IdPage, JSON_BACKEND
+from Pagination import PaginationCheckpoint, CURSOR_FILE_EXTENSION
+from Metrics import METRICS
+from Analytics import RelationshipIndex, load_previous_sets, save_sets, compute_deltas, build_export, write_export
+from Outbox import Outbox
+from Debounce import FlapFilter
+from QueryServer import QueryServer, DEFAULT_QUERY_SERVER_HOST
+from Sinks import SinkRegistry, Sink, normalize_sink_spec, sink_key, sink_problem, SINK_FAILURE_COOLDOWN
+from Coordinator import LeaseStore, Lease, LeaseLost, default_worker_id, DEFAULT_LEASE_SECONDS
+
+APP_VERSION = "2.1.0"  # Updated version
+LOG_LEVEL = "INFO" # INFO, DEBUG, WARNING, ERROR, CRITICAL
+ENABLE_LOG_COLORS = True  # Set to False if your terminal does not support ANSI colors
+
+CONFIG_FILE_NAME = "config.json"
+
+class ColoredFormatter(logging.Formatter):
+    '''Custom formatter to add colors to log messages based on their level.'''
+    GRAY = "\033[90m"
+    WHITE = "\033[97m"
+    RESET = "\033[0m"
+    LEVEL_COLORS = {
+        'DEBUG': "\033[94m",     # Blue
+        'INFO': "\033[96m",      # Light cyan
+        'WARNING': "\033[93m",   # Yellow
+        'ERROR': "\033[91m",     # Red
+        'CRITICAL': "\033[95m",  # Magenta
+    }
+    def format(self, record):
+        if ENABLE_LOG_COLORS:
+            level_color = self.LEVEL_COLORS.get(record.levelname, self.WHITE)
+            time_str = f"{self.GRAY}{self.formatTime(record)}{self.RESET}"
+            level_str = f"{level_color}[{record.levelname}]{self.RESET}"
+            msg_str = f"{self.WHITE}{record.getMessage()}{self.RESET}"
+            return f"{time_str} {level_str} {msg_str}"
+        else:
+            time_str = self.formatTime(record)
+            level_str = f"[{record.levelname}]"
+            msg_str = record.getMessage()
+            return f"{time_str} {level_str} {msg_str}"
+
+class TokenBucket:
+    '''Token bucket shared by every request to one API host.
+
+    The refill rate drops by half on every 429 and creeps back up to the configured rate on
+    successful requests, so concurrent fetchers settle at the allowed ceiling together.
+    '''
+    def __init__(self, rate: float, burst: int, min_rate: float = 0.05):
+        self.configured_rate = rate
+        self.rate = rate
+        self.min_rate = min(min_rate, rate)
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = None
+        self._lock_loop = None
+        # Counters
+        self.requests = 0
+        self.waits = 0
+        self.wait_time = 0.0
+        self.throttles = 0
+
+    def _get_lock(self) -> asyncio.Lock:
+        # A lock belongs to one event loop, recreate it if the bucket outlives an asyncio.run()
+        loop = asyncio.get_running_loop()
+        if self._lock is None or self._lock_loop is not loop:
+            self._lock = asyncio.Lock()
+            self._lock_loop = loop
+        return self._lock
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self) -> None:
+        '''Wait until a request may be sent, callers are served in FIFO order'''
+        started = time.monotonic()
+        async with self._get_lock():
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                if self.blocked_until > now:
+                    delay = self.blocked_until - now
+                elif self.tokens >= 1:
+                    self.tokens -= 1
+                    break
+                else:
+                    delay = (1 - self.tokens) / self.rate
+                await asyncio.sleep(delay)
+
+            waited = time.monotonic() - started
+            self.requests += 1
+            if waited > 0.001:
+                self.waits += 1
+                self.wait_time += waited
+
+    def on_success(self) -> None:
+        '''Recover towards the configured rate after a successful request'''
+        if self.rate < self.configured_rate:
+            self.rate = min(self.configured_rate, self.rate + self.configured_rate * 0.05)
+
+    def on_throttle(self, retry_after: Optional[float] = None) -> None:
+        '''Slow down after a 429, honoring Retry-After when the API sends it'''
+        now = time.monotonic()
+        self.throttles += 1
+        self.rate = max(self.min_rate, self.rate / 2)
+        self.tokens = 0.0
+        self.updated = now
+        pause = retry_after if retry_after is not None else 1 / self.rate
+        self.blocked_until = max(self.blocked_until, now + pause)
+
+    def stats(self) -> Dict:
+        '''Counters for logging and reports'''
+        return {
+            "requests": self.requests,
+            "waits": self.waits,
+            "wait_time": round(self.wait_time, 3),
+            "throttles": self.throttles,
+            "current_rate": round(self.rate, 3),
+        }
+
+# --- Logging Setup ---
+handler = logging.StreamHandler(sys.stdout)
+handler.setFormatter(ColoredFormatter())
+
+logger = logging.getLogger("RobloxTracker")
+logger.setLevel(LOG_LEVEL)
+logger.handlers.clear()
+logger.addHandler(handler)
+logger.propagate = False
+
+# --- Constants ---
+SHOW_LOADED_SETTINGS = False
+FRIENDS_LIMIT = 50
+FOLLOWERS_FOLLOWINGS_LIMIT = 100
+AVATAR_SIZE = "720x720"
+AVATAR_HEADSHOT_SIZE = "100x100"
+THUMBNAIL_BATCH_LIMIT = 100  # Requests per call to the thumbnails batch API, avatar + headshot means 50 users
+THUMBNAIL_PENDING_RETRY_DELAYS = (0.5, 1.0, 2.0)  # Seconds before each re-poll of thumbnails that are still being rendered
+USERNAME_BATCH_LIMIT = 100
+USERS_BATCH_LIMIT = 100  # User IDs per call to the users API that tells banned/terminated accounts apart
+PROGRESS_INFO_EVERY = 5
+SHOW_PROGRESS_INFO = True
+MAX_CONCURRENT_REQUESTS = 10  # Limit concurrent requests
+REQUEST_TIMEOUT = 30  # Increased timeout for better reliability
+ENRICHMENT_CONCURRENCY = 4  # Username/thumbnail chunks fetched at the same time
+ENRICHMENT_RETRY_PASSES = 1  # Extra passes over chunks that failed
+DEFAULT_WATCH_MIN_INTERVAL = 60  # Seconds between polls of a target that keeps changing
+DEFAULT_WATCH_MAX_INTERVAL = 3600  # Upper bound for quiet targets
+DEFAULT_WATCH_JITTER = 0.1  # +/- fraction applied to every interval
+WATCH_SPEEDUP_FACTOR = 0.5  # Interval multiplier after a pass that found changes
+WATCH_BACKOFF_FACTOR = 1.5  # Interval multiplier after a pass without changes
+DEFAULT_FULL_SWEEP_EVERY = 24  # Incremental runs between two full crawls of followers/followings
+STATE_FILE_EXTENSION = ".state.json"
+DEFAULT_RESUME_MAX_AGE_MINUTES = 360  # How old a pagination checkpoint may be and still be resumed
+METADATA_CACHE_FILE_NAME = "MetadataCache.sqlite3"
+DEFAULT_USERNAME_TTL_HOURS = 24 * 7
+DEFAULT_THUMBNAIL_TTL_HOURS = 24
+DEFAULT_METADATA_CACHE_MAX_ENTRIES = 200_000
+DEFAULT_METADATA_PREFETCH_PER_RUN = 200  # Members without cached metadata looked up per target and run
+METADATA_PREFETCH_SCAN_WINDOW = 5_000  # Members checked against the cache per target and run
+RUN_REPORT_FILE_NAME = "RunReport.json"
+OUTBOX_FILE_NAME = "WebhookOutbox.sqlite3"
+DEFAULT_OUTBOX_MAX_ATTEMPTS = 10  # Failed sends (each with its own short retries) before a message becomes a dead letter
+DEFAULT_DIGEST_THRESHOLD = 50  # Batches with more changes are sent as compact digest embeds, 0 disables digests
+DEFAULT_QUERY_SERVER_PORT = 8787
+DEFAULT_FLAP_MAX_HOLD_HOURS = 24  # Longest time a user who keeps following/unfollowing is held back
+COORDINATOR_FILE_NAME = "Coordinator.sqlite3"
+WORKER_POLL_INTERVAL = 5  # Longest wait of an idle worker before it looks for due units again
+
+# --- API Hosts ---
+# Base URL per Roblox API, can be overridden with "api_base_urls" in config.json (e.g. to point at a local stand-in)
+DEFAULT_API_BASE_URLS = {
+    "friends": "https://friends.roblox.com",
+    "thumbnails": "https://thumbnails.roblox.com",
+    "apis": "https://apis.roblox.com",
+    "users": "https://users.roblox.com",
+}
+API_BASE_URLS: Dict[str, str] = dict(DEFAULT_API_BASE_URLS)
+
+def configure_api_base_urls(overrides: Dict[str, str]) -> None:
+    """Apply base URL overrides on top of the public Roblox hosts."""
+    API_BASE_URLS.clear()
+    API_BASE_URLS.update(DEFAULT_API_BASE_URLS)
+    for name, base_url in (overrides or {}).items():
+        if name not in DEFAULT_API_BASE_URLS:
+            logger.warning(f"Ignoring unknown API in api_base_urls: {name}")
+            continue
+        API_BASE_URLS[name] = base_url.rstrip("/")
+
+# --- Rate Limits ---
+# Requests per second and burst size per API host, can be overridden with "rate_limits" in config.json
+DEFAULT_RATE_LIMITS = {
+    "friends.roblox.com": {"rate": 1.0, "burst": 3},
+    "thumbnails.roblox.com": {"rate": 5.0, "burst": 10},
+    "apis.roblox.com": {"rate": 3.0, "burst": 5},
+    "users.roblox.com": {"rate": 3.0, "burst": 5},
+    "*": {"rate": 1.0, "burst": 2},
+}
+RATE_LIMITERS: Dict[str, TokenBucket] = {}
+RATE_LIMIT_CONFIG: Dict[str, Dict] = dict(DEFAULT_RATE_LIMITS)
+
+def configure_rate_limiters(overrides: Dict[str, Dict]) -> None:
+    """Apply rate limit settings and reset the process-wide buckets."""
+    RATE_LIMIT_CONFIG.clear()
+    RATE_LIMIT_CONFIG.update(DEFAULT_RATE_LIMITS)
+    for host, limits in (overrides or {}).items():
+        RATE_LIMIT_CONFIG[host] = {**RATE_LIMIT_CONFIG.get(host, DEFAULT_RATE_LIMITS["*"]), **limits}
+    RATE_LIMITERS.clear()
+
+def get_rate_limiter(url: str) -> TokenBucket:
+    """Return the bucket shared by every request to the host of `url`."""
+    host = urlsplit(url).hostname or "*"
+    if host not in RATE_LIMITERS:
+        limits = RATE_LIMIT_CONFIG.get(host, RATE_LIMIT_CONFIG["*"])
+        RATE_LIMITERS[host] = TokenBucket(float(limits["rate"]), int(limits["burst"]))
+    return RATE_LIMITERS[host]
+
+def log_rate_limiter_stats() -> None:
+    """Log the counters of every bucket used during the run."""
+    for host, bucket in sorted(RATE_LIMITERS.items()):
+        stats = bucket.stats()
+        logger.info(f"Rate limiter {host}: {stats['requests']} requests, {stats['waits']} waits "
+                    f"({stats['wait_time']:.1f}s), {stats['throttles']} throttled, {stats['current_rate']} req/s")
+
+def parse_retry_after(headers) -> Optional[float]:
+    """Read the Retry-After header (seconds) if present."""
+    value = headers.get("Retry-After")
+    try:
+        return max(0.0, float(value)) if value is not None else None
+    except ValueError:
+        return None
+
+# --- Settings ---
+VALID_RELATIONSHIP_TYPES = ['friends', 'followers', 'followings']
+DEFAULT_MAX_CONCURRENT_TARGETS = 4
+DATA_DIRECTORY_NAME = "TrackerData"
+
+# Per-target options that fall back to the top-level value when a target does not override them
+TARGET_OVERRIDABLE_FIELDS = {
+    "discord_webhook_url": "",
+    "guilded_webhook_url": "",
+    "send_discord_log": False,
+    "send_guilded_log": False,
+    "sinks": [],
+    "send_new_entries": True,
+    "send_removed_entries": True,
+    "enable_journal": True,
+    "incremental_fetch": True,
+    "full_sweep_every": DEFAULT_FULL_SWEEP_EVERY,
+    "count_probe": True,
+    "resume_max_age_minutes": DEFAULT_RESUME_MAX_AGE_MINUTES,
+    "digest_threshold": DEFAULT_DIGEST_THRESHOLD,
+    "flap_window_minutes": 0,
+    "flap_max_hold_hours": DEFAULT_FLAP_MAX_HOLD_HOURS,
+    "classify_removed": True,
+}
+
+def parse_user_id(value) -> str:
+    """Validate a Roblox user ID and return it as a string."""
+    try:
+        user_id = int(value)
+        if user_id <= 0:
+            raise ValueError("User ID must be a positive integer")
+    except (ValueError, TypeError) as exc:
+        raise ValueError(f"Invalid user ID format: {value!r}") from exc
+    return str(user_id)
+
+def build_targets(config: Dict, script_directory: str) -> List[Dict]:
+    """Expand the config into one target entry per (user ID, relationship type) pair.
+
+    The legacy single-user layout (`Your_User_ID` + `relationshipType`) keeps its snapshot
+    next to the `LocalData` file, while entries from the `targets` list get their own state
+    files inside the data directory. `local_data_file` is the old text format, only read
+    once to migrate it into `snapshot_file`.
+    """
+    defaults = {field: config.get(field, default) for field, default in TARGET_OVERRIDABLE_FIELDS.items()}
+
+    if "targets" not in config:
+        for field in ["discord_webhook_url", "guilded_webhook_url", "relationshipType", "Your_User_ID"]:
+            if field not in config:
+                raise ValueError(f"Missing required field: {field}")
+        target = dict(defaults)
+        target.update({
+            "target_user_id": parse_user_id(config["Your_User_ID"]),
+            "relationship_type_endpoint": config["relationshipType"],
+            "local_data_file": os.path.join(script_directory, "LocalData"),
+        })
+        target["snapshot_file"] = target["local_data_file"] + SNAPSHOT_EXTENSION
+        target["state_file"] = target["local_data_file"] + STATE_FILE_EXTENSION
+        target["cursor_file"] = target["local_data_file"] + CURSOR_FILE_EXTENSION
+        target["key"] = f"{target['target_user_id']}_{target['relationship_type_endpoint']}"
+        target["sinks"] = build_sink_specs(target, script_directory)
+        return [target]
+
+    data_directory = os.path.join(script_directory, config.get("data_directory", DATA_DIRECTORY_NAME))
+    targets = []
+    seen_keys = set()
+    for index, entry in enumerate(config["targets"]):
+        if "user_id" not in entry:
+            raise ValueError(f"Target #{index} is missing required field: user_id")
+        user_id = parse_user_id(entry["user_id"])
+        relationships = entry.get("relationships", VALID_RELATIONSHIP_TYPES)
+        if isinstance(relationships, str):
+            relationships = [relationships]
+        if entry.get("analytics", config.get("analytics", False)):
+            relationships = VALID_RELATIONSHIP_TYPES  # Analytics join all three lists
+
+        for relationship in relationships:
+            key = f"{user_id}_{relationship}"
+            if key in seen_keys:
+                logger.warning(f"Duplicate target {key} in config, ignoring")
+                continue
+            seen_keys.add(key)
+
+            target = {field: entry.get(field, default) for field, default in defaults.items()}
+            target.update({
+                "key": key,
+                "target_user_id": user_id,
+                "relationship_type_endpoint": relationship,
+                "local_data_file": os.path.join(data_directory, key),
+                "snapshot_file": os.path.join(data_directory, key + SNAPSHOT_EXTENSION),
+                "state_file": os.path.join(data_directory, key + STATE_FILE_EXTENSION),
+                "cursor_file": os.path.join(data_directory, key + CURSOR_FILE_EXTENSION),
+            })
+            target["sinks"] = build_sink_specs(target, script_directory)
+            targets.append(target)
+
+    if not targets:
+        raise ValueError("No targets configured")
+    return targets
+
+def build_sink_specs(target: Dict, script_directory: str) -> List[Dict]:
+    """Notification sinks of a target (or analytics entry): the enabled Discord/Guilded webhook
+    fields followed by the entries of its `sinks` list. Raises ValueError for malformed entries."""
+    specs = [{"type": platform, "url": target[f"{platform}_webhook_url"]}
+             for platform in ("discord", "guilded") if target[f"send_{platform}_log"]]
+    specs.extend(target["sinks"])
+
+    sinks = []
+    seen = set()
+    for spec in specs:
+        spec = normalize_sink_spec(spec, script_directory)
+        if sink_key(spec) not in seen:
+            seen.add(sink_key(spec))
+            sinks.append(spec)
+    return sinks
+
+def build_analytics_groups(config: Dict, script_directory: str) -> List[Dict]:
+    """One analytics entry per user of the `targets` list that has `analytics` enabled.
+
+    Webhook fields, `send_*_log` and `sinks` follow the same per-target override rules as the targets.
+    """
+    data_directory = os.path.join(script_directory, config.get("data_directory", DATA_DIRECTORY_NAME))
+    groups = []
+    seen_users = set()
+    for entry in config.get("targets", []):
+        if not entry.get("analytics", config.get("analytics", False)):
+            continue
+        user_id = parse_user_id(entry["user_id"])
+        if user_id in seen_users:
+            continue
+        seen_users.add(user_id)
+
+        key = f"{user_id}_analytics"
+        group = {field: entry.get(field, config.get(field, TARGET_OVERRIDABLE_FIELDS[field]))
+                 for field in ("discord_webhook_url", "guilded_webhook_url", "send_discord_log", "send_guilded_log", "sinks")}
+        group.update({
+            "key": key,
+            "target_user_id": user_id,
+            "target_keys": {f"{user_id}_{relationship}": relationship for relationship in VALID_RELATIONSHIP_TYPES},
+            "snapshot_files": {relationship: os.path.join(data_directory, f"{user_id}_{relationship}{SNAPSHOT_EXTENSION}")
+                               for relationship in VALID_RELATIONSHIP_TYPES},
+            "state_prefix": os.path.join(data_directory, key),
+            "export_file": _optional_path(script_directory, entry.get("analytics_export_file",
+                                                                      os.path.join(data_directory, f"{key}.json"))),
+            "analytics_webhooks": entry.get("analytics_webhooks", config.get("analytics_webhooks", True)),
+        })
+        group["sinks"] = build_sink_specs(group, script_directory)
+        groups.append(group)
+    return groups
+
+def _optional_path(script_directory: str, path: str) -> str:
+    """Resolve a configured file path against the script directory, an empty path stays empty (disabled)."""
+    return os.path.join(script_directory, path) if path else ""
+
+def parse_config(config: Dict, script_directory: str, config_path: str) -> Dict:
+    """Turn the raw config dictionary into the settings used by the tracker."""
+    data_directory = os.path.join(script_directory, config.get("data_directory", DATA_DIRECTORY_NAME))
+    settings = {
+        "targets": build_targets(config, script_directory),
+        "analytics": build_analytics_groups(config, script_directory),
+        "max_concurrent_targets": max(1, int(config.get("max_concurrent_targets", DEFAULT_MAX_CONCURRENT_TARGETS))),
+        "embed_wait_HTTP": max(0.1, config.get("embed_wait_HTTP", 1.0)),
+        "rate_limits": config.get("rate_limits", {}),
+        "api_base_urls": config.get("api_base_urls", {}),
+        "enrichment_concurrency": max(1, int(config.get("enrichment_concurrency", ENRICHMENT_CONCURRENCY))),
+        "watch_min_interval": max(1.0, float(config.get("watch_min_interval", DEFAULT_WATCH_MIN_INTERVAL))),
+        "watch_max_interval": max(1.0, float(config.get("watch_max_interval", DEFAULT_WATCH_MAX_INTERVAL))),
+        "watch_jitter": min(0.5, max(0.0, float(config.get("watch_jitter", DEFAULT_WATCH_JITTER)))),
+        "metadata_cache": config.get("metadata_cache", True),
+        "metadata_cache_file": os.path.join(data_directory, METADATA_CACHE_FILE_NAME),
+        "metadata_username_ttl": float(config.get("metadata_username_ttl_hours", DEFAULT_USERNAME_TTL_HOURS)) * 3600,
+        "metadata_thumbnail_ttl": float(config.get("metadata_thumbnail_ttl_hours", DEFAULT_THUMBNAIL_TTL_HOURS)) * 3600,
+        "metadata_cache_max_entries": max(1, int(config.get("metadata_cache_max_entries", DEFAULT_METADATA_CACHE_MAX_ENTRIES))),
+        "metadata_prefetch_per_run": max(0, int(config.get("metadata_prefetch_per_run", DEFAULT_METADATA_PREFETCH_PER_RUN))),
+        "outbox": config.get("outbox", True),
+        "outbox_file": os.path.join(data_directory, OUTBOX_FILE_NAME),
+        "outbox_max_attempts": max(1, int(config.get("outbox_max_attempts", DEFAULT_OUTBOX_MAX_ATTEMPTS))),
+        "query_server": config.get("query_server", False),
+        "query_server_host": config.get("query_server_host", DEFAULT_QUERY_SERVER_HOST),
+        "query_server_port": int(config.get("query_server_port", DEFAULT_QUERY_SERVER_PORT)),
+        "coordinator_file": _optional_path(script_directory, config.get("coordinator_file", os.path.join(data_directory, COORDINATOR_FILE_NAME))),
+        "lease_seconds": max(10.0, float(config.get("lease_seconds", DEFAULT_LEASE_SECONDS))),
+        "metrics_report_file": _optional_path(script_directory, config.get("metrics_report_file", os.path.join(data_directory, RUN_REPORT_FILE_NAME))),
+        "metrics_prometheus_file": _optional_path(script_directory, config.get("metrics_prometheus_file", "")),
+        "last_run_time_file": os.path.join(script_directory, "LastRunTime.txt"),
+        "config_file": config_path
+    }
+    return settings
+
+def load_settings() -> Dict:
+    """Load settings from the config.json file with validation."""
+    try:
+        script_directory = os.path.dirname(__file__)
+        config_path = os.path.join(script_directory, CONFIG_FILE_NAME)
+
+        with open(config_path, 'r', encoding='utf-8') as file:
+            config = json.load(file)
+
+        return parse_config(config, script_directory, config_path)
+
+    except FileNotFoundError as exc:
+        logger.error("Config file not found. Please create config.json")
+        raise SystemExit("Configuration file missing") from exc
+    except json.JSONDecodeError as e:
+        logger.error(f"Invalid JSON in config file: {e}")
+        raise SystemExit("Invalid configuration file format") from e
+    except Exception as e:
+        logger.error(f"Configuration error: {e}")
+        raise SystemExit("Failed to load configuration") from e
+
+# --- Helper functions ---
+def validate_settings(settings: Dict) -> None:
+    """Validate and fix settings."""
+    for group in settings["analytics"]:
+        validate_sinks(group)
+
+    for target in settings["targets"]:
+        validate_sinks(target)
+
+        # Check relationship type
+        if target["relationship_type_endpoint"] not in VALID_RELATIONSHIP_TYPES:
+            logger.error(f"Invalid relationship type: {target['relationship_type_endpoint']}")
+            raise SystemExit(f"Valid options: {VALID_RELATIONSHIP_TYPES}")
+
+def validate_sinks(target: Dict) -> None:
+    """Disable the sinks of a target (or analytics entry) that cannot work, e.g. a webhook URL of the wrong platform."""
+    valid = []
+    for spec in target["sinks"]:
+        problem = sink_problem(spec)
+        if problem:
+            logger.warning(f"[{target['key']}] {problem}. {spec['type'].capitalize()} sink disabled.")
+        else:
+            valid.append(spec)
+    target["sinks"] = valid
+
+def ensure_files_exist(files: List[str]) -> None:
+    """Ensure required files exist, create empty ones if needed."""
+    for file_path in files:
+        if not os.path.isfile(file_path):
+            logger.info(f"Creating missing file: {file_path}")
+            try:
+                os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+                with open(file_path, 'w', encoding='utf-8') as f:
+                    if file_path.endswith('.txt'):
+                        f.write(f"Created: {datetime.now().strftime('%d.%m.%Y %H:%M:%S')}\n")
+            except Exception as e:
+                logger.error(f"Failed to create file {file_path}: {e}")
+                raise SystemExit(f"Cannot create required file: {file_path}") from e
+
+def write_last_run_time(file_path: str) -> None:
+    """Write the last execution time to a file."""
+    try:
+        with open(file_path, 'w', encoding='utf-8') as file:
+            file.write(f"Last execution: {datetime.now().strftime('%d.%m.%Y %H:%M:%S')}\n")
+    except Exception as e:
+        logger.error(f"Failed to write last run time: {e}")
+
+def read_target_state(file_path: str) -> Dict:
+    """Read the small JSON state kept per target (run counters, probes)."""
+    try:
+        with open(file_path, 'r', encoding='utf-8') as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable state file {file_path}: {e}")
+        return {}
+
+def write_target_state(file_path: str, state: Dict) -> None:
+    """Atomically replace the per-target JSON state."""
+    temp_path = f"{file_path}.tmp"
+    try:
+        os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump(state, file)
+        os.replace(temp_path, file_path)
+    except OSError as e:
+        logger.error(f"Failed to write state file {file_path}: {e}")
+
+def chunk_data(data: List, chunk_size: int = 10) -> List[List]:
+    """Split data into chunks."""
+    return [data[i:i + chunk_size] for i in range(0, len(data), chunk_size)]
+
+# --- Async API Functions ---
+class FetchError(Exception):
+    '''Raised when a relationship list cannot be fetched completely'''
+
+async def make_request_with_retry(session: aiohttp.ClientSession, url: str, max_retries: int = 3,
+                                  payload: Optional[Union[Dict, List]] = None,
+                                  decode: Optional[Callable[[bytes], Any]] = None) -> Optional[Any]:
+    """Make HTTP request with retry logic and rate limiting, a POST with `payload` as JSON body if given.
+
+    The response is parsed as JSON, or handed to `decode` as raw bytes (a body it cannot decode is retried).
+    """
+    rate_limiter = get_rate_limiter(url)
+    for attempt in range(max_retries):
+        if attempt > 0:
+            METRICS.record_retry(url)
+        started = time.perf_counter()
+        responded = False
+        try:
+            await rate_limiter.acquire()
+            sent = time.perf_counter()
+            METRICS.record_limiter_wait(url, sent - started)
+
+            async with session.request("GET" if payload is None else "POST", url, json=payload,
+                                       timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)) as response:
+                body = await response.read()
+                responded = True
+                METRICS.record_response(url, response.status, time.perf_counter() - sent, len(body))
+                if response.status == 200:
+                    rate_limiter.on_success()
+                    return decode(body) if decode is not None else await response.json()
+                elif response.status == 429:  # Rate limited, the shared bucket pauses every caller
+                    logger.warning(f"Rate limited, attempt {attempt + 1}/{max_retries}")
+                    rate_limiter.on_throttle(parse_retry_after(response.headers))
+                    continue
+                else:
+                    logger.warning(f"HTTP {response.status} for {url}, attempt {attempt + 1}/{max_retries}")
+
+        except asyncio.TimeoutError:
+            logger.warning(f"Timeout for {url}, attempt {attempt + 1}/{max_retries}")
+            if not responded:
+                METRICS.record_failure(url, time.perf_counter() - started, timeout=True)
+        except Exception as e:
+            logger.error(f"Request error for {url}: {e}, attempt {attempt + 1}/{max_retries}")
+            if not responded:
+                METRICS.record_failure(url, time.perf_counter() - started, timeout=False)
+
+        if attempt < max_retries - 1:
+            await asyncio.sleep(2 ** attempt)  # Exponential backoff
+
+    logger.error(f"Failed to fetch data from {url} after {max_retries} attempts")
+    return None
+
+def resume_from_checkpoint(checkpoint: Optional[PaginationCheckpoint]) -> Tuple[Optional[str], array]:
+    """Return (cursor, IDs so far) to continue an interrupted crawl, or (None, empty array) to start fresh."""
+    if checkpoint is None:
+        return None, array('q')
+    return checkpoint.resume()
+
+async def iter_friends_pages(session: aiohttp.ClientSession, user_id: str,
+                             checkpoint: Optional[PaginationCheckpoint] = None) -> AsyncIterator[array]:
+    """Yield the friend IDs of a user page by page, as arrays of 64-bit ints.
+
+    With a checkpoint the crawl continues where a previous failed attempt stopped (the IDs collected
+    back then are yielded first), and progress is saved before giving up on a page so the next run
+    does not start from scratch.
+    """
+    logger.info(f"Fetching friends for user ID {user_id}")
+    cursor, resumed_ids = resume_from_checkpoint(checkpoint)
+    cursor = cursor or ""
+    fetch_count = 0
+    total = 0
+
+    while True:
+        url = f"{API_BASE_URLS['friends']}/v1/users/{user_id}/friends/find?limit={FRIENDS_LIMIT}&cursor={cursor}&userSort="
+
+        page = await make_request_with_retry(session, url, decode=decode_friends_page)
+        if page is None and resumed_ids and fetch_count == 0:
+            # The saved cursor may have expired, start over instead of failing every run
+            logger.warning(f"Cannot continue the saved friends crawl of user {user_id}, starting over")
+            checkpoint.discard()
+            resumed_ids, cursor = array('q'), ""
+            continue
+        if page is None:
+            logger.error(f"Failed to fetch friends data for user {user_id}")
+            if checkpoint is not None:
+                checkpoint.flush()
+            raise FetchError(f"Cannot fetch friends for user {user_id}")
+
+        if resumed_ids:
+            # Only hand out the saved IDs once the saved cursor turned out to be usable
+            total += len(resumed_ids)
+            yield resumed_ids
+            resumed_ids = array('q')
+
+        page_ids, next_cursor = page
+        fetch_count += 1
+        total += len(page_ids)
+        if checkpoint is not None:
+            checkpoint.add_page(page_ids, next_cursor)
+        yield page_ids
+
+        if SHOW_PROGRESS_INFO and PROGRESS_INFO_EVERY > 0 and fetch_count % PROGRESS_INFO_EVERY == 0:
+            logger.info(f"Fetched {total} friend IDs of user {user_id} so far...")
+
+        if not next_cursor:
+            break
+        cursor = next_cursor
+
+    if checkpoint is not None:
+        checkpoint.discard()
+    logger.info(f"Fetched total {total} friend IDs of user {user_id}.")
+
+async def iter_followers_or_followings_pages(session: aiohttp.ClientSession,
+                                             user_id: str, endpoint: str, known: Optional[Snapshot] = None,
+                                             checkpoint: Optional[PaginationCheckpoint] = None,
+                                             first_page: Optional[IdPage] = None) -> AsyncIterator[array]:
+    """Yield the follower/following IDs of a user page by page, as arrays of 64-bit ints.
+
+    With `known` (the previous snapshot) the list is paged newest first and paging stops after a
+    full page worth of consecutive IDs that are already known, so only the newest entries are returned.
+    Such a crawl starts from `first_page` if the newest page was already fetched (by the count probe).
+    A checkpoint makes a full crawl resumable, see `iter_friends_pages`.
+    """
+    incremental = known is not None and len(known) > 0
+    if incremental:
+        checkpoint = None  # Incremental crawls are short, not worth resuming
+    else:
+        first_page = None  # A full crawl pages oldest first
+    logger.info(f"Fetching {endpoint} for user ID {user_id}{' (newest first)' if incremental else ''}")
+    cursor, resumed_ids = resume_from_checkpoint(checkpoint)
+    fetch_count = 0
+    total = 0
+    known_run = 0
+    stop_after_known = min(FOLLOWERS_FOLLOWINGS_LIMIT, len(known)) if incremental else 0
+    sort_order = "Desc" if incremental else "Asc"
+
+    while True:
+        url = f"{API_BASE_URLS['friends']}/v1/users/{user_id}/{endpoint}?limit={FOLLOWERS_FOLLOWINGS_LIMIT}&sortOrder={sort_order}"
+        if cursor:
+            url += f"&cursor={cursor}"
+
+        if first_page is not None:
+            page, first_page = first_page, None
+        else:
+            page = await make_request_with_retry(session, url, decode=decode_follows_page)
+        if page is None and resumed_ids and fetch_count == 0:
+            # The saved cursor may have expired, start over instead of failing every run
+            logger.warning(f"Cannot continue the saved {endpoint} crawl of user {user_id}, starting over")
+            checkpoint.discard()
+            resumed_ids, cursor = array('q'), None
+            continue
+        if page is None:
+            logger.error(f"Failed to fetch {endpoint} data for user {user_id}")
+            if checkpoint is not None:
+                checkpoint.flush()
+            raise FetchError(f"Cannot fetch {endpoint} for user {user_id}")
+
+        if resumed_ids:
+            # Only hand out the saved IDs once the saved cursor turned out to be usable
+            total += len(resumed_ids)
+            yield resumed_ids
+            resumed_ids = array('q')
+
+        ids, next_cursor = page
+        fetch_count += 1
+        total += len(ids)
+        if checkpoint is not None:
+            checkpoint.add_page(ids, next_cursor)
+        yield ids
+
+        if incremental:
+            for uid in ids:
+                known_run = known_run + 1 if uid in known else 0
+            if known_run >= stop_after_known:
+                logger.info(f"Reached already known {endpoint} of user {user_id} after {fetch_count} page(s)")
+                break
+
+        if SHOW_PROGRESS_INFO and PROGRESS_INFO_EVERY > 0 and fetch_count % PROGRESS_INFO_EVERY == 0:
+            logger.info(f"Fetched {total} {endpoint} IDs of user {user_id} so far...")
+
+        cursor = next_cursor
+        if not cursor:
+            break
+
+    if checkpoint is not None:
+        checkpoint.discard()
+    logger.info(f"Fetched total {total} {endpoint} IDs of user {user_id}.")
+
+async def fetch_friends_ids(session: aiohttp.ClientSession, user_id: str,
+                            checkpoint: Optional[PaginationCheckpoint] = None) -> array:
+    """Fetch all friend IDs for a user."""
+    ids = array('q')
+    async for page in iter_friends_pages(session, user_id, checkpoint):
+        ids.extend(page)
+    return ids
+
+async def fetch_followers_or_followings_ids(session: aiohttp.ClientSession,
+                                           user_id: str, endpoint: str, known: Optional[Snapshot] = None,
+                                           checkpoint: Optional[PaginationCheckpoint] = None) -> array:
+    """Fetch all follower/following IDs for a user, see `iter_followers_or_followings_pages`."""
+    ids = array('q')
+    async for page in iter_followers_or_followings_pages(session, user_id, endpoint, known, checkpoint):
+        ids.extend(page)
+    return ids
+
+async def fetch_relationship_count(session: aiohttp.ClientSession, user_id: str, endpoint: str) -> Optional[int]:
+    """Fetch the number of friends/followers/followings Roblox reports for a user."""
+    data = await make_request_with_retry(session, f"{API_BASE_URLS['friends']}/v1/users/{user_id}/{endpoint}/count")
+    if not data or not isinstance(data.get("count"), int):
+        return None
+    return data["count"]
+
+async def fetch_first_page(session: aiohttp.ClientSession, user_id: str, endpoint: str) -> Optional[IdPage]:
+    """Fetch the first page of followers/followings newest first, as (IDs, next page cursor)."""
+    return await make_request_with_retry(session, f"{API_BASE_URLS['friends']}/v1/users/{user_id}/{endpoint}?limit={FOLLOWERS_FOLLOWINGS_LIMIT}&sortOrder=Desc",
+                                         decode=decode_follows_page)
+
+def iter_user_id_pages(session: aiohttp.ClientSession, target: Dict) -> AsyncIterator[array]:
+    """Page through all user IDs based on relationship type, resuming an interrupted crawl if possible."""
+    endpoint = target["relationship_type_endpoint"]
+    user_id = target["target_user_id"]
+    checkpoint = PaginationCheckpoint(target["cursor_file"], endpoint, target["resume_max_age_minutes"] * 60)
+
+    if endpoint == "friends":
+        return iter_friends_pages(session, user_id, checkpoint)
+    else:
+        return iter_followers_or_followings_pages(session, user_id, endpoint, checkpoint=checkpoint)
+
+async def fetch_all_user_ids(session: aiohttp.ClientSession, target: Dict) -> array:
+    """Fetch all user IDs based on relationship type."""
+    ids = array('q')
+    async for page in iter_user_id_pages(session, target):
+        ids.extend(page)
+    return ids
+
+ChunkFetcher = Callable[[List[str]], Awaitable[Optional[Dict]]]
+
+async def fetch_chunks_concurrently(chunks: List[List[str]], fetch_chunk: ChunkFetcher,
+                                    concurrency: int, label: str) -> Tuple[Dict, List[str]]:
+    """Run `fetch_chunk` over all chunks with at most `concurrency` requests in flight.
+
+    `fetch_chunk` returns the results of one chunk or None if it failed. Failed chunks get
+    `ENRICHMENT_RETRY_PASSES` more attempts once the first pass is done. Returns the merged
+    results and the IDs of the chunks that still failed.
+    """
+    results = {}
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    total_ids = sum(len(chunk) for chunk in chunks)
+
+    async def run(chunk: List[str]) -> Tuple[List[str], Optional[Dict]]:
+        async with semaphore:
+            try:
+                return chunk, await fetch_chunk(chunk)
+            except Exception as e:
+                logger.error(f"Error fetching {label} for a chunk of {len(chunk)} IDs: {e}")
+                return chunk, None
+
+    pending = chunks
+    for attempt in range(ENRICHMENT_RETRY_PASSES + 1):
+        failed_chunks = []
+        for completed, task in enumerate(asyncio.as_completed([run(chunk) for chunk in pending]), start=1):
+            chunk, data = await task
+            if data is None:
+                failed_chunks.append(chunk)
+            else:
+                results.update(data)
+
+            if SHOW_PROGRESS_INFO and PROGRESS_INFO_EVERY > 0 and completed % PROGRESS_INFO_EVERY == 0:
+                logger.info(f"Fetched {label} for {len(results)}/{total_ids} user IDs so far...")
+
+        if not failed_chunks:
+            break
+        pending = failed_chunks
+        if attempt < ENRICHMENT_RETRY_PASSES:
+            logger.warning(f"Retrying {len(failed_chunks)} failed {label} chunk(s)")
+
+    failed_ids = [uid for chunk in failed_chunks for uid in chunk]
+    if failed_ids:
+        shown = ", ".join(failed_ids[:20]) + (" ..." if len(failed_ids) > 20 else "")
+        logger.warning(f"Could not resolve {label} for {len(failed_ids)} user IDs: {shown}")
+    return results, failed_ids
+
+async def fetch_usernames_batch(session: aiohttp.ClientSession, user_ids: List[str],
+                                concurrency: int = ENRICHMENT_CONCURRENCY) -> Dict[str, str]:
+    """Fetch usernames for user IDs in concurrent batches."""
+    url = f"{API_BASE_URLS['apis']}/user-profile-api/v1/user/profiles/get-profiles"
+    headers = {
+        'accept': 'application/json',
+        'Content-Type': 'application/json'
+    }
+    rate_limiter = get_rate_limiter(url)
+
+    async def fetch_chunk(chunk: List[str]) -> Optional[Dict[str, str]]:
+        data = {
+            "fields": ["names.username"],
+            "userIds": chunk
+        }
+        started = time.perf_counter()
+        await rate_limiter.acquire()
+        sent = time.perf_counter()
+        METRICS.record_limiter_wait(url, sent - started)
+
+        try:
+            async with session.post(url, headers=headers, json=data,
+                                    timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)) as response:
+                body = await response.read()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            METRICS.record_failure(url, time.perf_counter() - sent, timeout=isinstance(e, asyncio.TimeoutError))
+            raise
+        METRICS.record_response(url, response.status, time.perf_counter() - sent, len(body))
+
+        if response.status == 429:
+            logger.warning("Username API rate limited")
+            rate_limiter.on_throttle(parse_retry_after(response.headers))
+            return None
+        if response.status != 200:
+            logger.error(f"Username API error: {response.status}")
+            return None
+
+        rate_limiter.on_success()
+        response_data = json.loads(body)
+        usernames = {}
+        for user_data in response_data.get('profileDetails', []):
+            user_id = str(user_data.get('userId'))
+            username = user_data.get('names', {}).get('username', None)
+            if user_id and username:
+                usernames[user_id] = username
+            else:
+                logger.warning(f"User ID {user_id} has unknown username")
+        return usernames
+
+    usernames, _ = await fetch_chunks_concurrently(chunk_data(user_ids, USERNAME_BATCH_LIMIT), fetch_chunk,
+                                                   concurrency, "usernames")
+    logger.info(f"Fetched usernames for {len(usernames)}/{len(user_ids)} user IDs.")
+    return usernames
+
+async def classify_removed_users(session: aiohttp.ClientSession, user_ids: List[str],
+                                 concurrency: int = ENRICHMENT_CONCURRENCY) -> Tuple[Dict[str, str], List[str]]:
+    """Split removed users into accounts that still exist and accounts Roblox banned or terminated.
+
+    Every chunk of IDs is sent to the users API with `excludeBannedUsers`, accounts missing from the
+    answer are terminated. Returns the usernames of the existing accounts and the terminated IDs.
+    IDs whose chunk could not be checked are treated as existing, so they are announced as usual.
+    """
+    url = f"{API_BASE_URLS['users']}/v1/users"
+
+    async def fetch_chunk(chunk: List[str]) -> Optional[Dict[str, Optional[str]]]:
+        data = await make_request_with_retry(session, url, payload={"userIds": [int(user_id) for user_id in chunk],
+                                                                    "excludeBannedUsers": True})
+        if not data:
+            return None
+        active = {str(user.get("id")): user.get("name") or "" for user in data.get("data", [])}
+        return {user_id: active.get(user_id) for user_id in chunk}  # None: left out of the answer, terminated
+
+    results, _ = await fetch_chunks_concurrently(chunk_data(user_ids, USERS_BATCH_LIMIT), fetch_chunk,
+                                                 concurrency, "account status")
+    terminated = [user_id for user_id in user_ids if user_id in results and results[user_id] is None]
+    usernames = {user_id: name for user_id, name in results.items() if name}
+    logger.info(f"Checked {len(results)}/{len(user_ids)} removed accounts, {len(terminated)} of them are terminated")
+    return usernames, terminated
+
+THUMBNAIL_TYPES = {  # Batch API type -> (result field, size)
+    "Avatar": ("avatar_url", AVATAR_SIZE),
+    "AvatarHeadShot": ("headshot_url", AVATAR_HEADSHOT_SIZE),
+}
+
+def thumbnail_batch_requests(user_ids: List[str]) -> List[Dict]:
+    """Entries for the thumbnails batch API asking for the avatar and the headshot of every user."""
+    return [
+        {"requestId": f"{user_id}:{kind}", "targetId": int(user_id), "type": kind,
+         "size": size, "format": "Png", "isCircular": False}
+        for user_id in user_ids for kind, (_, size) in THUMBNAIL_TYPES.items()
+    ]
+
+async def fetch_avatars_batch(session: aiohttp.ClientSession, user_ids: List[str],
+                              concurrency: int = ENRICHMENT_CONCURRENCY) -> Dict[str, Dict[str, str]]:
+    """Fetch avatar and headshot URLs for user IDs in concurrent batches.
+
+    Both sizes are requested in one call to the thumbnails batch API. Thumbnails Roblox is still
+    rendering come back as `Pending` and only those are asked for again, after the delays in
+    `THUMBNAIL_PENDING_RETRY_DELAYS`. Whatever is still pending after that is left empty.
+    """
+    logger.info("Fetching avatars and headshots")
+    url = f"{API_BASE_URLS['thumbnails']}/v1/batch"
+    still_pending = 0
+
+    async def fetch_chunk(chunk: List[str]) -> Optional[Dict[str, Dict[str, str]]]:
+        nonlocal still_pending
+        requests = thumbnail_batch_requests(chunk)
+        results = {}
+        for attempt, delay in enumerate((0.0,) + THUMBNAIL_PENDING_RETRY_DELAYS):
+            if delay:
+                await asyncio.sleep(delay)
+            data = await make_request_with_retry(session, url, payload=requests)
+            if not data:
+                if attempt == 0:
+                    return None
+                break  # Keep what completed, the pending ones show the default icon
+
+            by_request_id = {request["requestId"]: request for request in requests}
+            pending = []
+            for entry in data.get("data", []):
+                request = by_request_id.get(entry.get("requestId"))
+                if request is None:
+                    continue
+                if entry.get("state") == "Pending":
+                    pending.append(request)
+                field = THUMBNAIL_TYPES[request["type"]][0]
+                image_url = entry.get("imageUrl") if entry.get("state") == "Completed" else None
+                results.setdefault(str(request["targetId"]), {})[field] = image_url
+            requests = pending
+            if not requests:
+                break
+
+        still_pending += len(requests)
+        return results
+
+    chunk_size = THUMBNAIL_BATCH_LIMIT // len(THUMBNAIL_TYPES)
+    results, _ = await fetch_chunks_concurrently(chunk_data(user_ids, chunk_size), fetch_chunk,
+                                                 concurrency, "avatars/headshots")
+    if still_pending:
+        logger.info(f"{still_pending} thumbnails were still being rendered by Roblox, using the default icon for them")
+    logger.info(f"Fetched avatars and headshots for {len(results)}/{len(user_ids)} user IDs.")
+    return results
+
+# --- Webhook Processing ---
+def use_digest(target: Dict, change_count: int) -> bool:
+    """Whether a batch of changes is large enough to be sent as digest embeds."""
+    return 0 < target["digest_threshold"] < change_count
+
+async def process_webhooks(context: "TrackerContext", target: Dict, embed_data_list: List[Dict], webhook_type: str) -> None:
+    """Pack the users into as few messages as the platform limits allow and queue them on every
+    sink of the target. With the outbox enabled every message is stored before it is queued."""
+    if not embed_data_list:
+        return
+
+    digest = use_digest(target, len(embed_data_list))
+    messages = build_messages(target["relationship_type_endpoint"], embed_data_list, APP_VERSION, digest)
+    if digest:
+        logger.info(f"[{target['key']}] Sending {len(embed_data_list)} {webhook_type} entries as a digest")
+    await send_messages(context, target, messages, webhook_type)
+
+async def send_messages(context: "TrackerContext", target: Dict, messages: List[Dict], webhook_type: str) -> None:
+    """Queue built messages on every sink of a target (or analytics entry), through the outbox if enabled."""
+    context.check_lease(target)
+    entries = []
+    for sink in context.sinks.for_specs(target["sinks"]):
+        for message in messages:
+            entry = {"id": None, "target_key": target["key"], "platform": sink.kind, "webhook_url": sink.address,
+                     "webhook_type": webhook_type, "payload": message["payload"], "user_ids": message["user_ids"]}
+            if context.outbox is not None:
+                entry["id"] = await context.call_store(context.outbox.enqueue, target["key"], sink.kind, sink.address,
+                                                       webhook_type, message["payload"], message["user_ids"])
+                if entry["id"] is None:
+                    logger.info(f"[{target['key']}] Identical message for {sink.name} is already queued, not sending it twice")
+                    continue
+            entries.append(entry)
+
+    await deliver_messages(context, entries, f"[{target['key']}] {webhook_type}")
+
+async def deliver_messages(context: "TrackerContext", entries: List[Dict], label: str) -> None:
+    """Hand messages to their sinks without waiting for the delivery.
+
+    Every sink sends its messages in order while different sinks work concurrently, the results
+    arrive in `handle_sink_result`. When a sink's queue is full, outbox messages stay pending for
+    a later run and messages without an outbox are dropped.
+    """
+    progress = {"label": label, "total": 0, "sent": 0}  # Results only arrive once this loop returned
+    kept = 0
+    dropped = 0
+    for entry in entries:
+        sink = context.sinks.find(entry["platform"], entry["webhook_url"])
+        if sink is None:
+            # Only outbox entries of a sink that was removed from the config end up here
+            await context.call_store(context.outbox.failed, entry["id"], "sink no longer configured", permanent=True)
+            logger.error(f"[{entry['target_key']}] Queued message for a removed {entry['platform']} sink moved to the dead letters in {context.outbox.path}")
+            continue
+
+        entry["progress"] = progress
+        if entry["id"] is not None:
+            context.outbox_in_flight.add(entry["id"])
+        if sink.submit(entry):
+            progress["total"] += 1
+            entry["delivery"] = asyncio.get_running_loop().create_future()
+            context.deliveries.setdefault(entry["target_key"], set()).add(entry["delivery"])
+            continue
+        if entry["id"] is not None:
+            context.outbox_in_flight.discard(entry["id"])
+            kept += 1
+        else:
+            METRICS.record_sink(sink.name, "dropped")
+            dropped += 1
+
+    if kept:
+        logger.warning(f"{label}: sink queue full, {kept} message(s) kept in the outbox for the next run")
+    if dropped:
+        logger.error(f"{label}: sink queue full, {dropped} message(s) dropped")
+
+async def handle_sink_result(context: "TrackerContext", sink: Sink, entry: Dict, outcome: Optional[str]) -> None:
+    """Record what a sink did with a message, `outcome` is None when it was skipped (the sink is cooling down)."""
+    try:
+        await record_sink_result(context, sink, entry, outcome)
+    finally:
+        delivery = entry.get("delivery")
+        if delivery is not None:
+            context.deliveries.get(entry["target_key"], set()).discard(delivery)
+            if not delivery.done():
+                delivery.set_result(outcome)
+
+async def record_sink_result(context: "TrackerContext", sink: Sink, entry: Dict, outcome: Optional[str]) -> None:
+    """Update the outbox, metrics and progress log with the result of one message."""
+    outbox = context.outbox
+    if entry["id"] is not None:
+        context.outbox_in_flight.discard(entry["id"])
+        if outbox is not None and outcome == SEND_DELIVERED:
+            await context.call_store(outbox.delivered, entry["id"])
+        elif (outbox is not None and outcome is not None and
+              await context.call_store(outbox.failed, entry["id"], outcome, permanent=outcome == SEND_REJECTED)):
+            logger.error(f"[{entry['target_key']}] Message for {sink.name} moved to the dead letters in {outbox.path}")
+    if outcome is None:
+        return
+
+    METRICS.record_webhook(entry["target_key"], sink.kind, entry["webhook_type"], outcome == SEND_DELIVERED)
+    progress = entry["progress"]
+    if outcome == SEND_DELIVERED:
+        progress["sent"] += 1
+        if progress["sent"] % 5 == 0 or progress["sent"] == progress["total"]:
+            logger.info(f"{progress['label']}: sent {progress['sent']}/{progress['total']} messages")
+    elif outcome == SEND_FAILED and entry["id"] is not None:
+        logger.warning(f"{progress['label']}: {sink.name} unavailable, skipping it for {SINK_FAILURE_COOLDOWN:.0f}s, "
+                       f"its messages stay in the outbox")
+
+async def wait_for_deliveries(context: "TrackerContext", target_keys: List[str]) -> None:
+    """Wait until the sinks handled every message queued so far for these targets (or analytics entries)."""
+    pending = [delivery for key in target_keys for delivery in context.deliveries.get(key, ())]
+    if pending:
+        await asyncio.wait(pending)
+
+async def drain_outbox(context: "TrackerContext", target_key: Optional[str] = None) -> None:
+    """Queue messages left over from earlier runs (of one target or all of them) whose backoff expired."""
+    if context.outbox is None:
+        return
+    entries = [entry for entry in await context.call_store(context.outbox.due, target_key) if entry["id"] not in context.outbox_in_flight]
+    if not entries:
+        return
+    logger.info(f"Retrying {len(entries)} queued message(s) from the outbox")
+    await deliver_messages(context, entries, "Outbox")
+
+def prepare_embed_data(user_ids: List[str], usernames: Dict[str, str],
+                      avatars: Dict[str, Dict], is_removed: bool, total_count: int) -> List[Dict]:
+    """Prepare embed data for webhooks."""
+    embed_data_list = []
+    for user_id in user_ids:
+        embed_data = {
+            "username": usernames.get(user_id, "Unknown"),
+            "user_id": user_id,
+            "avatar_url": avatars.get(user_id, {}).get("avatar_url"),
+            "headshot_url": avatars.get(user_id, {}).get("headshot_url"),
+            "removed": is_removed,
+            "total_count": total_count
+        }
+        embed_data_list.append(embed_data)
+    return embed_data_list
+
+# --- Main Logic ---
+PageCallback = Callable[[array], Awaitable[None]]
+
+async def collect_current_ids(session: aiohttp.ClientSession, target: Dict, previous: Snapshot,
+                              state: Dict, on_page: PageCallback,
+                              reported_count: Optional[int] = None, first_page: Optional[IdPage] = None) -> Tuple[array, bool]:
+    """Return the current sorted ID array and whether it came from a full crawl.
+
+    Every fetched page is handed to `on_page` as soon as it arrives. Followers/followings are
+    fetched incrementally (newest first, merged into the previous snapshot) when possible.
+    Removals are only visible to a full crawl, which is done every `full_sweep_every` runs or
+    when the count reported by Roblox (`reported_count` if the probe already read it) does not
+    match the merged list. `first_page` is the newest page if the probe already fetched it.
+    """
+    tag = f"[{target['key']}]"
+    user_id = target["target_user_id"]
+    endpoint = target["relationship_type_endpoint"]
+
+    incremental = (
+        target["incremental_fetch"] and endpoint != "friends" and len(previous) > 0 and
+        state.get("runs_since_full_sweep", 0) + 1 < target["full_sweep_every"]
+    )
+
+    if incremental:
+        additions = set()
+        async for page in iter_followers_or_followings_pages(session, user_id, endpoint, known=previous, first_page=first_page):
+            additions.update(uid for uid in page if uid not in previous)
+            await on_page(page)
+        merged = merge_sorted(previous.ids, array('q', sorted(additions)))
+        if reported_count is None:
+            reported_count = await fetch_relationship_count(session, user_id, endpoint)
+
+        if reported_count is not None and reported_count == len(merged):
+            return merged, False
+        logger.info(f"{tag} Reported count {reported_count} does not match {len(merged)} after the incremental fetch, doing a full crawl")
+
+    current_ids = array('q')  # 8 bytes per ID, a set of ints costs ~10x that at a million IDs
+    async for page in iter_user_id_pages(session, target):
+        current_ids.extend(page)
+        await on_page(page)
+    return sorted_unique(current_ids), True
+
+async def probe_target(session: aiohttp.ClientSession, target: Dict, previous: Snapshot,
+                       state: Dict) -> Tuple[bool, Optional[IdPage], Optional[int]]:
+    """Cheap pre-check: is the list unchanged since the previous run? Returns (unchanged, first page, count).
+
+    The list counts as unchanged when the count reported by Roblox equals the snapshot size and the
+    first page equals the one seen before the previous successful pass. Equal counts can hide an
+    addition that cancels out a removal further down the list, so nothing is skipped when a full
+    sweep is due. Friends are never skipped: their first page is not sorted newest first, so a new
+    friend does not have to show up on it.
+    """
+    endpoint = target["relationship_type_endpoint"]
+    if not target["count_probe"] or endpoint == "friends":
+        return False, None, None
+    user_id = target["target_user_id"]
+    if len(previous) == 0 or state.get("runs_since_full_sweep", 0) + 1 >= target["full_sweep_every"]:
+        # The crawl cannot be skipped, only remember the first page for the next probe
+        return False, await fetch_first_page(session, user_id, endpoint), None
+
+    count, first_page = await asyncio.gather(fetch_relationship_count(session, user_id, endpoint),
+                                             fetch_first_page(session, user_id, endpoint))
+    unchanged = (count is not None and count == len(previous) and
+                 first_page is not None and first_page[0].tolist() == state.get("probe_first_page"))
+    return unchanged, first_page, count
+
+class TrackerContext:
+    '''State shared by all targets of one tracker process'''
+    def __init__(self, session: aiohttp.ClientSession, settings: Dict, keep_snapshots_in_memory: bool = False,
+                 worker_id: Optional[str] = None):
+        self.session = session
+        self.settings = settings
+        self.dispatcher = WebhookDispatcher(session, settings["embed_wait_HTTP"])
+        # In watch mode the previous lists stay in memory instead of being re-read every pass
+        self.snapshots = SnapshotCache() if keep_snapshots_in_memory else None
+        self.outbox = None
+        if settings["outbox"]:
+            # Workers claim the messages they send for as long as a lease lasts
+            self.outbox = Outbox(settings["outbox_file"], settings["outbox_max_attempts"], worker_id, settings["lease_seconds"])
+        self.outbox_in_flight: Set[int] = set()  # Outbox IDs currently queued on a sink, not to be drained again
+        self.deliveries: Dict[str, Set[asyncio.Future]] = {}  # Target key -> messages queued on a sink, resolved with the outcome
+        self.sinks = SinkRegistry(self.dispatcher, functools.partial(handle_sink_result, self))
+        for target in settings["targets"] + settings["analytics"]:
+            self.sinks.for_specs(target["sinks"])  # Known up front, so the outbox can be drained before any target ran
+        # Analytics entry fed by each target, and the relationships of each entry read by this process so far
+        self.analytics_by_target = {key: group for group in settings["analytics"] for key in group["target_keys"]}
+        self.analytics_ready: Dict[str, Set[str]] = {}
+        self.analytics_locks: Dict[str, asyncio.Lock] = {}
+        # Worker mode: units (user IDs) this process holds a lease on, None when it works alone
+        self.leases: Optional[Dict[str, Lease]] = {} if worker_id is not None else None
+        # Worker mode: outbox and metadata cache are shared with other processes, their calls wait for file locks on this thread
+        self.store_thread = ThreadPoolExecutor(max_workers=1, thread_name_prefix="SharedFiles") if worker_id is not None else None
+        self.metadata = None
+        if settings["metadata_cache"]:
+            self.metadata = MetadataCache(settings["metadata_cache_file"], settings["metadata_username_ttl"],
+                                          settings["metadata_thumbnail_ttl"], settings["metadata_cache_max_entries"],
+                                          shared=worker_id is not None)
+
+    def check_lease(self, target: Dict) -> None:
+        """Raise LeaseLost if this worker no longer holds the unit of a target (or analytics entry)."""
+        if self.leases is None:
+            return
+        lease = self.leases.get(target["target_user_id"])
+        if lease is None or not lease.held():
+            raise LeaseLost(f"lease of unit {target['target_user_id']} is no longer held by this worker")
+
+    async def call_store(self, method: Callable[..., Any], *args, **kwargs) -> Any:
+        """Call an outbox or metadata cache method, off the event loop in worker mode."""
+        if self.store_thread is None:
+            return method(*args, **kwargs)
+        return await asyncio.get_running_loop().run_in_executor(self.store_thread, functools.partial(method, *args, **kwargs))
+
+    def close(self) -> None:
+        """Release resources that outlive a single pass."""
+        if self.outbox is not None:
+            counts = self.outbox.counts()
+            if counts["pending"] or counts["dead"]:
+                logger.warning(f"Webhook outbox: {counts['pending']} message(s) pending, {counts['dead']} dead letter(s)")
+            self.outbox.close()
+            self.outbox = None
+        if self.metadata is not None:
+            logger.info(f"Metadata cache: {self.metadata.hits} hits, {self.metadata.misses} misses")
+            self.metadata.close()
+            self.metadata = None
+        if self.store_thread is not None:
+            self.store_thread.shutdown()
+            self.store_thread = None
+
+async def resolve_user_metadata(context: TrackerContext, user_ids: List[str], removed_user_ids: List[str],
+                                include_avatars: bool = True,
+                                known_usernames: Optional[Dict[str, str]] = None) -> Tuple[Dict[str, str], Dict[str, Dict]]:
+    """Return usernames and avatars for `user_ids`, using the metadata cache where possible.
+
+    Removed users are rendered from the cache even when the entry has expired, their account may
+    be gone by now and the lookup would only return "Unknown". Digest messages show no pictures,
+    `include_avatars=False` skips the avatar lookups for them. Names in `known_usernames` (just
+    returned by another API) are not looked up again.
+    """
+    async def no_lookup() -> Dict:
+        return {}
+
+    concurrency = context.settings["enrichment_concurrency"]
+    wanted = set(user_ids)
+    known_usernames = {uid: name for uid, name in (known_usernames or {}).items() if uid in wanted}
+    cache = context.metadata
+    if cache is None:
+        unnamed = [uid for uid in user_ids if uid not in known_usernames]
+        usernames, avatars = await asyncio.gather(
+            fetch_usernames_batch(context.session, unnamed, concurrency) if unnamed else no_lookup(),
+            fetch_avatars_batch(context.session, user_ids, concurrency) if include_avatars else no_lookup()
+        )
+        usernames.update(known_usernames)
+        return usernames, avatars
+
+    await context.call_store(cache.put_usernames, known_usernames)
+    removed = set(removed_user_ids)
+    current = [uid for uid in user_ids if uid not in removed]
+    usernames, username_misses = await context.call_store(cache.get_usernames, [uid for uid in current if uid not in known_usernames])
+    stale_usernames, stale_username_misses = await context.call_store(
+        cache.get_usernames, [uid for uid in removed_user_ids if uid not in known_usernames], allow_stale=True)
+    usernames.update(stale_usernames)
+    usernames.update(known_usernames)
+    username_misses += stale_username_misses
+
+    # Names passed in by the caller are neither cache hits nor lookups
+    looked_up = len(user_ids) - len(known_usernames)
+    known = f", {len(known_usernames)} already known" if known_usernames else ""
+    avatars, avatar_misses = {}, []
+    if include_avatars:
+        avatars, avatar_misses = await context.call_store(cache.get_thumbnails, current)
+        stale_avatars, stale_avatar_misses = await context.call_store(cache.get_thumbnails, removed_user_ids, allow_stale=True)
+        avatars.update(stale_avatars)
+        avatar_misses += stale_avatar_misses
+        logger.info(f"Metadata cache: {looked_up - len(username_misses)}/{looked_up} usernames{known} and "
+                    f"{len(user_ids) - len(avatar_misses)}/{len(user_ids)} avatars served from cache")
+    else:
+        logger.info(f"Metadata cache: {looked_up - len(username_misses)}/{looked_up} usernames{known} served from cache")
+
+    fetched_usernames, fetched_avatars = await asyncio.gather(
+        fetch_usernames_batch(context.session, username_misses, concurrency) if username_misses else no_lookup(),
+        fetch_avatars_batch(context.session, avatar_misses, concurrency) if avatar_misses else no_lookup()
+    )
+    await context.call_store(cache.put_usernames, fetched_usernames)
+    await context.call_store(cache.put_thumbnails, fetched_avatars)
+    usernames.update(fetched_usernames)
+    avatars.update(fetched_avatars)
+    return usernames, avatars
+
+async def prefetch_metadata(context: TrackerContext, sorted_ids: Sequence[int]) -> None:
+    """Opportunistically cache metadata for a few current members that are not cached yet.
+
+    A random window of the list is checked on every run, so over time the cache covers the
+    whole list and later removals can be rendered without network calls.
+    """
+    limit = context.settings["metadata_prefetch_per_run"]
+    if context.metadata is None or limit <= 0 or not sorted_ids:
+        return
+
+    start = random.randrange(len(sorted_ids))
+    window = list(sorted_ids[start:start + METADATA_PREFETCH_SCAN_WINDOW])
+    window += list(sorted_ids[:METADATA_PREFETCH_SCAN_WINDOW - len(window)])
+    user_ids = [str(uid) for uid in await context.call_store(context.metadata.uncached, window, limit)]
+    if not user_ids:
+        return
+
+    logger.debug(f"Prefetching metadata for {len(user_ids)} users")
+    usernames, avatars = await asyncio.gather(
+        fetch_usernames_batch(context.session, user_ids, context.settings["enrichment_concurrency"]),
+        fetch_avatars_batch(context.session, user_ids, context.settings["enrichment_concurrency"])
+    )
+    await context.call_store(context.metadata.put_usernames, usernames)
+    await context.call_store(context.metadata.put_thumbnails, avatars)
+
+class NewEntryStream:
+    '''Announces new entries while the crawl is still running.
+
+    Pages are checked against the previous snapshot as they arrive, new IDs are queued and a
+    background task enriches them and sends the webhooks, so the first notification goes out long
+    before a large list is fully crawled. IDs in `already_announced` (announced by an earlier run
+    that failed before saving its snapshot) are not announced again. Debounced targets announce
+    new entries only after the flap window, `debounced` turns streaming off for them. IDs of a batch
+    that could not be announced end up in `failed` and are announced again after the crawl.
+    '''
+    def __init__(self, context: TrackerContext, target: Dict, previous: Snapshot, already_announced: Set[int],
+                 debounced: bool = False):
+        self.context = context
+        self.target = target
+        self.previous = previous
+        self.enabled = target["send_new_entries"] and bool(target["sinks"]) and not debounced
+        self.seen: Set[int] = set(already_announced)
+        self.announced: Set[int] = set()
+        self.failed: Set[int] = set()
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.total_count = None
+        self.worker = asyncio.create_task(self._run()) if self.enabled else None
+
+    async def on_page(self, page: array) -> None:
+        """Queue the IDs of a freshly fetched page that are not in the previous snapshot."""
+        if not self.enabled:
+            return
+        new_ids = []
+        for user_id in page:
+            if user_id not in self.seen and user_id not in self.previous:
+                self.seen.add(user_id)
+                new_ids.append(user_id)
+        if new_ids:
+            self.queue.put_nowait(new_ids)
+
+    async def _run(self) -> None:
+        tag = f"[{self.target['key']}]"
+        while True:
+            batch = await self.queue.get()
+            if batch is None:
+                return
+            # Merge everything that queued up meanwhile into one enrichment round
+            finished = False
+            while not self.queue.empty():
+                more = self.queue.get_nowait()
+                if more is None:
+                    finished = True
+                    break
+                batch.extend(more)
+
+            if self.total_count is None:
+                self.total_count = await fetch_relationship_count(self.context.session, self.target["target_user_id"],
+                                                                  self.target["relationship_type_endpoint"])
+            total_count = self.total_count if self.total_count is not None else len(self.previous) + len(self.seen)
+
+            try:
+                logger.info(f"{tag} Processing {len(batch)} new entries...")
+                user_ids = [str(uid) for uid in batch]
+                usernames, avatars = await resolve_user_metadata(self.context, user_ids, [],
+                                                                 include_avatars=not use_digest(self.target, len(batch)))
+                new_embed_data = prepare_embed_data(user_ids, usernames, avatars, False, total_count)
+                await process_webhooks(self.context, self.target, new_embed_data, "new")
+                self.announced.update(batch)
+            except Exception as e:
+                logger.error(f"{tag} Failed to announce new entries, retrying them after the crawl: {e}")
+                self.failed.update(uid for uid in batch if uid not in self.announced)
+
+            if finished:
+                return
+
+    async def close(self) -> None:
+        """Wait until everything queued so far has been announced."""
+        if self.worker is not None:
+            self.queue.put_nowait(None)
+            await self.worker
+
+async def announce_terminated(context: TrackerContext, target: Dict, user_ids: List[str], total_count: int) -> None:
+    """Send one summary for removed users whose accounts were banned or terminated, listed with their last known names."""
+    usernames = {}
+    if context.metadata is not None:
+        usernames, _ = await context.call_store(context.metadata.get_usernames, user_ids, allow_stale=True)
+    logger.info(f"[{target['key']}] {len(user_ids)} removed users were terminated by Roblox, sending one summary")
+    messages = build_terminated_messages(target["relationship_type_endpoint"], user_ids, usernames, total_count, APP_VERSION)
+    with METRICS.stage(target["key"], "terminated_webhooks"):
+        await send_messages(context, target, messages, "terminated")
+
+async def announce_changes(context: TrackerContext, target: Dict, added: Sequence[int], removed: Sequence[int],
+                           total_count: int) -> None:
+    """Look up usernames/avatars of added and removed users and send their notifications.
+
+    Removed users whose account was terminated are split off first and go out as one summary.
+    """
+    tag = f"[{target['key']}]"
+    if not target["sinks"]:
+        return
+    for user_ids, is_removed, webhook_type, enabled in ((added, False, "new", target["send_new_entries"]),
+                                                        (removed, True, "removed", target["send_removed_entries"])):
+        if not user_ids or not enabled:
+            continue
+        user_ids = [str(uid) for uid in user_ids]  # IDs only become strings for lookups and embeds
+        known_usernames = None
+        if is_removed and target["classify_removed"]:
+            with METRICS.stage(target["key"], "classify"):
+                known_usernames, terminated = await classify_removed_users(context.session, user_ids,
+                                                                           context.settings["enrichment_concurrency"])
+            if terminated:
+                await announce_terminated(context, target, terminated, total_count)
+                terminated = set(terminated)
+                user_ids = [uid for uid in user_ids if uid not in terminated]
+                if not user_ids:
+                    continue
+        logger.info(f"{tag} Fetching additional data for {len(user_ids)} users...")
+        with METRICS.stage(target["key"], f"{webhook_type}_metadata"):
+            usernames, avatars = await resolve_user_metadata(context, user_ids, user_ids if is_removed else [],
+                                                             include_avatars=not use_digest(target, len(user_ids)),
+                                                             known_usernames=known_usernames)
+
+        logger.info(f"{tag} Processing {len(user_ids)} {webhook_type} entries...")
+        embed_data = prepare_embed_data(user_ids, usernames, avatars, is_removed, total_count)
+        with METRICS.stage(target["key"], f"{webhook_type}_webhooks"):
+            await process_webhooks(context, target, embed_data, webhook_type)
+
+async def announce_debounced_changes(context: TrackerContext, target: Dict, state: Dict, added: Sequence[int],
+                                     removed: Sequence[int], total_count: int) -> None:
+    """Add this run's changes to the pending ones in `state` and announce those that outlasted the flap window."""
+    flaps = FlapFilter(state, target["flap_window_minutes"] * 60, target["flap_max_hold_hours"] * 3600, time.time())
+    flaps.observe(added, removed)
+    due_added, due_removed = flaps.due()
+    flaps.save(state)
+    if added or removed or due_added or due_removed:
+        logger.info(f"[{target['key']}] Flap window: {flaps.cancelled} change(s) cancelled out, announcing "
+                    f"{len(due_added)} new and {len(due_removed)} removed, {len(flaps.pending)} still pending")
+    await announce_changes(context, target, due_added, due_removed, total_count)
+
+async def track_target(context: TrackerContext, target: Dict) -> int:
+    """Fetch one target's relationship list, report changes and update its state file.
+
+    New entries are announced while pages are still arriving, removals once the crawl is complete.
+    Returns the number of detected changes.
+    """
+    tag = f"[{target['key']}]"
+    session = context.session
+
+    # Load previous data, the snapshot is closed before it gets replaced
+    with METRICS.stage(target["key"], "load"):
+        try:
+            migrate_text_snapshot(target["local_data_file"], target["snapshot_file"])
+            if context.snapshots is not None:
+                previous_snapshot = context.snapshots.load(target["snapshot_file"])
+            else:
+                previous_snapshot = load_snapshot(target["snapshot_file"])
+        except (SnapshotError, OSError, ValueError) as e:
+            raise FetchError(f"Cannot load previous data: {e}") from e
+        state = read_target_state(target["state_file"])
+
+    with previous_snapshot:
+        if target["enable_journal"]:
+            try:
+                dropped = drop_unsaved_changes(target["local_data_file"], state.get("journal_records"), previous_snapshot)
+                if dropped:
+                    logger.warning(f"{tag} Dropped {dropped} journal record(s) of a run whose snapshot was not saved")
+            except OSError as e:
+                logger.error(f"{tag} Failed to check the change journal: {e}")
+        with METRICS.stage(target["key"], "probe"):
+            unchanged, first_page, probed_count = await probe_target(session, target, previous_snapshot, state)
+        if unchanged:
+            logger.info(f"{tag} Count and first page unchanged, skipping the crawl")
+            state["runs_since_full_sweep"] = state.get("runs_since_full_sweep", 0) + 1
+            if state.get("flap_pending"):
+                # Held back changes that became due still have to be announced
+                await announce_debounced_changes(context, target, state, array('q'), array('q'), len(previous_snapshot))
+            write_target_state(target["state_file"], state)
+            return 0
+
+        # There is nothing to debounce against on the first run, everything is new
+        debounced = target["flap_window_minutes"] > 0 and len(previous_snapshot) > 0
+        stream = NewEntryStream(context, target, previous_snapshot, set(state.get("announced_ids", [])), debounced)
+        try:
+            # Fetch current user data and calculate changes
+            logger.info(f"{tag} Starting data collection...")
+            with METRICS.stage(target["key"], "crawl"):
+                current_sorted_ids, full_sweep = await collect_current_ids(session, target, previous_snapshot,
+                                                                           state, stream.on_page, probed_count, first_page)
+        finally:
+            with METRICS.stage(target["key"], "new_webhooks"):
+                await stream.close()
+            if stream.announced:
+                # Remember what was announced in case the snapshot does not get saved this run
+                state["announced_ids"] = sorted(set(state.get("announced_ids", [])) | stream.announced)
+                write_target_state(target["state_file"], state)
+        logger.info(f"{tag} Found {len(current_sorted_ids)} current users")
+        with METRICS.stage(target["key"], "diff"):
+            added, removed = diff_sorted(previous_snapshot.ids, current_sorted_ids)
+    total_count = len(current_sorted_ids)
+
+    logger.info(f"{tag} Changes detected - New: {len(added)}, Removed: {len(removed)}")
+
+    if debounced:
+        await announce_debounced_changes(context, target, state, added, removed, total_count)
+    else:
+        if state.get("flap_pending"):
+            # The flap window was turned off, whatever it still held back is announced now
+            await announce_debounced_changes(context, target, state, array('q'), array('q'), total_count)
+        # New entries were already announced during the crawl, only removals and failed batches are left
+        retry = array('q', [uid for uid in added if uid in stream.failed])
+        if retry or removed:
+            await announce_changes(context, target, retry, removed, total_count)
+        elif not stream.announced:
+            logger.info(f"{tag} No webhooks needed or webhooks disabled")
+
+    with METRICS.stage(target["key"], "prefetch"):
+        await prefetch_metadata(context, current_sorted_ids)
+
+    # A worker that lost the unit meanwhile leaves journal and snapshot to the one that took it over
+    context.check_lease(target)
+
+    # Record the changes in the journal, this has to happen before the snapshot is replaced
+    run_timestamp = int(time.time())
+    journal_records = None
+    if target["enable_journal"]:
+        with METRICS.stage(target["key"], "journal"):
+            try:
+                journal_records = append_changes(target["local_data_file"], target["snapshot_file"], run_timestamp,
+                               int(target["target_user_id"]), target["relationship_type_endpoint"], added, removed)
+            except OSError as e:
+                logger.error(f"{tag} Failed to append to the change journal: {e}")
+
+    # Update snapshot
+    snapshot_saved = True
+    if added or removed:
+        logger.info(f"{tag} Updating snapshot...")
+        with METRICS.stage(target["key"], "snapshot"):
+            try:
+                write_snapshot(target["snapshot_file"], current_sorted_ids)
+                if context.snapshots is not None:
+                    context.snapshots.store(target["snapshot_file"], current_sorted_ids)
+                logger.info(f"{tag} Snapshot updated successfully")
+                if target["enable_journal"]:
+                    maybe_checkpoint(target["local_data_file"], target["snapshot_file"], run_timestamp)
+            except OSError as e:
+                snapshot_saved = False
+                logger.error(f"{tag} Failed to update snapshot: {e}")
+    else:
+        logger.info(f"{tag} No changes detected, skipping data file update")
+
+    state["runs_since_full_sweep"] = 0 if full_sweep else state.get("runs_since_full_sweep", 0) + 1
+    if snapshot_saved:
+        state.pop("announced_ids", None)
+        if journal_records is not None:
+            # Records past this count belong to a run that did not save its snapshot
+            state["journal_records"] = journal_records
+    # Only a page seen before a successful pass may let the next probe skip the crawl
+    if snapshot_saved and first_page is not None:
+        state["probe_first_page"] = first_page[0].tolist()
+    else:
+        state.pop("probe_first_page", None)
+    write_target_state(target["state_file"], state)
+
+    return len(added) + len(removed)
+
+async def run_analytics(context: TrackerContext, group: Dict) -> None:
+    """Join the latest friends/followers/followings of a user and report how the derived sets changed.
+
+    The first run only records a baseline. Later runs send the users who entered or left each set
+    as an "analytics" webhook and every run rewrites the JSON export.
+    """
+    tag = f"[{group['key']}]"
+    lists = {}
+    for relationship, path in group["snapshot_files"].items():
+        lists[relationship] = context.snapshots.load(path).ids if context.snapshots is not None else read_snapshot_ids(path)
+    index = RelationshipIndex(lists["friends"], lists["followers"], lists["followings"])
+    sets = index.derived_sets()
+    previous = load_previous_sets(group["state_prefix"])
+    deltas = compute_deltas(previous, sets) if previous is not None else None
+
+    if deltas is None:
+        sizes = ", ".join(f"{name} {len(ids)}" for name, ids in sets.items())
+        logger.info(f"{tag} Recorded the analytics baseline: {sizes}")
+    else:
+        counts = ", ".join(f"{name} +{len(delta['added'])}/-{len(delta['removed'])}" for name, delta in deltas.items())
+        logger.info(f"{tag} Analytics changes: {counts}")
+
+    changed = deltas is not None and any(delta["added"] or delta["removed"] for delta in deltas.values())
+    if changed and group["analytics_webhooks"] and group["sinks"]:
+        str_deltas = {name: {direction: [str(uid) for uid in ids] for direction, ids in delta.items()}
+                      for name, delta in deltas.items()}
+        listed = sorted({uid for delta in str_deltas.values() for ids in delta.values() for uid in ids[:ANALYTICS_MAX_LISTED_USERS]})
+        usernames, _ = await resolve_user_metadata(context, listed, [], include_avatars=False)
+        messages = build_analytics_messages(str_deltas, usernames, {name: len(ids) for name, ids in sets.items()}, APP_VERSION)
+        await send_messages(context, group, messages, "analytics")
+
+    save_sets(group["state_prefix"], sets)
+    if group["export_file"]:
+        write_export(group["export_file"], build_export(group["target_user_id"], index, sets, deltas, int(time.time())))
+
+async def update_analytics(context: TrackerContext, target: Dict, changes: Optional[int]) -> None:
+    """Run the analytics a target feeds once all three lists of the user were read, and after every later change."""
+    group = context.analytics_by_target.get(target["key"])
+    if group is None or changes is None:
+        return
+    ready = context.analytics_ready.setdefault(group["key"], set())
+    complete_before = len(ready) == len(group["target_keys"])
+    ready.add(target["relationship_type_endpoint"])
+    if len(ready) < len(group["target_keys"]) or (complete_before and not changes):
+        return
+
+    async with context.analytics_locks.setdefault(group["key"], asyncio.Lock()):
+        try:
+            with METRICS.stage(group["key"], "analytics"):
+                await run_analytics(context, group)
+        except Exception as e:
+            logger.error(f"[{group['key']}] Analytics failed: {e}")
+
+async def track_target_safely(context: TrackerContext, target: Dict) -> Optional[int]:
+    """Run `track_target`, logging failures instead of raising. Returns None if the target failed."""
+    started = time.perf_counter()
+    changes = None
+    try:
+        changes = await track_target(context, target)
+    except FetchError as e:
+        logger.error(f"[{target['key']}] Skipping target: {e}")
+    except LeaseLost as e:
+        logger.error(f"[{target['key']}] Stopped: {e}")
+    except Exception as e:
+        logger.error(f"[{target['key']}] Unexpected error while tracking target: {e}")
+    METRICS.record_target(target["key"], changes, time.perf_counter() - started)
+    await update_analytics(context, target, changes)
+    return changes
+
+async def write_run_report(context: TrackerContext) -> None:
+    """Write the metrics collected so far to the JSON report and the Prometheus text file."""
+    settings = context.settings
+    outbox = await context.call_store(context.outbox.counts) if context.outbox is not None else {"pending": 0, "dead": 0}
+    METRICS.write_reports(settings["metrics_report_file"], settings["metrics_prometheus_file"], {
+        "version": APP_VERSION,
+        "json_backend": JSON_BACKEND,
+        "rate_limiters": {host: bucket.stats() for host, bucket in sorted(RATE_LIMITERS.items())},
+        "outbox": outbox,
+    }, {"outbox_pending_messages": outbox["pending"], "outbox_dead_letters": outbox["dead"]})
+
+async def run_targets(context: TrackerContext) -> List[str]:
+    """Track every configured target concurrently and return the keys of the failed ones."""
+    semaphore = asyncio.Semaphore(context.settings["max_concurrent_targets"])
+    failed = []
+
+    async def guarded(target: Dict) -> None:
+        async with semaphore:
+            if await track_target_safely(context, target) is None:
+                failed.append(target["key"])
+
+    await asyncio.gather(*(guarded(target) for target in context.settings["targets"]))
+    return failed
+
+def next_poll_interval(interval: float, changes: Optional[int], settings: Dict) -> float:
+    """Poll faster after a pass with changes, back off while a target stays quiet."""
+    if changes:
+        interval *= WATCH_SPEEDUP_FACTOR
+    elif changes == 0:
+        interval *= WATCH_BACKOFF_FACTOR
+    # A failed pass (None) keeps the interval, the rate limiter already handles backoff
+    return min(settings["watch_max_interval"], max(settings["watch_min_interval"], interval))
+
+def with_jitter(interval: float, jitter: float) -> float:
+    """Spread polls randomly so targets do not fire in lockstep."""
+    return interval * random.uniform(1 - jitter, 1 + jitter)
+
+def next_poll_delay(settings: Dict, targets: List[Dict], interval: float) -> float:
+    """Jittered wait before the next pass, shortened when changes held back for a target become due earlier."""
+    delay = with_jitter(interval, settings["watch_jitter"])
+    for target in targets:
+        flap_next_due = read_target_state(target["state_file"]).get("flap_next_due", 0)
+        if flap_next_due:
+            # Come back when held back changes are due instead of after a long quiet backoff
+            delay = min(delay, max(settings["watch_min_interval"], flap_next_due - time.time()))
+    return delay
+
+def install_stop_handlers(stop_event: asyncio.Event) -> None:
+    """Set `stop_event` on SIGTERM/SIGINT."""
+    loop = asyncio.get_running_loop()
+    for signal_number in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(signal_number, stop_event.set)
+        except (NotImplementedError, RuntimeError):
+            # Windows has no loop signal handlers
+            signal.signal(signal_number, lambda *_: loop.call_soon_threadsafe(stop_event.set))
+
+async def watch_targets(context: TrackerContext, stop_event: asyncio.Event) -> None:
+    """Poll every target on its own adaptive schedule until `stop_event` is set.
+
+    A pass that is already running when the stop is requested is finished, so snapshots,
+    journal and webhooks stay consistent.
+    """
+    settings = context.settings
+    semaphore = asyncio.Semaphore(settings["max_concurrent_targets"])
+
+    async def sleep_or_stop(delay: float) -> None:
+        try:
+            await asyncio.wait_for(stop_event.wait(), timeout=delay)
+        except asyncio.TimeoutError:
+            pass
+
+    async def schedule(target: Dict) -> None:
+        interval = settings["watch_min_interval"]
+        # Stagger the first passes a little so targets do not start in lockstep
+        await sleep_or_stop(random.uniform(0, settings["watch_min_interval"] * settings["watch_jitter"]))
+
+        while not stop_event.is_set():
+            async with semaphore:
+                if stop_event.is_set():
+                    break
+                await drain_outbox(context, target["key"])
+                changes = await track_target_safely(context, target)
+
+            interval = next_poll_interval(interval, changes, settings)
+            delay = next_poll_delay(settings, [target], interval)
+            logger.debug(f"[{target['key']}] Next poll in {delay:.0f}s")
+            write_last_run_time(settings["last_run_time_file"])
+            await write_run_report(context)
+            await sleep_or_stop(delay)
+
+    logger.info(f"Watching {len(settings['targets'])} target(s), polling every "
+                f"{settings['watch_min_interval']:.0f}-{settings['watch_max_interval']:.0f}s")
+    await drain_outbox(context)
+    await asyncio.gather(*(schedule(target) for target in settings["targets"]))
+    logger.info("Watch mode stopped")
+
+async def run_tracker(watch: bool = False, settings: Optional[Dict] = None) -> None:
+    """Main async function to run the tracker, once or continuously in watch mode.
+
+    `settings` defaults to the validated contents of config.json, the benchmark passes its own.
+    """
+    if settings is None:
+        settings = load_settings()
+        validate_settings(settings)
+    configure_rate_limiters(settings["rate_limits"])
+    configure_api_base_urls(settings["api_base_urls"])
+    METRICS.reset()
+
+    # Ensure required files exist
+    ensure_files_exist([settings["last_run_time_file"]])
+
+    if SHOW_LOADED_SETTINGS:
+        logger.info("=== Configuration ===")
+        for target in settings["targets"]:
+            logger.info(f"Tracking: {target['relationship_type_endpoint']} of user {target['target_user_id']}")
+            logger.info(f"  Sinks: {', '.join(spec['type'] for spec in target['sinks']) or 'none'}")
+            logger.info(f"  New entries: {'✓' if target['send_new_entries'] else '✗'} | "
+                       f"Removed entries: {'✓' if target['send_removed_entries'] else '✗'}")
+
+    # Create one shared session with connection limits for every target
+    connector = aiohttp.TCPConnector(limit=MAX_CONCURRENT_REQUESTS, limit_per_host=5)
+
+    async with aiohttp.ClientSession(connector=connector) as session:
+        context = TrackerContext(session, settings, keep_snapshots_in_memory=watch)
+        try:
+            if watch:
+                stop_event = asyncio.Event()
+                install_stop_handlers(stop_event)
+                query_server = None
+                if settings["query_server"]:
+                    query_server = QueryServer(settings["targets"])
+                    await query_server.start(settings["query_server_host"], settings["query_server_port"])
+                try:
+                    await watch_targets(context, stop_event)
+                finally:
+                    if query_server is not None:
+                        await query_server.stop()
+                await context.sinks.join()
+                log_rate_limiter_stats()
+                return
+
+            logger.info(f"Tracking {len(settings['targets'])} target(s), up to {settings['max_concurrent_targets']} at once")
+            await drain_outbox(context)
+            failed = await run_targets(context)
+            await context.sinks.join()
+
+            # Update last run time
+            write_last_run_time(settings["last_run_time_file"])
+            await write_run_report(context)
+            log_rate_limiter_stats()
+        finally:
+            await context.sinks.close()
+            context.close()
+
+    if failed:
+        raise SystemExit(f"Tracker run finished with {len(failed)} failed target(s): {', '.join(failed)}")
+    logger.info("Tracker run completed successfully")
+
+async def renew_lease(store: LeaseStore, lease: Lease) -> None:
+    """Extend a lease every third of its duration until cancelled or lost."""
+    while True:
+        await asyncio.sleep(store.lease_seconds / 3)
+        try:
+            if not await asyncio.to_thread(store.renew, lease):
+                logger.error(f"[{lease.unit_key}] Lease taken over by another worker, stopping before anything else is sent")
+                return
+        except sqlite3.Error as e:
+            # The lease runs out on its own if this keeps failing
+            logger.warning(f"[{lease.unit_key}] Could not renew the lease: {e}")
+
+async def track_unit(context: TrackerContext, store: LeaseStore, lease: Lease, targets: List[Dict],
+                     semaphore: asyncio.Semaphore) -> None:
+    """Track the targets of a leased unit concurrently while renewing the lease, then hand the unit back with its next run time."""
+    settings = context.settings
+    renewal = asyncio.create_task(renew_lease(store, lease))
+    results: List[Optional[int]] = []
+
+    async def guarded(target: Dict) -> Optional[int]:
+        async with semaphore:
+            if not lease.held():
+                return None  # Counts as a failed pass, the unit is not released with a backoff
+            return await track_target_safely(context, target)
+
+    try:
+        keys = [target["key"] for target in targets]
+        keys += sorted({context.analytics_by_target[key]["key"] for key in keys if key in context.analytics_by_target})
+        for key in keys:
+            # Retried messages are claimed in the outbox, no other worker picks them up while they are sent
+            await drain_outbox(context, key)
+        results = await asyncio.gather(*(guarded(target) for target in targets))
+        # The lease also covers the delivery, so the next holder does not find these messages still pending
+        await wait_for_deliveries(context, keys)
+    finally:
+        renewal.cancel()
+        context.leases.pop(lease.unit_key, None)
+
+        changes = sum(results) if len(results) == len(targets) and None not in results else None
+        interval = next_poll_interval(lease.interval or settings["watch_min_interval"], changes, settings)
+        delay = next_poll_delay(settings, targets, interval)
+        try:
+            if await asyncio.to_thread(store.release, lease, time.time() + delay, interval, changes):
+                logger.debug(f"[{lease.unit_key}] Unit released, next pass in {delay:.0f}s")
+            else:
+                logger.warning(f"[{lease.unit_key}] Unit was taken over by another worker during this pass")
+        except sqlite3.Error as e:
+            logger.error(f"[{lease.unit_key}] Could not release the unit, it is picked up again once the lease expired: {e}")
+        write_last_run_time(settings["last_run_time_file"])
+        await write_run_report(context)
+
+async def run_worker(settings: Optional[Dict] = None, worker_id: Optional[str] = None,
+                     stop_event: Optional[asyncio.Event] = None) -> None:
+    """Track targets together with other workers sharing the lease file, until stopped.
+
+    Each tracked user is one unit. A worker leases up to `max_concurrent_targets` due units at a
+    time, and units of a worker that crashed are taken over once its lease expired. Without a
+    `stop_event` the worker stops on SIGTERM/SIGINT.
+    """
+    if settings is None:
+        settings = load_settings()
+        validate_settings(settings)
+    configure_rate_limiters(settings["rate_limits"])
+    configure_api_base_urls(settings["api_base_urls"])
+    METRICS.reset()
+    ensure_files_exist([settings["last_run_time_file"]])
+
+    units: Dict[str, List[Dict]] = {}
+    for target in settings["targets"]:
+        units.setdefault(target["target_user_id"], []).append(target)
+    store = LeaseStore(settings["coordinator_file"], worker_id or default_worker_id(), settings["lease_seconds"])
+    store.sync_units(units)
+
+    if stop_event is None:
+        stop_event = asyncio.Event()
+        install_stop_handlers(stop_event)
+    stopped = asyncio.create_task(stop_event.wait())
+    running: Set[asyncio.Task] = set()
+    # Shared by all units, so no more than `max_concurrent_targets` relationships are crawled at once
+    semaphore = asyncio.Semaphore(settings["max_concurrent_targets"])
+    connector = aiohttp.TCPConnector(limit=MAX_CONCURRENT_REQUESTS, limit_per_host=5)
+
+    async with aiohttp.ClientSession(connector=connector) as session:
+        # Snapshots are not kept in memory, another worker may have replaced them since this one ran a unit
+        context = TrackerContext(session, settings, worker_id=store.worker_id)
+        logger.info(f"Worker {store.worker_id} sharing {len(units)} unit(s) through {store.path}, "
+                    f"up to {settings['max_concurrent_targets']} at once")
+        try:
+            while not stop_event.is_set():
+                try:
+                    # The lease file calls run in a thread, a locked file must not stall the renewals of running units
+                    leases = await asyncio.to_thread(store.claim, settings["max_concurrent_targets"] - len(running))
+                    next_due = await asyncio.to_thread(store.next_due)
+                except sqlite3.Error as e:
+                    logger.warning(f"Could not read the lease file: {e}")
+                    leases, next_due = [], None
+
+                for lease in leases:
+                    if lease.unit_key not in units:
+                        logger.warning(f"[{lease.unit_key}] Unit is not in this worker's config, do all workers use the same one?")
+                        await asyncio.to_thread(store.release, lease, time.time() + settings["watch_min_interval"], lease.interval, None)
+                        continue
+                    context.leases[lease.unit_key] = lease
+                    task = asyncio.create_task(track_unit(context, store, lease, units[lease.unit_key], semaphore))
+                    running.add(task)
+                    task.add_done_callback(running.discard)
+
+                delay = WORKER_POLL_INTERVAL if next_due is None else min(WORKER_POLL_INTERVAL, max(1.0, next_due - time.time()))
+                await asyncio.wait({stopped, *running}, timeout=delay, return_when=asyncio.FIRST_COMPLETED)
+
+            # Passes already running are finished and their units released
+            await asyncio.gather(*running)
+            await context.sinks.join()
+            log_rate_limiter_stats()
+        finally:
+            stopped.cancel()
+            await context.sinks.close()
+            context.close()
+            store.close()
+    logger.info(f"Worker {store.worker_id} stopped")
+
+def worker_process_main() -> None:
+    """Entry point of a worker process started by `run_worker_processes`."""
+    try:
+        asyncio.run(run_worker())
+    except KeyboardInterrupt:
+        pass
+
+def run_worker_processes(count: int) -> None:
+    """Run `count` workers as separate processes on this machine and wait for them, stopping them on SIGTERM."""
+    spawn = multiprocessing.get_context("spawn")
+    processes = [spawn.Process(target=worker_process_main, name=f"worker-{number}") for number in range(count)]
+    for process in processes:
+        process.start()
+    # Ctrl+C reaches every process of the terminal, SIGTERM only this one
+    signal.signal(signal.SIGTERM, lambda *_: [process.terminate() for process in processes])
+    for process in processes:
+        try:
+            process.join()
+        except KeyboardInterrupt:
+            process.join()
+
+async def run_query_server(settings: Optional[Dict] = None) -> None:
+    """Serve the query API over the saved lists until stopped, without tracking (e.g. when the tracker runs from cron)."""
+    if settings is None:
+        settings = load_settings()
+        validate_settings(settings)
+    stop_event = asyncio.Event()
+    install_stop_handlers(stop_event)
+    query_server = QueryServer(settings["targets"])
+    await query_server.start(settings["query_server_host"], settings["query_server_port"])
+    try:
+        await stop_event.wait()
+    finally:
+        await query_server.stop()
+
+def parse_arguments(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """Parse command line options."""
+    parser = argparse.ArgumentParser(description="Track Roblox friends, followers and followings.")
+    parser.add_argument("--watch", action="store_true",
+                        help="Keep running and poll every target on an adaptive schedule until stopped")
+    parser.add_argument("--serve", action="store_true",
+                        help="Only run the read-only query API over the saved lists, without tracking")
+    parser.add_argument("--worker", action="store_true",
+                        help="Keep running as one of several workers that share the targets through the lease file")
+    parser.add_argument("--processes", type=int, default=1,
+                        help="With --worker: number of worker processes to start on this machine (default: 1)")
+    return parser.parse_args(argv)
+
+def main():
+    """Main synchronous entry point."""
+    args = parse_arguments()
+    try:
+        if args.worker and args.processes > 1:
+            run_worker_processes(args.processes)
+        elif args.worker:
+            asyncio.run(run_worker())
+        else:
+            asyncio.run(run_query_server() if args.serve else run_tracker(watch=args.watch))
+    except KeyboardInterrupt:
+        logger.info("Script interrupted by user")
+    except Exception as e:
+        logger.error(f"Unexpected error: {e}")
+        raise SystemExit("Script failed due to unexpected error") from e
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+# pylint: disable=W1203 # Use lazy % formatting...
+# pylint: disable=C0301 # Line too long
+'''Disk-backed cache of usernames and avatar URLs keyed by user ID.
+
+Usernames and thumbnails expire separately and the least recently used rows are evicted as soon as
+a write grows the cache past its size limit. Expired rows are still returned on request: for users
+who were removed (and may no longer exist) an old name is better than "Unknown".
+'''
+import os
+import time
+import sqlite3
+import logging
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+logger = logging.getLogger("RobloxTracker")
+
+SQLITE_MAX_VARIABLES = 500  # Stay well below SQLITE_MAX_VARIABLE_NUMBER of older SQLite builds
+
+class MetadataCache:
+    '''SQLite table of user ID -> username, avatar URL and headshot URL'''
+    def __init__(self, path: str, username_ttl: float, thumbnail_ttl: float, max_entries: int, shared: bool = False):
+        self.path = path
+        self.username_ttl = username_ttl
+        self.thumbnail_ttl = thumbnail_ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # `shared`: several workers use the file, possibly across machines where WAL does not work. They
+        # call the methods from one background thread instead of the event loop.
+        self.connection = sqlite3.connect(path, check_same_thread=not shared)
+        self.connection.execute("PRAGMA journal_mode=DELETE" if shared else "PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS users (
+                user_id INTEGER PRIMARY KEY,
+                username TEXT,
+                username_updated REAL,
+                avatar_url TEXT,
+                headshot_url TEXT,
+                thumbnails_updated REAL,
+                last_access REAL NOT NULL
+            )""")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS users_last_access ON users (last_access)")
+        self.connection.commit()
+        # Upper bound of the row count (inserts may update existing rows), the rows are only counted
+        # again once it passes the limit. Set by evict().
+        self.size_bound = 0
+        self.evict()
+
+    def close(self) -> None:
+        """Close the database, rows above the limit were already evicted after each write."""
+        self.connection.close()
+
+    def _select(self, columns: str, user_ids: Sequence[int]) -> Iterable[Tuple]:
+        for start in range(0, len(user_ids), SQLITE_MAX_VARIABLES):
+            chunk = user_ids[start:start + SQLITE_MAX_VARIABLES]
+            placeholders = ",".join("?" * len(chunk))
+            yield from self.connection.execute(
+                f"SELECT user_id, {columns} FROM users WHERE user_id IN ({placeholders})", list(chunk))
+
+    def _touch(self, user_ids: Sequence[int]) -> None:
+        now = time.time()
+        self.connection.executemany("UPDATE users SET last_access = ? WHERE user_id = ?",
+                                    [(now, user_id) for user_id in user_ids])
+        self.connection.commit()
+
+    def get_usernames(self, user_ids: Sequence[str], allow_stale: bool = False) -> Tuple[Dict[str, str], List[str]]:
+        """Return (cached usernames, IDs that still need a lookup)."""
+        cutoff = time.time() - self.username_ttl
+        found = {}
+        for user_id, username, updated in self._select("username, username_updated", [int(uid) for uid in user_ids]):
+            if username and updated is not None and (allow_stale or updated >= cutoff):
+                found[str(user_id)] = username
+        self._touch([int(uid) for uid in found])
+        missing = [uid for uid in user_ids if uid not in found]
+        self.hits += len(found)
+        self.misses += len(missing)
+        return found, missing
+
+    def get_thumbnails(self, user_ids: Sequence[str], allow_stale: bool = False) -> Tuple[Dict[str, Dict[str, str]], List[str]]:
+        """Return (cached avatar/headshot URLs, IDs that still need a lookup)."""
+        cutoff = time.time() - self.thumbnail_ttl
+        found = {}
+        for user_id, avatar_url, headshot_url, updated in self._select("avatar_url, headshot_url, thumbnails_updated",
+                                                                       [int(uid) for uid in user_ids]):
+            if (avatar_url or headshot_url) and updated is not None and (allow_stale or updated >= cutoff):
+                found[str(user_id)] = {"avatar_url": avatar_url, "headshot_url": headshot_url}
+        self._touch([int(uid) for uid in found])
+        missing = [uid for uid in user_ids if uid not in found]
+        self.hits += len(found)
+        self.misses += len(missing)
+        return found, missing
+
+    def put_usernames(self, usernames: Dict[str, str]) -> None:
+        """Store freshly fetched usernames."""
+        now = time.time()
+        self.connection.executemany("""
+            INSERT INTO users (user_id, username, username_updated, last_access) VALUES (?, ?, ?, ?)
+            ON CONFLICT (user_id) DO UPDATE SET username = excluded.username,
+                username_updated = excluded.username_updated, last_access = excluded.last_access
+            """, [(int(user_id), username, now, now) for user_id, username in usernames.items()])
+        self.connection.commit()
+        self._grew(len(usernames))
+
+    def put_thumbnails(self, thumbnails: Dict[str, Dict[str, str]]) -> None:
+        """Store freshly fetched avatar/headshot URLs, entries without any URL are skipped."""
+        now = time.time()
+        rows = [(int(user_id), urls.get("avatar_url"), urls.get("headshot_url"), now, now)
+                for user_id, urls in thumbnails.items() if urls.get("avatar_url") or urls.get("headshot_url")]
+        self.connection.executemany("""
+            INSERT INTO users (user_id, avatar_url, headshot_url, thumbnails_updated, last_access) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (user_id) DO UPDATE SET avatar_url = excluded.avatar_url, headshot_url = excluded.headshot_url,
+                thumbnails_updated = excluded.thumbnails_updated, last_access = excluded.last_access
+            """, rows)
+        self.connection.commit()
+        self._grew(len(rows))
+
+    def _grew(self, inserted: int) -> None:
+        self.size_bound += inserted
+        if self.size_bound > self.max_entries:
+            self.evict()
+
+    def uncached(self, user_ids: Sequence[int], limit: int) -> List[int]:
+        """Return up to `limit` IDs from `user_ids` that have no cached username yet."""
+        if limit <= 0 or not user_ids:
+            return []
+        cached = {row[0] for row in self._select("username", list(user_ids)) if row[1]}
+        return [user_id for user_id in user_ids if user_id not in cached][:limit]
+
+    def evict(self) -> int:
+        """Delete the least recently used rows above `max_entries`, returns the number deleted."""
+        count = self.connection.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+        excess = count - self.max_entries
+        if excess <= 0:
+            self.size_bound = count
+            return 0
+        self.connection.execute("""
+            DELETE FROM users WHERE user_id IN (
+                SELECT user_id FROM users ORDER BY last_access ASC LIMIT ?
+            )""", (excess,))
+        self.connection.commit()
+        self.size_bound = self.max_entries
+        logger.info(f"Metadata cache: evicted {excess} least recently used entries")
+        return excess
@@ -0,0 +1,333 @@
+# pylint: disable=W1203 # Use lazy % formatting...
+# pylint: disable=C0301 # Line too long
+'''Per-endpoint request metrics, stage timings and the run report.
+
+A single process-wide `METRICS` registry is filled by the HTTP helpers and the tracking loop. At the
+end of a run (and after every pass in watch mode) it is written as a JSON report and optionally as a
+Prometheus text file for node_exporter's textfile collector. Counters are cumulative for the lifetime
+of the process, stage durations and target results describe the latest pass of each target.
+'''
+import os
+import re
+import json
+import time
+import logging
+import tempfile
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+logger = logging.getLogger("RobloxTracker")
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)  # Seconds, upper bounds
+PROMETHEUS_PREFIX = "roblox_tracker"
+NUMERIC_SEGMENT = re.compile(r"/\d+(?=/|$)")
+
+def endpoint_label(url: str) -> str:
+    """Group URLs by endpoint: host and path with user IDs replaced, query dropped."""
+    parts = urlsplit(url)
+    path = parts.path
+    if "/webhooks/" in path:
+        path = path[:path.index("/webhooks/")] + "/webhooks/{id}"  # Never leak webhook tokens into reports
+    return f"{parts.netloc}{NUMERIC_SEGMENT.sub('/{id}', path)}"
+
+class Histogram:
+    '''Cumulative histogram with fixed buckets, Prometheus style'''
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        """Count one value in the first bucket it fits."""
+        self.count += 1
+        self.sum += value
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+
+    def cumulative(self) -> List[int]:
+        """Number of observations <= each bucket bound."""
+        total = 0
+        result = []
+        for count in self.counts:
+            total += count
+            result.append(total)
+        return result
+
+    def to_dict(self) -> Dict:
+        """Count, sum and cumulative bucket counts for the run report."""
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "buckets": {f"{bound:g}": count for bound, count in zip(self.buckets, self.cumulative())},
+        }
+
+class EndpointMetrics:
+    '''Counters of one endpoint'''
+    def __init__(self):
+        self.requests = 0
+        self.responses: Dict[int, int] = {}
+        self.retries = 0
+        self.throttled = 0
+        self.timeouts = 0
+        self.errors = 0
+        self.bytes_received = 0
+        self.limiter_wait = 0.0
+        self.latency = Histogram()
+
+    def to_dict(self) -> Dict:
+        """Counters of the endpoint for the run report."""
+        return {
+            "requests": self.requests,
+            "responses": {str(status): count for status, count in sorted(self.responses.items())},
+            "retries": self.retries,
+            "throttled": self.throttled,
+            "timeouts": self.timeouts,
+            "errors": self.errors,
+            "bytes_received": self.bytes_received,
+            "limiter_wait_seconds": round(self.limiter_wait, 6),
+            "latency_seconds": self.latency.to_dict(),
+        }
+
+class SinkMetrics:
+    '''Counters and queue depth of one notification sink'''
+    COUNTERS = ("queued", "delivered", "failed", "rejected", "skipped", "overflow", "dropped")
+
+    def __init__(self):
+        self.counts = {counter: 0 for counter in self.COUNTERS}
+        self.send_seconds = 0.0
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+
+    def to_dict(self) -> Dict:
+        """Counters and queue depth of the sink for the run report."""
+        return {**self.counts, "send_seconds": round(self.send_seconds, 6),
+                "queue_depth": self.queue_depth, "max_queue_depth": self.max_queue_depth}
+
+class RunMetrics:
+    '''Registry of endpoint counters, stage durations and target results'''
+    def __init__(self):
+        self.reset()
+
+    def reset(self) -> None:
+        """Start from zero, called when a new run begins."""
+        self.started = time.time()
+        self.endpoints: Dict[str, EndpointMetrics] = {}
+        self.stages: Dict[str, Dict[str, float]] = {}
+        self.targets: Dict[str, Dict] = {}
+        self.webhooks: Dict[Tuple[str, str, str, bool], int] = {}  # (target, platform, type, delivered) -> count
+        self.sinks: Dict[str, SinkMetrics] = {}
+
+    def endpoint(self, url_or_label: str) -> EndpointMetrics:
+        """Counters of the endpoint a URL belongs to, created on first use."""
+        label = endpoint_label(url_or_label) if "://" in url_or_label else url_or_label
+        if label not in self.endpoints:
+            self.endpoints[label] = EndpointMetrics()
+        return self.endpoints[label]
+
+    def record_response(self, url: str, status: int, latency: float, size: int = 0) -> None:
+        """Count one HTTP response."""
+        metrics = self.endpoint(url)
+        metrics.requests += 1
+        metrics.responses[status] = metrics.responses.get(status, 0) + 1
+        metrics.bytes_received += size
+        metrics.latency.observe(latency)
+        if status == 429:
+            metrics.throttled += 1
+
+    def record_failure(self, url: str, latency: float, timeout: bool) -> None:
+        """Count a request that got no response (timeout or connection error)."""
+        metrics = self.endpoint(url)
+        metrics.requests += 1
+        metrics.latency.observe(latency)
+        if timeout:
+            metrics.timeouts += 1
+        else:
+            metrics.errors += 1
+
+    def record_retry(self, url: str) -> None:
+        """Count a retried request."""
+        self.endpoint(url).retries += 1
+
+    def record_limiter_wait(self, url: str, seconds: float) -> None:
+        """Add time spent waiting for the rate limiter."""
+        self.endpoint(url).limiter_wait += seconds
+
+    def record_webhook(self, target_key: str, platform: str, webhook_type: str, delivered: bool) -> None:
+        """Count one webhook message (after its retries) per target, platform and type."""
+        key = (target_key, platform, webhook_type, delivered)
+        self.webhooks[key] = self.webhooks.get(key, 0) + 1
+
+    def sink(self, name: str) -> SinkMetrics:
+        """Counters of a sink, created on first use."""
+        if name not in self.sinks:
+            self.sinks[name] = SinkMetrics()
+        return self.sinks[name]
+
+    def record_sink(self, name: str, counter: str, amount: float = 1) -> None:
+        """Count a sink event (queued, delivered, overflow, ...) or add to its send time."""
+        metrics = self.sink(name)
+        if counter == "send_seconds":
+            metrics.send_seconds += amount
+        else:
+            metrics.counts[counter] += int(amount)
+
+    def record_sink_depth(self, name: str, depth: int) -> None:
+        """Track the current and the largest queue depth of a sink."""
+        metrics = self.sink(name)
+        metrics.queue_depth = depth
+        metrics.max_queue_depth = max(metrics.max_queue_depth, depth)
+
+    @contextmanager
+    def stage(self, target_key: str, name: str) -> Iterator[None]:
+        """Time a stage of a target's pass, the latest duration is kept."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages.setdefault(target_key, {})[name] = round(time.perf_counter() - started, 6)
+
+    def record_target(self, target_key: str, changes: Optional[int], duration: float) -> None:
+        """Result of a target's latest pass, `changes` is None when it failed."""
+        self.targets[target_key] = {
+            "ok": changes is not None,
+            "changes": changes,
+            "duration_seconds": round(duration, 6),
+            "finished": int(time.time()),
+        }
+
+    def report(self, extra: Optional[Dict] = None) -> Dict:
+        """Everything recorded so far as a JSON-serializable dictionary."""
+        report = {
+            "started": int(self.started),
+            "generated": int(time.time()),
+            "endpoints": {label: metrics.to_dict() for label, metrics in sorted(self.endpoints.items())},
+            "stages": self.stages,
+            "targets": self.targets,
+            "webhooks": [
+                {"target": target_key, "platform": platform, "type": webhook_type, "delivered": delivered, "count": count}
+                for (target_key, platform, webhook_type, delivered), count in sorted(self.webhooks.items())
+            ],
+            "sinks": {name: metrics.to_dict() for name, metrics in sorted(self.sinks.items())},
+        }
+        report.update(extra or {})
+        return report
+
+    def prometheus(self, extra_gauges: Optional[Dict[str, float]] = None) -> str:
+        """Render the registry in the Prometheus text exposition format."""
+        lines = []
+
+        def family(name: str, kind: str, help_text: str) -> str:
+            full_name = f"{PROMETHEUS_PREFIX}_{name}"
+            lines.append(f"# HELP {full_name} {help_text}")
+            lines.append(f"# TYPE {full_name} {kind}")
+            return full_name
+
+        def labels(**values) -> str:
+            return "{" + ",".join(f'{key}="{_escape(str(value))}"' for key, value in values.items()) + "}"
+
+        endpoints = sorted(self.endpoints.items())
+        name = family("requests_total", "counter", "HTTP responses by endpoint and status")
+        for label, metrics in endpoints:
+            for status, count in sorted(metrics.responses.items()):
+                lines.append(f"{name}{labels(endpoint=label, status=status)} {count}")
+
+        for attribute, help_text in (("retries", "Requests retried"), ("throttled", "Responses with HTTP 429"),
+                                     ("timeouts", "Requests that timed out"), ("errors", "Requests that failed without a response")):
+            name = family(f"{attribute}_total", "counter", help_text)
+            for label, metrics in endpoints:
+                lines.append(f"{name}{labels(endpoint=label)} {getattr(metrics, attribute)}")
+
+        name = family("response_bytes_total", "counter", "Response body bytes received")
+        for label, metrics in endpoints:
+            lines.append(f"{name}{labels(endpoint=label)} {metrics.bytes_received}")
+
+        name = family("rate_limiter_wait_seconds_total", "counter", "Time spent waiting for the rate limiter")
+        for label, metrics in endpoints:
+            lines.append(f"{name}{labels(endpoint=label)} {metrics.limiter_wait:.6f}")
+
+        name = family("request_duration_seconds", "histogram", "HTTP request latency")
+        for label, metrics in endpoints:
+            histogram = metrics.latency
+            for bound, count in zip(histogram.buckets, histogram.cumulative()):
+                lines.append(f"{name}_bucket{labels(endpoint=label, le=f'{bound:g}')} {count}")
+            lines.append(f"{name}_bucket{labels(endpoint=label, le='+Inf')} {histogram.count}")
+            lines.append(f"{name}_sum{labels(endpoint=label)} {histogram.sum:.6f}")
+            lines.append(f"{name}_count{labels(endpoint=label)} {histogram.count}")
+
+        name = family("webhooks_total", "counter", "Webhook messages by target, platform, type and result")
+        for (target_key, platform, webhook_type, delivered), count in sorted(self.webhooks.items()):
+            result = "delivered" if delivered else "failed"
+            lines.append(f"{name}{labels(target=target_key, platform=platform, type=webhook_type, result=result)} {count}")
+
+        sinks = sorted(self.sinks.items())
+        name = family("sink_messages_total", "counter", "Notification sink messages by sink and event")
+        for sink_name, metrics in sinks:
+            for counter, count in metrics.counts.items():
+                lines.append(f"{name}{labels(sink=sink_name, event=counter)} {count}")
+        name = family("sink_send_seconds_total", "counter", "Time spent delivering to each sink")
+        for sink_name, metrics in sinks:
+            lines.append(f"{name}{labels(sink=sink_name)} {metrics.send_seconds:.6f}")
+        name = family("sink_queue_depth", "gauge", "Messages waiting in each sink's queue")
+        for sink_name, metrics in sinks:
+            lines.append(f"{name}{labels(sink=sink_name)} {metrics.queue_depth}")
+        name = family("sink_queue_depth_max", "gauge", "Highest queue depth seen by each sink")
+        for sink_name, metrics in sinks:
+            lines.append(f"{name}{labels(sink=sink_name)} {metrics.max_queue_depth}")
+
+        name = family("stage_duration_seconds", "gauge", "Duration of each stage in the latest pass of a target")
+        for target_key, stages in sorted(self.stages.items()):
+            for stage, duration in stages.items():
+                lines.append(f"{name}{labels(target=target_key, stage=stage)} {duration:.6f}")
+
+        up = family("target_success", "gauge", "1 if the latest pass of the target succeeded")
+        for target_key, result in sorted(self.targets.items()):
+            lines.append(f"{up}{labels(target=target_key)} {1 if result['ok'] else 0}")
+        changes = family("target_changes", "gauge", "Changes found by the latest pass of the target")
+        for target_key, result in sorted(self.targets.items()):
+            lines.append(f"{changes}{labels(target=target_key)} {result['changes'] or 0}")
+        finished = family("target_last_finished_timestamp_seconds", "gauge", "When the latest pass of the target finished")
+        for target_key, result in sorted(self.targets.items()):
+            lines.append(f"{finished}{labels(target=target_key)} {result['finished']}")
+
+        for gauge, value in (extra_gauges or {}).items():
+            name = family(gauge, "gauge", gauge.replace("_", " ").capitalize())
+            lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    def write_reports(self, json_path: str, prometheus_path: str, extra: Optional[Dict] = None,
+                      gauges: Optional[Dict[str, float]] = None) -> None:
+        """Write the JSON report and/or the Prometheus text file, empty paths are skipped.
+
+        `extra` is added to the JSON report, `gauges` become unlabeled Prometheus gauges.
+        """
+        try:
+            if json_path:
+                _write_atomic(json_path, json.dumps(self.report(extra), indent=2))
+            if prometheus_path:
+                # The textfile collector may read at any moment, hence the atomic rename
+                _write_atomic(prometheus_path, self.prometheus({**(gauges or {}), "last_run_timestamp_seconds": int(time.time())}))
+        except OSError as e:
+            logger.error(f"Failed to write the run report: {e}")
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def _write_atomic(path: str, text: str) -> None:
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(prefix=".report-", dir=directory)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as file:
+            file.write(text)
+        os.chmod(temp_path, 0o644)  # mkstemp creates 0600, the collector may run as another user
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+METRICS = RunMetrics()
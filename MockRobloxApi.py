@@ -0,0 +1,324 @@
+# pylint: disable=W1203 # Use lazy % formatting...
+# pylint: disable=C0301 # Line too long
+'''Local stand-in for the Roblox APIs and a Discord-style webhook, used by Benchmark.py.
+
+Every tracked relationship list is generated in memory with a configurable size. Requests can be
+slowed down by a fixed latency and randomly answered with 429, pages are linked by opaque cursors
+like the real API, and the webhook endpoint enforces Discord's per-webhook rate limit and payload
+limits. A few /_bench endpoints let the benchmark change the lists between runs and read counters.
+'''
+import sys
+import time
+import base64
+import random
+import asyncio
+import logging
+import argparse
+from array import array
+from typing import Dict, List, Optional, Set
+from aiohttp import web
+
+logger = logging.getLogger("RobloxTracker")
+
+RELATIONSHIP_TYPES = ['friends', 'followers', 'followings']
+DEFAULT_PORT = 18765
+ID_RANGE = 5_000_000_000  # Generated IDs are drawn from [1, ID_RANGE), IDs added later come after it
+DISCORD_MAX_EMBEDS = 10
+DISCORD_MAX_EMBED_CHARACTERS = 6000
+THUMBNAIL_BATCH_LIMIT = 100
+
+def encode_cursor(offset: int) -> str:
+    """Opaque cursor for the page starting at `offset`."""
+    return base64.urlsafe_b64encode(f"offset:{offset}".encode()).decode()
+
+def friends_page(ids: List[int], next_cursor: Optional[str], previous_cursor: Optional[str]) -> Dict:
+    """Body of a friends/find page, shaped like the real API's."""
+    return {"PreviousCursor": previous_cursor,
+            "PageItems": [{"id": user_id, "hasVerifiedBadge": False} for user_id in ids],
+            "NextCursor": next_cursor, "HasMore": None}
+
+def follows_page(ids: List[int], next_cursor: Optional[str], previous_cursor: Optional[str]) -> Dict:
+    """Body of a followers/followings page, every entry carries the full user object like the real API's."""
+    return {"previousPageCursor": previous_cursor, "nextPageCursor": next_cursor, "data": [
+        {"isOnline": False, "presenceType": None, "isDeleted": False, "friendFrequentScore": 0,
+         "friendFrequentRank": 1, "hasVerifiedBadge": False, "description": None,
+         "created": "0001-01-01T05:51:00Z", "isBanned": False, "externalAppDisplayName": None,
+         "id": user_id, "name": f"User{user_id}", "displayName": f"User{user_id}"}
+        for user_id in ids
+    ]}
+
+def decode_cursor(cursor: str) -> int:
+    """Inverse of `encode_cursor`, raises ValueError for cursors this server did not issue."""
+    text = base64.urlsafe_b64decode(cursor.encode()).decode()
+    if not text.startswith("offset:"):
+        raise ValueError("not a cursor")
+    return int(text[len("offset:"):])
+
+def embed_characters(embed: Dict) -> int:
+    """Characters Discord counts towards the 6000 character limit of a message."""
+    return (len(embed.get("title") or "") + len(embed.get("description") or "") +
+            len((embed.get("footer") or {}).get("text") or "") + len((embed.get("author") or {}).get("name") or "") +
+            sum(len(field.get("name") or "") + len(field.get("value") or "") for field in embed.get("fields") or []))
+
+class MockRobloxApi:
+    '''In-memory relationship lists of one user plus request counters.
+
+    Lists are kept in follow order (oldest first), "Desc" requests page through them backwards.
+    '''
+    def __init__(self, list_size: int, latency: float = 0.0, throttle_rate: float = 0.0, retry_after: float = 0.5,
+                 webhook_limit: int = 5, webhook_window: float = 2.0, seed: int = 0, pending_rate: float = 0.0):
+        self.latency = latency
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.webhook_limit = webhook_limit
+        self.webhook_window = webhook_window
+        self.pending_rate = pending_rate
+        self.rendered: Set[str] = set()  # Batch request IDs answered as Pending once, Completed from then on
+        self.random = random.Random(seed)
+        self.lists: Dict[str, array] = {
+            relationship: array('q', self.random.sample(range(1, ID_RANGE), list_size))
+            for relationship in RELATIONSHIP_TYPES
+        }
+        self.next_new_id = ID_RANGE
+        self.terminated: Set[int] = set()  # Accounts the users API leaves out when asked to exclude banned users
+        self.webhook_buckets: Dict[str, List[float]] = {}  # webhook path -> [window start, requests in window]
+        self.webhook_outage_status = 0  # Non-zero: every webhook request fails with this status
+        self.reset_stats()
+
+    def reset_stats(self) -> None:
+        """Zero all counters, called by the benchmark before every measured run."""
+        self.stats = {
+            "requests": {},
+            "throttled": 0,
+            "bytes_sent": 0,
+            "webhooks": 0,
+            "webhook_embeds": 0,
+            "webhook_throttled": 0,
+            "webhook_rejected": 0,
+            "thumbnails_pending": 0,
+            "first_webhook": None,
+            "last_webhook": None,
+        }
+
+    def churn(self, relationship: str, added: int, removed: int, terminated: int = 0) -> None:
+        """Remove random members and append new ones as the most recent entries.
+
+        The first `terminated` of the removed members are removed because their account was terminated.
+        """
+        ids = self.lists[relationship]
+        removed = min(removed, len(ids))
+        drop = set(self.random.sample(range(len(ids)), removed))
+        self.terminated.update(ids[index] for index in sorted(drop)[:terminated])
+        kept = array('q', (user_id for index, user_id in enumerate(ids) if index not in drop))
+        kept.extend(range(self.next_new_id, self.next_new_id + added))
+        self.next_new_id += added
+        self.lists[relationship] = kept
+
+    def _count(self, route: str) -> None:
+        self.stats["requests"][route] = self.stats["requests"].get(route, 0) + 1
+
+    def _json(self, data) -> web.Response:
+        response = web.json_response(data)
+        self.stats["bytes_sent"] += len(response.body)
+        return response
+
+    @web.middleware
+    async def roblox_behaviour(self, request: web.Request, handler) -> web.StreamResponse:
+        """Latency and 429 injection for the Roblox endpoints (not the webhook or /_bench)."""
+        if request.path.startswith(("/_bench", "/api/webhooks")):
+            return await handler(request)
+        self._count(request.match_info.route.name or "unknown")
+        if self.latency > 0:
+            await asyncio.sleep(self.latency)
+        if self.throttle_rate > 0 and self.random.random() < self.throttle_rate:
+            self.stats["throttled"] += 1
+            return web.json_response({"errors": [{"code": 0, "message": "Too many requests"}]}, status=429,
+                                     headers={"Retry-After": f"{self.retry_after:g}"})
+        return await handler(request)
+
+    def _page(self, request: web.Request, relationship: str, limit: int) -> Optional[tuple]:
+        ids = self.lists[relationship]
+        try:
+            offset = decode_cursor(request.query["cursor"]) if request.query.get("cursor") else 0
+        except ValueError:
+            return None
+        end = min(offset + limit, len(ids))
+        if request.query.get("sortOrder") == "Desc":
+            page = [ids[len(ids) - 1 - index] for index in range(offset, end)]
+        else:
+            page = ids[offset:end].tolist()
+        return page, (encode_cursor(end) if end < len(ids) else None), (encode_cursor(max(0, offset - limit)) if offset else None)
+
+    async def friends_find(self, request: web.Request) -> web.Response:
+        """GET /v1/users/{id}/friends/find"""
+        page = self._page(request, "friends", min(int(request.query.get("limit", 50)), 50))
+        if page is None:
+            return web.json_response({"errors": [{"code": 1, "message": "Invalid cursor"}]}, status=400)
+        return self._json(friends_page(*page))
+
+    async def followers_followings(self, request: web.Request) -> web.Response:
+        """GET /v1/users/{id}/followers and /followings"""
+        relationship = request.match_info["relationship"]
+        if relationship not in ("followers", "followings"):
+            raise web.HTTPNotFound()
+        page = self._page(request, relationship, min(int(request.query.get("limit", 100)), 100))
+        if page is None:
+            return web.json_response({"errors": [{"code": 1, "message": "Invalid cursor"}]}, status=400)
+        return self._json(follows_page(*page))
+
+    async def count(self, request: web.Request) -> web.Response:
+        """GET /v1/users/{id}/{relationship}/count"""
+        relationship = request.match_info["relationship"]
+        if relationship not in self.lists:
+            raise web.HTTPNotFound()
+        return self._json({"count": len(self.lists[relationship])})
+
+    async def profiles(self, request: web.Request) -> web.Response:
+        """POST /user-profile-api/v1/user/profiles/get-profiles"""
+        body = await request.json()
+        return self._json({"profileDetails": [
+            {"userId": int(user_id), "names": {"username": f"User{user_id}"}} for user_id in body.get("userIds", [])
+        ]})
+
+    async def users(self, request: web.Request) -> web.Response:
+        """POST /v1/users, terminated accounts are left out with excludeBannedUsers"""
+        body = await request.json()
+        exclude = body.get("excludeBannedUsers", False)
+        return self._json({"data": [
+            {"id": user_id, "name": f"User{user_id}", "displayName": f"User{user_id}", "hasVerifiedBadge": False}
+            for user_id in map(int, body.get("userIds", [])) if not (exclude and user_id in self.terminated)
+        ]})
+
+    async def thumbnails(self, request: web.Request) -> web.Response:
+        """GET /v1/users/avatar and /v1/users/avatar-headshot"""
+        kind = "Avatar" if request.path.endswith("/avatar") else "AvatarHeadshot"
+        user_ids = [user_id for user_id in request.query.get("userIds", "").split(",") if user_id]
+        return self._json({"data": [
+            {"targetId": int(user_id), "state": "Completed", "version": "TN3",
+             "imageUrl": f"https://tr.rbxcdn.com/{kind}/{user_id}/{request.query.get('size', '150x150')}/Png"}
+            for user_id in user_ids
+        ]})
+
+    async def thumbnails_batch(self, request: web.Request) -> web.Response:
+        """POST /v1/batch, a fraction of thumbnails is answered as Pending the first time they are asked for."""
+        body = await request.json()
+        if len(body) > THUMBNAIL_BATCH_LIMIT:
+            return web.json_response({"errors": [{"code": 1, "message": "Too many requests in batch"}]}, status=400)
+        data = []
+        for entry in body:
+            request_id = entry.get("requestId") or f"{entry['targetId']}:{entry['type']}"
+            pending = (request_id not in self.rendered and self.pending_rate > 0 and self.random.random() < self.pending_rate)
+            self.rendered.add(request_id)
+            self.stats["thumbnails_pending"] += pending
+            data.append({"requestId": request_id, "errorCode": 0, "errorMessage": "", "targetId": entry["targetId"],
+                         "state": "Pending" if pending else "Completed", "version": "TN3",
+                         "imageUrl": None if pending else
+                         f"https://tr.rbxcdn.com/{entry['type']}/{entry['targetId']}/{entry.get('size', '150x150')}/Png"})
+        return self._json({"data": data})
+
+    async def webhook(self, request: web.Request) -> web.Response:
+        """POST /api/webhooks/{id}/{token} with Discord's rate limit headers and payload checks."""
+        if self.webhook_outage_status:
+            self.stats["webhook_rejected"] += 1
+            return web.json_response({"message": "Service unavailable"}, status=self.webhook_outage_status)
+        now = time.monotonic()
+        bucket = self.webhook_buckets.setdefault(request.path, [now, 0])
+        if now - bucket[0] >= self.webhook_window:
+            bucket[0], bucket[1] = now, 0
+        reset_after = max(0.0, bucket[0] + self.webhook_window - now)
+
+        if bucket[1] >= self.webhook_limit:
+            self.stats["webhook_throttled"] += 1
+            return web.json_response({"message": "You are being rate limited.", "retry_after": round(reset_after, 3),
+                                      "global": False}, status=429, headers={"Retry-After": f"{reset_after:.3f}"})
+        bucket[1] += 1
+        headers = {
+            "X-RateLimit-Limit": str(self.webhook_limit),
+            "X-RateLimit-Remaining": str(self.webhook_limit - bucket[1]),
+            "X-RateLimit-Reset-After": f"{reset_after:.3f}",
+        }
+
+        payload = await request.json()
+        embeds = payload.get("embeds") or []
+        if len(embeds) > DISCORD_MAX_EMBEDS or sum(embed_characters(embed) for embed in embeds) > DISCORD_MAX_EMBED_CHARACTERS:
+            self.stats["webhook_rejected"] += 1
+            return web.json_response({"message": "Invalid Form Body", "code": 50035}, status=400, headers=headers)
+
+        self.stats["webhooks"] += 1
+        self.stats["webhook_embeds"] += len(embeds)
+        self.stats["first_webhook"] = self.stats["first_webhook"] or time.time()
+        self.stats["last_webhook"] = time.time()
+        return web.Response(status=204, headers=headers)
+
+    async def bench_stats(self, request: web.Request) -> web.Response:
+        """GET /_bench/stats, POST to also reset the counters."""
+        stats = dict(self.stats, requests=dict(self.stats["requests"]),
+                     sizes={relationship: len(ids) for relationship, ids in self.lists.items()})
+        if request.method == "POST":
+            self.reset_stats()
+        return web.json_response(stats)
+
+    async def bench_churn(self, request: web.Request) -> web.Response:
+        """POST /_bench/churn {"relationship": ..., "added": n, "removed": n, "terminated": n}"""
+        body = await request.json()
+        relationships = [body["relationship"]] if body.get("relationship") else RELATIONSHIP_TYPES
+        for relationship in relationships:
+            self.churn(relationship, int(body.get("added", 0)), int(body.get("removed", 0)), int(body.get("terminated", 0)))
+        return web.json_response({relationship: len(self.lists[relationship]) for relationship in relationships})
+
+    async def bench_webhook_outage(self, request: web.Request) -> web.Response:
+        """POST /_bench/webhook_outage {"status": 503} to fail every webhook request, {"status": 0} to recover"""
+        body = await request.json()
+        self.webhook_outage_status = int(body.get("status", 0))
+        return web.json_response({"status": self.webhook_outage_status})
+
+    def create_app(self) -> web.Application:
+        """Build the aiohttp application serving every endpoint."""
+        app = web.Application(middlewares=[self.roblox_behaviour], client_max_size=16 * 1024 * 1024)
+        app.router.add_get("/v1/users/{user_id}/friends/find", self.friends_find, name="friends")
+        app.router.add_get("/v1/users/{user_id}/{relationship}/count", self.count, name="count")
+        app.router.add_get("/v1/users/avatar", self.thumbnails, name="avatar")
+        app.router.add_get("/v1/users/avatar-headshot", self.thumbnails, name="headshot")
+        app.router.add_post("/v1/batch", self.thumbnails_batch, name="thumbnails_batch")
+        app.router.add_post("/v1/users", self.users, name="users")
+        app.router.add_get("/v1/users/{user_id}/{relationship}", self.followers_followings, name="followers_followings")
+        app.router.add_post("/user-profile-api/v1/user/profiles/get-profiles", self.profiles, name="profiles")
+        app.router.add_post("/api/webhooks/{webhook_id}/{token}", self.webhook)
+        app.router.add_route("*", "/_bench/stats", self.bench_stats)
+        app.router.add_post("/_bench/churn", self.bench_churn)
+        app.router.add_post("/_bench/webhook_outage", self.bench_webhook_outage)
+        return app
+
+def serve(port: int, list_size: int, latency: float = 0.0, throttle_rate: float = 0.0, retry_after: float = 0.5,
+          webhook_limit: int = 5, webhook_window: float = 2.0, seed: int = 0, pending_rate: float = 0.0) -> None:
+    """Run the stand-in on 127.0.0.1:`port` until the process is stopped."""
+    api = MockRobloxApi(list_size, latency, throttle_rate, retry_after, webhook_limit, webhook_window, seed, pending_rate)
+    web.run_app(api.create_app(), host="127.0.0.1", port=port, print=None, access_log=None)
+
+def parse_size(value: str) -> int:
+    """Accept plain numbers and shorthands like 1k, 100k or 1m."""
+    value = value.strip().lower()
+    multiplier = {"k": 1_000, "m": 1_000_000}.get(value[-1:], 1)
+    number = value[:-1] if multiplier > 1 else value
+    return int(float(number) * multiplier)
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Run the stand-in on its own, e.g. to point a config.json at it by hand."""
+    parser = argparse.ArgumentParser(description="Local stand-in for the Roblox APIs used by the tracker.")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--size", type=parse_size, default=1_000, help="Entries per relationship list, e.g. 1k, 100k, 1m")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Delay added to every Roblox API response")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Fraction of Roblox API requests answered with 429")
+    parser.add_argument("--retry-after", type=float, default=0.5, help="Retry-After seconds sent with injected 429s")
+    parser.add_argument("--webhook-limit", type=int, default=5, help="Webhook requests allowed per window")
+    parser.add_argument("--webhook-window", type=float, default=2.0, help="Webhook rate limit window in seconds")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--pending-rate", type=float, default=0.0, help="Fraction of thumbnails answered as Pending on first request")
+    args = parser.parse_args(argv)
+
+    print(f"Serving {args.size} entries per list on http://127.0.0.1:{args.port}", file=sys.stderr)
+    serve(args.port, args.size, args.latency_ms / 1000, args.throttle_rate, args.retry_after,
+          args.webhook_limit, args.webhook_window, args.seed, args.pending_rate)
+
+if __name__ == "__main__":
+    main()
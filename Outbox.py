@@ -0,0 +1,141 @@
+# pylint: disable=W1203 # Use lazy % formatting...
+# pylint: disable=C0301 # Line too long
+'''Durable outbox of webhook messages.
+
+Every message is stored before it is sent and deleted only after the platform confirmed it, so a
+webhook outage delays notifications instead of losing them. Messages that keep failing are retried
+with exponential backoff on later runs and moved to the dead letters after `max_attempts`.
+
+Workers sharing the file (worker mode) claim the rows they queue or retry for `claim_seconds`, so
+a message another worker is still sending is not picked up a second time.
+'''
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+from typing import Dict, List, Optional, Sequence
+
+logger = logging.getLogger("RobloxTracker")
+
+RETRY_BASE_DELAY = 60  # Seconds before the first retry of a message that failed, doubled on every further failure
+RETRY_MAX_DELAY = 3600
+
+def dedupe_key(target_key: str, platform: str, webhook_url: str, webhook_type: str, user_ids: Sequence[str]) -> str:
+    """Identify a notification independent of when it was rendered (footer timestamp, counts)."""
+    text = "|".join([target_key, platform, webhook_url, webhook_type, ",".join(user_ids)])
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+class Outbox:
+    '''SQLite table of webhook messages that were not confirmed yet'''
+    def __init__(self, path: str, max_attempts: int, owner: Optional[str] = None, claim_seconds: float = 0.0):
+        self.path = path
+        self.max_attempts = max(1, max_attempts)
+        self.owner = owner
+        self.claim_seconds = claim_seconds
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # Workers call the methods from one background thread, waiting on another process's lock there
+        self.connection = sqlite3.connect(path, check_same_thread=owner is None)
+        self.connection.row_factory = sqlite3.Row
+        # Workers may share the file across machines, where WAL does not work
+        self.connection.execute("PRAGMA journal_mode=DELETE" if owner is not None else "PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=FULL")  # A queued notification must survive a crash
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                dedupe_key TEXT NOT NULL,
+                target_key TEXT NOT NULL,
+                platform TEXT NOT NULL,
+                webhook_url TEXT NOT NULL,
+                webhook_type TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                created REAL NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt REAL NOT NULL,
+                last_error TEXT,
+                dead INTEGER NOT NULL DEFAULT 0
+            )""")
+        columns = {row["name"] for row in self.connection.execute("PRAGMA table_info(outbox)")}
+        if "user_ids" not in columns:  # Added with notification sinks, older rows keep an empty list
+            self.connection.execute("ALTER TABLE outbox ADD COLUMN user_ids TEXT NOT NULL DEFAULT '[]'")
+        if "claim_owner" not in columns:  # Added with worker mode
+            self.connection.execute("ALTER TABLE outbox ADD COLUMN claim_owner TEXT")
+            self.connection.execute("ALTER TABLE outbox ADD COLUMN claim_expires REAL NOT NULL DEFAULT 0")
+        # The same notification is queued at most once while it is pending
+        self.connection.execute("CREATE UNIQUE INDEX IF NOT EXISTS outbox_pending_key ON outbox (dedupe_key) WHERE dead = 0")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS outbox_due ON outbox (dead, next_attempt)")
+        self.connection.commit()
+
+    def close(self) -> None:
+        """Close the database."""
+        self.connection.close()
+
+    def enqueue(self, target_key: str, platform: str, webhook_url: str, webhook_type: str,
+                payload: Dict, user_ids: Sequence[str]) -> Optional[int]:
+        """Store a message before sending it. Returns its ID, or None if it is already pending.
+
+        `platform` and `webhook_url` are the kind and address of the sink the message is for.
+        """
+        now = time.time()
+        cursor = self.connection.execute("""
+            INSERT OR IGNORE INTO outbox (dedupe_key, target_key, platform, webhook_url, webhook_type, payload, user_ids,
+                                          created, next_attempt, claim_owner, claim_expires)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (dedupe_key(target_key, platform, webhook_url, webhook_type, user_ids), target_key, platform,
+                  webhook_url, webhook_type, json.dumps(payload), json.dumps(list(user_ids)), now, now,
+                  self.owner, now + self.claim_seconds if self.owner else 0))
+        self.connection.commit()
+        return cursor.lastrowid if cursor.rowcount else None
+
+    def due(self, target_key: Optional[str] = None, limit: int = 1000) -> List[Dict]:
+        """Pending messages (of one target or all) whose backoff has expired, oldest first.
+
+        With an owner, only messages no other worker holds a claim on are returned, and they are claimed.
+        """
+        now = time.time()
+        if self.owner is None:
+            rows = self.connection.execute("""
+                SELECT id, target_key, platform, webhook_url, webhook_type, payload, user_ids, attempts FROM outbox
+                WHERE dead = 0 AND next_attempt <= ? AND (? IS NULL OR target_key = ?) ORDER BY id LIMIT ?
+                """, (now, target_key, target_key, limit)).fetchall()
+        else:
+            self.connection.execute("BEGIN IMMEDIATE")  # Select and claim without another worker in between
+            try:
+                rows = self.connection.execute("""
+                    SELECT id, target_key, platform, webhook_url, webhook_type, payload, user_ids, attempts FROM outbox
+                    WHERE dead = 0 AND next_attempt <= ? AND (? IS NULL OR target_key = ?)
+                    AND (claim_owner IS NULL OR claim_owner = ? OR claim_expires < ?) ORDER BY id LIMIT ?
+                    """, (now, target_key, target_key, self.owner, now, limit)).fetchall()
+                self.connection.executemany("UPDATE outbox SET claim_owner = ?, claim_expires = ? WHERE id = ?",
+                                            [(self.owner, now + self.claim_seconds, row["id"]) for row in rows])
+                self.connection.commit()
+            except BaseException:
+                self.connection.rollback()
+                raise
+        return [dict(row, payload=json.loads(row["payload"]), user_ids=json.loads(row["user_ids"])) for row in rows]
+
+    def delivered(self, message_id: int) -> None:
+        """Forget a message the platform confirmed."""
+        self.connection.execute("DELETE FROM outbox WHERE id = ?", (message_id,))
+        self.connection.commit()
+
+    def failed(self, message_id: int, error: str, permanent: bool = False) -> bool:
+        """Schedule the next attempt with exponential backoff. Returns True if the message became a dead letter."""
+        row = self.connection.execute("SELECT attempts FROM outbox WHERE id = ?", (message_id,)).fetchone()
+        if row is None:
+            return False
+        attempts = row["attempts"] + 1
+        dead = permanent or attempts >= self.max_attempts
+        delay = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** (attempts - 1))
+        self.connection.execute("UPDATE outbox SET attempts = ?, next_attempt = ?, last_error = ?, dead = ?, claim_owner = NULL WHERE id = ?",
+                                (attempts, time.time() + delay, error, int(dead), message_id))
+        self.connection.commit()
+        return dead
+
+    def counts(self) -> Dict[str, int]:
+        """Number of pending messages and dead letters."""
+        pending, dead = self.connection.execute(
+            "SELECT COALESCE(SUM(dead = 0), 0), COALESCE(SUM(dead = 1), 0) FROM outbox").fetchone()
+        return {"pending": pending, "dead": dead}
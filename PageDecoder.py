@@ -0,0 +1,88 @@
+# pylint: disable=C0301 # Line too long
+'''Decoding of friends/followers/followings pages straight into ID arrays.
+
+Only the user IDs and the next page cursor of a page are used, but a generic JSON parser builds a
+dict with names, display names, flags and dates for every entry first. With msgspec installed the
+page is decoded against a schema that holds nothing but `id` and the cursor, so the other fields are
+skipped without being materialized. orjson (faster generic parsing) and the standard library are
+the fallbacks, all three return the same result.
+'''
+import json
+from array import array
+from typing import Callable, Dict, List, Optional, Tuple
+
+try:
+    import msgspec
+except ImportError:  # Optional
+    msgspec = None
+try:
+    import orjson
+except ImportError:  # Optional
+    orjson = None
+
+# (field with the entries, field with the next page cursor) of each page layout
+FRIENDS_PAGE = ("PageItems", "NextCursor")
+FOLLOWS_PAGE = ("data", "nextPageCursor")
+
+IdPage = Tuple[array, Optional[str]]
+
+def _from_dict(data: Dict, layout: Tuple[str, str]) -> IdPage:
+    """IDs and cursor of an already parsed page."""
+    items_field, cursor_field = layout
+    if not isinstance(data, dict):
+        raise ValueError("Page is not a JSON object")
+    try:
+        return array('q', [entry["id"] for entry in data.get(items_field) or ()]), data.get(cursor_field)
+    except (KeyError, TypeError) as e:
+        raise ValueError(f"Invalid page entry: {e!r}") from e
+
+def _decode_json(body: bytes, layout: Tuple[str, str]) -> IdPage:
+    """Decode with the standard library, always available."""
+    return _from_dict(json.loads(body), layout)
+
+def _decode_orjson(body: bytes, layout: Tuple[str, str]) -> IdPage:
+    """Decode with orjson, still builds the full dict of every entry."""
+    return _from_dict(orjson.loads(body), layout)
+
+DECODERS: Dict[str, Callable[[bytes, Tuple[str, str]], IdPage]] = {"json": _decode_json}
+if orjson is not None:
+    DECODERS["orjson"] = _decode_orjson
+
+if msgspec is not None:
+    class _Entry(msgspec.Struct):
+        id: int
+
+    def _page_decoder(layout: Tuple[str, str]):
+        """msgspec decoder that only reads the entry IDs and the cursor of a layout."""
+        items_field, cursor_field = layout
+        # Unknown fields (names, flags, previous cursor, ...) are skipped by the decoder
+        page_type = msgspec.defstruct("Page", [(items_field, Optional[List[_Entry]], None),
+                                               (cursor_field, Optional[str], None)])
+        return msgspec.json.Decoder(page_type)
+
+    _MSGSPEC_DECODERS = {layout: _page_decoder(layout) for layout in (FRIENDS_PAGE, FOLLOWS_PAGE)}
+
+    def _decode_msgspec(body: bytes, layout: Tuple[str, str]) -> IdPage:
+        """Decode with msgspec, entries become small structs instead of dicts."""
+        try:
+            page = _MSGSPEC_DECODERS[layout].decode(body)
+        except msgspec.DecodeError as e:
+            raise ValueError(f"Invalid page: {e}") from e
+        items_field, cursor_field = layout
+        return array('q', [entry.id for entry in getattr(page, items_field) or ()]), getattr(page, cursor_field)
+
+    DECODERS["msgspec"] = _decode_msgspec
+
+JSON_BACKEND = "msgspec" if "msgspec" in DECODERS else "orjson" if "orjson" in DECODERS else "json"
+
+def decode_id_page(body: bytes, layout: Tuple[str, str]) -> IdPage:
+    """(IDs, next page cursor) of a raw page body with the fastest available parser. Raises ValueError for invalid pages."""
+    return DECODERS[JSON_BACKEND](body, layout)
+
+def decode_friends_page(body: bytes) -> IdPage:
+    """(IDs, next page cursor) of a friends page."""
+    return decode_id_page(body, FRIENDS_PAGE)
+
+def decode_follows_page(body: bytes) -> IdPage:
+    """(IDs, next page cursor) of a followers/followings page."""
+    return decode_id_page(body, FOLLOWS_PAGE)
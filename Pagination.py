@@ -0,0 +1,142 @@
+# pylint: disable=W1203 # Use lazy % formatting...
+# pylint: disable=C0301 # Line too long
+'''Checkpoints that let an interrupted crawl continue from its last good cursor.
+
+The file starts with a small JSON header describing the crawl, followed by one record per flush:
+the cursor of the next page to fetch and the IDs collected since the previous record. Records are
+only ever appended, so checkpointing a long crawl costs O(n) in total.
+'''
+import os
+import json
+import time
+import struct
+import logging
+from array import array
+from typing import Optional, Sequence, Tuple
+
+logger = logging.getLogger("RobloxTracker")
+
+CHECKPOINT_MAGIC = b"RFTPAGE1"
+HEADER_LENGTH = struct.Struct("<H")
+RECORD_HEADER = struct.Struct("<HI")  # cursor length, number of IDs
+CURSOR_FILE_EXTENSION = ".cursor"
+DEFAULT_CHECKPOINT_EVERY_PAGES = 10
+
+class PaginationCheckpoint:
+    '''Cursor and collected IDs of one in-progress crawl, persisted to disk.
+
+    `kind` identifies the crawl by its endpoint (e.g. "followers"); a checkpoint written by a
+    different kind of crawl, or older than `max_age` seconds, is discarded instead of resumed.
+    '''
+    def __init__(self, path: str, kind: str, max_age: float, every_pages: int = DEFAULT_CHECKPOINT_EVERY_PAGES):
+        self.path = path
+        self.kind = kind
+        self.max_age = max_age
+        self.every_pages = max(1, every_pages)
+        self._pending_ids = array('q')
+        self._pending_cursor = None
+        self._pending_pages = 0
+        self._valid_size = None  # Offset after the last complete record, None if no file yet
+
+    def resume(self) -> Tuple[Optional[str], array]:
+        """Return (cursor, IDs collected so far) of a usable checkpoint, or (None, empty array) to start over."""
+        if not os.path.isfile(self.path):
+            return None, array('q')
+
+        age = time.time() - os.path.getmtime(self.path)
+        if age > self.max_age:
+            logger.info(f"Discarding pagination checkpoint {self.path}, it is {age / 60:.0f} minutes old")
+            self.discard()
+            return None, array('q')
+
+        try:
+            with open(self.path, 'rb') as file:
+                data = file.read()
+            cursor, ids, valid_size = self._parse(data)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Discarding unreadable pagination checkpoint {self.path}: {e}")
+            self.discard()
+            return None, array('q')
+
+        if cursor is None:
+            self.discard()
+            return None, array('q')
+
+        self._valid_size = valid_size
+        logger.info(f"Resuming crawl from checkpoint with {len(ids)} IDs already collected")
+        return cursor, ids
+
+    def _parse(self, data: bytes) -> Tuple[Optional[str], array, int]:
+        if not data.startswith(CHECKPOINT_MAGIC):
+            raise ValueError("bad magic")
+        offset = len(CHECKPOINT_MAGIC)
+        (header_length,) = HEADER_LENGTH.unpack_from(data, offset)
+        offset += HEADER_LENGTH.size
+        header = json.loads(data[offset:offset + header_length].decode('utf-8'))
+        offset += header_length
+        if header.get("kind") != self.kind:
+            return None, array('q'), offset
+
+        cursor = None
+        ids = array('q')
+        # A torn record at the end (crash during a flush) is ignored
+        while offset + RECORD_HEADER.size <= len(data):
+            cursor_length, id_count = RECORD_HEADER.unpack_from(data, offset)
+            end = offset + RECORD_HEADER.size + cursor_length + id_count * 8
+            if end > len(data):
+                break
+            start = offset + RECORD_HEADER.size
+            cursor = data[start:start + cursor_length].decode('utf-8')
+            ids.frombytes(data[start + cursor_length:end])
+            offset = end
+        return cursor, ids, offset
+
+    def add_page(self, ids: Sequence[int], next_cursor: Optional[str]) -> None:
+        """Record a fetched page, flushing to disk every `every_pages` pages."""
+        self._pending_ids.extend(ids)
+        self._pending_cursor = next_cursor
+        self._pending_pages += 1
+        if next_cursor and self._pending_pages >= self.every_pages:
+            self.flush()
+
+    def flush(self) -> None:
+        """Persist the pages collected since the last flush."""
+        if not self._pending_pages or not self._pending_cursor:
+            return
+        cursor = self._pending_cursor.encode('utf-8')
+        record = RECORD_HEADER.pack(len(cursor), len(self._pending_ids)) + cursor + self._pending_ids.tobytes()
+
+        try:
+            if self._valid_size is None:
+                header = json.dumps({"kind": self.kind, "created": time.time()}).encode('utf-8')
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+                with open(self.path, 'wb') as file:
+                    file.write(CHECKPOINT_MAGIC + HEADER_LENGTH.pack(len(header)) + header)
+                self._valid_size = len(CHECKPOINT_MAGIC) + HEADER_LENGTH.size + len(header)
+
+            with open(self.path, 'r+b') as file:
+                file.truncate(self._valid_size)
+                file.seek(self._valid_size)
+                file.write(record)
+                file.flush()
+                os.fsync(file.fileno())
+            self._valid_size += len(record)
+        except OSError as e:
+            logger.warning(f"Failed to write pagination checkpoint {self.path}: {e}")
+            return
+
+        self._pending_ids = array('q')
+        self._pending_pages = 0
+
+    def discard(self) -> None:
+        """Forget the checkpoint, called once the crawl completed."""
+        self._pending_ids = array('q')
+        self._pending_cursor = None
+        self._pending_pages = 0
+        self._valid_size = None
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"Failed to remove pagination checkpoint {self.path}: {e}")
@@ -0,0 +1,239 @@
+# pylint: disable=W1203 # Use lazy % formatting...
+# pylint: disable=C0301 # Line too long
+'''Read-only HTTP API over the tracked lists and their change history.
+
+Current members, recent changes and counts of every target are served from the sorted ID arrays
+of the snapshots, which are read again only after the tracker replaced a snapshot file. Member
+pages and lookups are binary searches, so they stay cheap for lists of a million IDs. Every
+response carries an ETag derived from the snapshot/journal version and the query, a client polling
+with If-None-Match gets an empty 304 until something changed.
+
+Endpoints:
+    GET /targets                           every target with its member count
+    GET /targets/{key}                     one target, e.g. /targets/1_followers
+    GET /targets/{key}/members             sorted member IDs, paged with ?after=<id>&limit=<n>
+    GET /targets/{key}/members/{user_id}   whether one user is a member
+    GET /targets/{key}/changes             journal entries, ?cursor=<n> or ?since=<unix seconds>, &limit=<n>
+    GET /counts                            member counts per user ID and relationship
+'''
+import os
+import json
+import asyncio
+import hashlib
+import logging
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Callable, Dict, List, Optional, Tuple
+from aiohttp import web
+
+from Snapshot import read_snapshot_ids, SnapshotError
+from Journal import changes_page, journal_paths
+
+logger = logging.getLogger("RobloxTracker")
+
+DEFAULT_QUERY_SERVER_HOST = "127.0.0.1"
+DEFAULT_MEMBERS_PAGE_SIZE = 1000
+MAX_MEMBERS_PAGE_SIZE = 10000
+DEFAULT_CHANGES_PAGE_SIZE = 100
+MAX_CHANGES_PAGE_SIZE = 1000
+
+def _file_version(path: str) -> Tuple[int, int]:
+    """(modification time, size) of a file, (0, 0) if it does not exist. Snapshots are replaced by rename, so either changes."""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return 0, 0
+    return stat.st_mtime_ns, stat.st_size
+
+class TargetIndex:
+    '''Sorted member IDs of one target, kept until its snapshot file is replaced'''
+    def __init__(self, target: Dict):
+        self.target = target
+        self.version = (0, 0)
+        self.ids = array('q')
+        self.lock = asyncio.Lock()
+
+    async def refresh(self) -> Tuple[int, int]:
+        """Read the snapshot again if the tracker replaced it since the last request, return its version."""
+        version = _file_version(self.target["snapshot_file"])
+        if version != self.version:
+            async with self.lock:
+                version = _file_version(self.target["snapshot_file"])
+                if version != self.version:
+                    self.ids = await asyncio.to_thread(read_snapshot_ids, self.target["snapshot_file"]) if version[1] else array('q')
+                    self.version = version
+        return self.version
+
+    def history_version(self) -> Tuple[int, int]:
+        """Version of the change journal, the ETag of history answers."""
+        return _file_version(journal_paths(self.target["local_data_file"])[0])
+
+    def summary(self) -> Dict:
+        """Entry of the target in the target list."""
+        return {
+            "key": self.target["key"],
+            "user_id": int(self.target["target_user_id"]),
+            "relationship": self.target["relationship_type_endpoint"],
+            "count": len(self.ids),
+            "updated": self.version[0] // 1_000_000_000 or None,
+            "history": self.target["enable_journal"],
+        }
+
+def _json_error(error_class, message: str) -> web.HTTPException:
+    """HTTP error of class `error_class` with a JSON body."""
+    return error_class(text=json.dumps({"error": message}), content_type="application/json")
+
+def _int_parameter(request: web.Request, name: str, default: Optional[int], minimum: int = 0,
+                   maximum: Optional[int] = None) -> Optional[int]:
+    """Integer query parameter, a missing one gives `default`. Invalid values answer 400."""
+    value = request.query.get(name)
+    if value is None or value == "":
+        return default
+    try:
+        number = int(value)
+    except ValueError as exc:
+        raise _json_error(web.HTTPBadRequest, f"{name} must be an integer") from exc
+    if number < minimum:
+        raise _json_error(web.HTTPBadRequest, f"{name} must be at least {minimum}")
+    return min(number, maximum) if maximum is not None else number
+
+def _etag_matches(request: web.Request, etag: str) -> bool:
+    """Whether If-None-Match lists `etag` (weak or strong) or `*`."""
+    header = request.headers.get("If-None-Match", "")
+    tags = [tag.strip() for tag in header.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+def conditional_json(request: web.Request, version, build: Callable[[], Dict]) -> web.Response:
+    """Answer 304 if the client already has this version of the resource, else the JSON built by `build`."""
+    etag = '"' + hashlib.sha1(f"{version}|{request.path_qs}".encode('utf-8')).hexdigest()[:20] + '"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if _etag_matches(request, etag):
+        return web.Response(status=304, headers=headers)
+    return web.json_response(build(), headers=headers)
+
+class QueryServer:
+    '''aiohttp application serving the targets of one config'''
+    def __init__(self, targets: List[Dict]):
+        self.indexes = {target["key"]: TargetIndex(target) for target in targets}
+        self.runner: Optional[web.AppRunner] = None
+
+    async def _index(self, request: web.Request) -> Tuple[TargetIndex, Tuple[int, int]]:
+        """Refreshed index of the target in the URL, 404 for unknown targets."""
+        index = self.indexes.get(request.match_info["key"])
+        if index is None:
+            raise _json_error(web.HTTPNotFound, "Unknown target")
+        try:
+            return index, await index.refresh()
+        except (SnapshotError, OSError) as e:
+            logger.error(f"[QueryServer] Cannot read {index.target['snapshot_file']}: {e}")
+            raise _json_error(web.HTTPServiceUnavailable, "Snapshot unreadable") from e
+
+    async def _refresh_all(self) -> List[Tuple[int, int]]:
+        """Refresh every index and return their versions."""
+        versions = []
+        for index in self.indexes.values():
+            try:
+                versions.append(await index.refresh())
+            except (SnapshotError, OSError) as e:
+                logger.error(f"[QueryServer] Cannot read {index.target['snapshot_file']}: {e}")
+                versions.append(index.version)  # Keep serving the last good copy
+        return versions
+
+    async def targets(self, request: web.Request) -> web.Response:
+        """GET /targets"""
+        versions = await self._refresh_all()
+        return conditional_json(request, versions, lambda: {
+            "targets": [index.summary() for index in self.indexes.values()],
+        })
+
+    async def target(self, request: web.Request) -> web.Response:
+        """GET /targets/{key}"""
+        index, version = await self._index(request)
+        return conditional_json(request, version, index.summary)
+
+    async def members(self, request: web.Request) -> web.Response:
+        """GET /targets/{key}/members?after=<id>&limit=<n>, IDs in ascending order"""
+        index, version = await self._index(request)
+        after = _int_parameter(request, "after", None)
+        limit = _int_parameter(request, "limit", DEFAULT_MEMBERS_PAGE_SIZE, 1, MAX_MEMBERS_PAGE_SIZE)
+
+        def build() -> Dict:
+            ids = index.ids
+            start = bisect_right(ids, after) if after is not None else 0
+            page = ids[start:start + limit]
+            return {
+                "target": index.target["key"],
+                "count": len(ids),
+                "members": page.tolist(),
+                "next_after": page[-1] if start + limit < len(ids) and page else None,
+            }
+        return conditional_json(request, version, build)
+
+    async def member(self, request: web.Request) -> web.Response:
+        """GET /targets/{key}/members/{user_id}"""
+        index, version = await self._index(request)
+        try:
+            user_id = int(request.match_info["user_id"])
+        except ValueError as exc:
+            raise _json_error(web.HTTPBadRequest, "user_id must be an integer") from exc
+
+        def build() -> Dict:
+            position = bisect_left(index.ids, user_id)
+            return {"target": index.target["key"], "user_id": user_id,
+                    "member": position < len(index.ids) and index.ids[position] == user_id}
+        return conditional_json(request, version, build)
+
+    async def changes(self, request: web.Request) -> web.Response:
+        """GET /targets/{key}/changes, the latest changes or a page starting at ?cursor=<n> / after ?since=<unix seconds>"""
+        index = self.indexes.get(request.match_info["key"])
+        if index is None:
+            raise _json_error(web.HTTPNotFound, "Unknown target")
+        cursor = _int_parameter(request, "cursor", None)
+        since = _int_parameter(request, "since", None)
+        limit = _int_parameter(request, "limit", DEFAULT_CHANGES_PAGE_SIZE, 1, MAX_CHANGES_PAGE_SIZE)
+
+        def build() -> Dict:
+            changes, next_cursor = changes_page(index.target["local_data_file"], limit, cursor, since)
+            return {
+                "target": index.target["key"],
+                "changes": [{"timestamp": timestamp, "relationship": relationship, "user_id": user_id,
+                             "change": "added" if added else "removed"}
+                            for timestamp, _, relationship, user_id, added in changes],
+                "next_cursor": next_cursor,
+            }
+        return conditional_json(request, index.history_version(), build)
+
+    async def counts(self, request: web.Request) -> web.Response:
+        """GET /counts"""
+        versions = await self._refresh_all()
+
+        def build() -> Dict:
+            users: Dict[str, Dict[str, int]] = {}
+            for index in self.indexes.values():
+                users.setdefault(index.target["target_user_id"], {})[index.target["relationship_type_endpoint"]] = len(index.ids)
+            return {"users": users}
+        return conditional_json(request, versions, build)
+
+    def create_app(self) -> web.Application:
+        """Build the aiohttp application serving every endpoint."""
+        app = web.Application()
+        app.router.add_get("/targets", self.targets)
+        app.router.add_get("/targets/{key}", self.target)
+        app.router.add_get("/targets/{key}/members", self.members)
+        app.router.add_get("/targets/{key}/members/{user_id}", self.member)
+        app.router.add_get("/targets/{key}/changes", self.changes)
+        app.router.add_get("/counts", self.counts)
+        return app
+
+    async def start(self, host: str, port: int) -> None:
+        """Listen in the background of the running event loop, next to the tracker."""
+        self.runner = web.AppRunner(self.create_app(), access_log=None)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, host, port).start()
+        logger.info(f"Query API listening on http://{host}:{port}")
+
+    async def stop(self) -> None:
+        """Stop listening."""
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
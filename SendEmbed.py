@@ -1,118 +1,446 @@
-# pylint: disable=C0301 # Line too long
-'''This script sends embed messages to Discord or Guilded webhooks based on user relationships on Roblox.'''
-from datetime import datetime
-import requests
-
-# Default icon URL used when no avatar or headshot URL is provided
-DEFAULT_ICON_URL = "https://github.com/Nieznany237/-Public_Images/blob/main/Roblox/RobloxDeletedContent.png?raw=true"
-
-# Common colors for embed messages
-COLOR_REMOVED = 16711680  # Red color for removal
-COLOR_NEW = 2330091       # Green color for new entries
-
-# Function to send an embed message to Discord or Guilded webhook
-def send_embed_group(platform, webhook_url, relationship_type_endpoint, embed_data_list, version):
-    '''Sends an embed message to a specified webhook URL based on user relationship data.
-    Args:
-        platform (str): The platform for which the webhook is being sent (e.g., 'discord', 'guilded').
-        webhook_url (str): The URL of the webhook to send the embed to.
-        relationship_type_endpoint (str): The type of relationship endpoint (e.g., 'friends', 'followers', 'followings').
-        embed_data_list (list): A list of dictionaries containing user data for the embeds.
-        version (str): The version of the script being used.
-    '''
-    embeds = []
-
-    if not embed_data_list:
-        print("No data to send.")
-        return  # Prevention of sending an empty message
-
-    for data in embed_data_list:
-        username = data.get("username") or "Unknown User"
-        user_id = data.get("user_id")
-        avatar_url = data.get("avatar_url") or DEFAULT_ICON_URL
-        headshot_url = data.get("headshot_url") or DEFAULT_ICON_URL
-        removed = data.get("removed")
-        total_count = data.get("total_count")
-
-        description = ""  # Initializing the description
-        title = None
-        color = None
-
-        # Embed creation logic based on relationship type
-        if relationship_type_endpoint == 'friends':
-            if removed:
-                title = "Friend Removed"
-                description = f"You and [{username}](https://roblox.com/users/{user_id}/profile) are no longer friends."
-                color = COLOR_REMOVED
-            else:
-                title = "New Friend"
-                description = f"You became friends with [{username}](https://roblox.com/users/{user_id}/profile)."
-                color = COLOR_NEW
-
-        elif relationship_type_endpoint == 'followers':
-            if removed:
-                title = "Lost a Follower"
-                description = f"[{username}](https://roblox.com/users/{user_id}/profile) has unfollowed you."
-                color = COLOR_REMOVED
-            else:
-                title = "New Follower"
-                description = f"[{username}](https://roblox.com/users/{user_id}/profile) is now following you."
-                color = COLOR_NEW
-
-        elif relationship_type_endpoint == 'followings':
-            if removed:
-                title = "Unfollowed a User"
-                description = f"You stopped following [{username}](https://roblox.com/users/{user_id}/profile)."
-                color = COLOR_REMOVED
-            else:
-                title = "Now Following"
-                description = f"You started following [{username}](https://roblox.com/users/{user_id}/profile)."
-                color = COLOR_NEW
-
-        # Checking if the `description`, `title`, or `color` is empty
-        if not description or not title or color is None:
-            print(f"No description/title/color generated for user {username} - Skipping this entry.")
-            continue  # If no description, skip this embed
-
-        description += f"\nYou currently have: {total_count}"  # Adding additional information
-
-        # Create embed
-        embed = {
-            "title": title,
-            "description": description,
-            "color": color,
-            "footer": {
-                "text": f"Automatic script - Version {version} | {datetime.now().strftime('%d.%m.%Y %H:%M')}"
-            },
-            "author": {
-                "name": f"{username} [{user_id}]",
-                "url": f"https://www.roblox.com/users/{user_id}/profile",
-                "icon_url": headshot_url
-            },
-            "thumbnail": {
-                "url": avatar_url
-            }
-        }
-        embeds.append(embed)
-
-    # Checking to see if any embeds have been generated
-    if not embeds:
-        print("No embeds generated. Skipping webhook send.")
-        return  # Do not send if no embeds have been generated
-
-    payload = {
-        "embeds": embeds
-    }
-
-    headers = {
-        "Content-Type": "application/json"
-    }
-
-    # Sending a webhook
-    response = requests.post(webhook_url, json=payload, headers=headers, timeout=15)
-
-    # Check the response status code to determine success or failure
-    if response.status_code in {204, 200}:
-        print(f'[{platform.capitalize()}] - OK')
-    else:
-        print(f'[{platform.capitalize()}] - Error: {response.status_code}, {response.text}')
+# pylint: disable=W1203 # Use lazy % formatting...
+# pylint: disable=C0301 # Line too long
+'''This script sends embed messages to Discord or Guilded webhooks based on user relationships on Roblox.'''
+import time
+import asyncio
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+import aiohttp
+from Metrics import METRICS
+
+logger = logging.getLogger("RobloxTracker")
+
+# Default icon URL used when no avatar or headshot URL is provided
+DEFAULT_ICON_URL = "https://github.com/Nieznany237/-Public_Images/blob/main/Roblox/RobloxDeletedContent.png?raw=true"
+
+# Common colors for embed messages
+COLOR_REMOVED = 16711680  # Red color for removal
+COLOR_NEW = 2330091       # Green color for new entries
+COLOR_ANALYTICS = 3447003 # Blue color for analytics summaries
+COLOR_TERMINATED = 9807270 # Grey color for banned/terminated accounts
+
+# Per-message limits enforced by Discord (Guilded's are not stricter)
+MAX_EMBEDS_PER_MESSAGE = 10
+MAX_CHARACTERS_PER_MESSAGE = 6000
+MAX_DESCRIPTION_CHARACTERS = 4096
+# Two digest embeds (with title and footer) fill one message, a full 4096 character one would leave a third unused
+DIGEST_DESCRIPTION_CHARACTERS = min(MAX_DESCRIPTION_CHARACTERS, MAX_CHARACTERS_PER_MESSAGE // 2 - 200)
+
+# Outcomes of WebhookDispatcher.send
+SEND_DELIVERED = "delivered"
+SEND_FAILED = "failed"      # Worth retrying later (rate limits, server errors, network problems)
+SEND_REJECTED = "rejected"  # The platform refused the message (bad URL, invalid payload), retrying will not help
+
+# Titles of the digest embeds: relationship type -> (new entries, removed entries)
+DIGEST_TITLES = {
+    'friends': ("New Friends", "Friends Removed"),
+    'followers': ("New Followers", "Lost Followers"),
+    'followings': ("Now Following", "Unfollowed Users"),
+}
+
+# Titles of the analytics embeds: derived set -> title
+ANALYTICS_TITLES = {
+    'not_followed_back': "Followers you don't follow back",
+    'not_following_back': "Followings who don't follow you back",
+    'mutuals_not_friends': "Mutual follows who are not friends",
+}
+ANALYTICS_MAX_LISTED_USERS = 25  # Users listed per set and direction, the rest is only counted
+
+# Titles of the summary of removed users whose accounts were terminated: relationship type -> title
+TERMINATED_TITLES = {
+    'friends': "Friends Terminated by Roblox",
+    'followers': "Followers Terminated by Roblox",
+    'followings': "Followings Terminated by Roblox",
+}
+TERMINATED_MAX_LISTED_USERS = 50  # Users listed in the summary, the rest is only counted
+
+def footer_text(version):
+    '''Footer shared by every embed of a batch, the timestamp is taken once per batch'''
+    return f"Automatic script - Version {version} | {datetime.now().strftime('%d.%m.%Y %H:%M')}"
+
+def build_embeds(relationship_type_endpoint, embed_data_list, version):
+    '''Builds the embed objects for a group of users.
+    Args:
+        relationship_type_endpoint (str): The type of relationship endpoint (e.g., 'friends', 'followers', 'followings').
+        embed_data_list (list): A list of dictionaries containing user data for the embeds.
+        version (str): The version of the script being used.
+    Returns:
+        list: The embeds, entries that could not be rendered are skipped.
+    '''
+    return [embed for embed, _ in _user_embeds(relationship_type_endpoint, embed_data_list, version)]
+
+def _user_embeds(relationship_type_endpoint, embed_data_list, version) -> List[Tuple[Dict, List[str]]]:
+    embeds = []
+    footer = footer_text(version)
+
+    for data in embed_data_list:
+        username = data.get("username") or "Unknown User"
+        user_id = data.get("user_id")
+        avatar_url = data.get("avatar_url") or DEFAULT_ICON_URL
+        headshot_url = data.get("headshot_url") or DEFAULT_ICON_URL
+        removed = data.get("removed")
+        total_count = data.get("total_count")
+
+        description = ""  # Initializing the description
+        title = None
+        color = None
+
+        # Embed creation logic based on relationship type
+        if relationship_type_endpoint == 'friends':
+            if removed:
+                title = "Friend Removed"
+                description = f"You and [{username}](https://roblox.com/users/{user_id}/profile) are no longer friends."
+                color = COLOR_REMOVED
+            else:
+                title = "New Friend"
+                description = f"You became friends with [{username}](https://roblox.com/users/{user_id}/profile)."
+                color = COLOR_NEW
+
+        elif relationship_type_endpoint == 'followers':
+            if removed:
+                title = "Lost a Follower"
+                description = f"[{username}](https://roblox.com/users/{user_id}/profile) has unfollowed you."
+                color = COLOR_REMOVED
+            else:
+                title = "New Follower"
+                description = f"[{username}](https://roblox.com/users/{user_id}/profile) is now following you."
+                color = COLOR_NEW
+
+        elif relationship_type_endpoint == 'followings':
+            if removed:
+                title = "Unfollowed a User"
+                description = f"You stopped following [{username}](https://roblox.com/users/{user_id}/profile)."
+                color = COLOR_REMOVED
+            else:
+                title = "Now Following"
+                description = f"You started following [{username}](https://roblox.com/users/{user_id}/profile)."
+                color = COLOR_NEW
+
+        # Checking if the `description`, `title`, or `color` is empty
+        if not description or not title or color is None:
+            logger.warning(f"No description/title/color generated for user {username} - Skipping this entry.")
+            continue  # If no description, skip this embed
+
+        description += f"\nYou currently have: {total_count}"  # Adding additional information
+
+        # Create embed
+        embed = {
+            "title": title,
+            "description": description,
+            "color": color,
+            "footer": {
+                "text": footer
+            },
+            "author": {
+                "name": f"{username} [{user_id}]",
+                "url": f"https://www.roblox.com/users/{user_id}/profile",
+                "icon_url": headshot_url
+            },
+            "thumbnail": {
+                "url": avatar_url
+            }
+        }
+        embeds.append((embed, [str(user_id)]))
+
+    return embeds
+
+def build_digest_embeds(relationship_type_endpoint, embed_data_list, version):
+    '''Builds compact summary embeds listing many users each, used for large bursts of changes.
+    Args:
+        relationship_type_endpoint (str): The type of relationship endpoint (e.g., 'friends', 'followers', 'followings').
+        embed_data_list (list): User data as for `build_embeds`, all entries must be either new or removed.
+        version (str): The version of the script being used.
+    Returns:
+        list: Embeds whose descriptions stay within the description limit.
+    '''
+    return [embed for embed, _ in _digest_embeds(relationship_type_endpoint, embed_data_list, version)]
+
+def _digest_embeds(relationship_type_endpoint, embed_data_list, version) -> List[Tuple[Dict, List[str]]]:
+    if not embed_data_list or relationship_type_endpoint not in DIGEST_TITLES:
+        return []
+
+    removed = bool(embed_data_list[0].get("removed"))
+    title = DIGEST_TITLES[relationship_type_endpoint][1 if removed else 0]
+    total_count = embed_data_list[-1].get("total_count")
+    footer = f"You currently have: {total_count} | {footer_text(version)}"
+
+    # Split the user lines into descriptions that fit into one embed each
+    pages = [[]]
+    page_user_ids = [[]]
+    length = 0
+    for data in embed_data_list:
+        username = data.get("username") or "Unknown User"
+        line = f"[{username}](https://roblox.com/users/{data.get('user_id')}/profile)"
+        if pages[-1] and length + len(line) + 1 > DIGEST_DESCRIPTION_CHARACTERS:
+            pages.append([])
+            page_user_ids.append([])
+            length = 0
+        pages[-1].append(line)
+        page_user_ids[-1].append(str(data.get("user_id")))
+        length += len(line) + 1
+
+    embeds = []
+    first = 1
+    for lines, user_ids in zip(pages, page_user_ids):
+        last = first + len(lines) - 1
+        count_text = f"{len(embed_data_list)}" if len(pages) == 1 else f"{first}-{last} of {len(embed_data_list)}"
+        embeds.append(({
+            "title": f"{title} ({count_text})",
+            "description": "\n".join(lines),
+            "color": COLOR_REMOVED if removed else COLOR_NEW,
+            "footer": {"text": footer},
+        }, user_ids))
+        first = last + 1
+    return embeds
+
+def build_analytics_messages(deltas, usernames, counts, version) -> List[Dict]:
+    '''Builds the webhook messages summarizing how the derived sets of a user changed.
+    Args:
+        deltas (dict): Derived set name -> {"added": [user IDs], "removed": [user IDs]}.
+        usernames (dict): User ID -> username for the listed users.
+        counts (dict): Derived set name -> current size.
+        version (str): The version of the script being used.
+    Returns:
+        list: Messages as returned by `build_messages`, sets without changes are left out.
+    '''
+    footer = footer_text(version)
+    embeds = []
+    for name, title in ANALYTICS_TITLES.items():
+        delta = deltas.get(name)
+        if not delta or not (delta["added"] or delta["removed"]):
+            continue
+
+        lines = []
+        user_ids = []
+        for sign, key in (("+", "added"), ("-", "removed")):
+            shown = 0
+            length = 0
+            for user_id in delta[key][:ANALYTICS_MAX_LISTED_USERS]:
+                line = f"{sign} [{usernames.get(user_id) or 'Unknown User'}](https://roblox.com/users/{user_id}/profile)"
+                if length + len(line) + 1 > DIGEST_DESCRIPTION_CHARACTERS // 2 - 40:  # Half for each direction, minus the "more" line
+                    break
+                lines.append(line)
+                user_ids.append(f"{sign}{user_id}")
+                length += len(line) + 1
+                shown += 1
+            if len(delta[key]) > shown:
+                lines.append(f"{sign} ... and {len(delta[key]) - shown} more")
+
+        embeds.append(({
+            "title": f"{title} (+{len(delta['added'])} / -{len(delta['removed'])})",
+            "description": "\n".join(lines),
+            "color": COLOR_ANALYTICS,
+            "footer": {"text": f"Now: {counts.get(name, 0)} | {footer}"},
+        }, user_ids))
+
+    return _to_messages(embeds)
+
+def build_terminated_messages(relationship_type_endpoint, user_ids, usernames, total_count, version) -> List[Dict]:
+    '''Builds the single summary message for removed users whose accounts were banned or terminated.
+    Args:
+        relationship_type_endpoint (str): The type of relationship endpoint (e.g., 'friends', 'followers', 'followings').
+        user_ids (list): IDs of the terminated accounts.
+        usernames (dict): User ID -> last known username, users without one are shown by ID.
+        total_count (int): Current size of the list.
+        version (str): The version of the script being used.
+    Returns:
+        list: One message as returned by `build_messages`, or none without users.
+    '''
+    if not user_ids:
+        return []
+    lines = []
+    length = 0
+    for user_id in user_ids[:TERMINATED_MAX_LISTED_USERS]:
+        line = f"[{usernames.get(user_id) or user_id}](https://roblox.com/users/{user_id}/profile)"
+        if length + len(line) + 1 > DIGEST_DESCRIPTION_CHARACTERS - 40:  # Room for the "more" line
+            break
+        lines.append(line)
+        length += len(line) + 1
+    if len(user_ids) > len(lines):
+        lines.append(f"... and {len(user_ids) - len(lines)} more")
+
+    embed = {
+        "title": f"{TERMINATED_TITLES.get(relationship_type_endpoint, 'Accounts Terminated by Roblox')} ({len(user_ids)})",
+        "description": "\n".join(lines),
+        "color": COLOR_TERMINATED,
+        "footer": {"text": f"You currently have: {total_count} | {footer_text(version)}"},
+    }
+    return [{"payload": {"embeds": [embed]}, "user_ids": [str(user_id) for user_id in user_ids]}]
+
+def embed_length(embed):
+    '''Number of characters of an embed that count towards the per-message limit'''
+    return (len(embed.get("title") or "") + len(embed.get("description") or "") +
+            len((embed.get("footer") or {}).get("text") or "") + len((embed.get("author") or {}).get("name") or "") +
+            sum(len(field.get("name") or "") + len(field.get("value") or "") for field in embed.get("fields") or []))
+
+def pack_embeds(embeds) -> List[List[Dict]]:
+    '''Greedily fill messages up to the per-message embed count and character limits, keeping the order'''
+    messages = []
+    current = []
+    length = 0
+    for embed in embeds:
+        size = embed_length(embed)
+        if current and (len(current) >= MAX_EMBEDS_PER_MESSAGE or length + size > MAX_CHARACTERS_PER_MESSAGE):
+            messages.append(current)
+            current = []
+            length = 0
+        current.append(embed)
+        length += size
+    if current:
+        messages.append(current)
+    return messages
+
+def build_messages(relationship_type_endpoint, embed_data_list, version, digest=False) -> List[Dict]:
+    '''Builds the webhook messages for a batch of users.
+    Args:
+        relationship_type_endpoint (str): The type of relationship endpoint (e.g., 'friends', 'followers', 'followings').
+        embed_data_list (list): A list of dictionaries containing user data for the embeds.
+        version (str): The version of the script being used.
+        digest (bool): List the users in compact summary embeds instead of one embed per user.
+    Returns:
+        list: As few messages as the platform limits allow, each a dictionary with the "payload" for
+        `WebhookDispatcher.send` and the "user_ids" it mentions.
+    '''
+    if not embed_data_list:
+        return []
+    if digest:
+        embeds = _digest_embeds(relationship_type_endpoint, embed_data_list, version)
+    else:
+        embeds = _user_embeds(relationship_type_endpoint, embed_data_list, version)
+    if not embeds:
+        logger.warning("No embeds generated. Skipping webhook send.")
+    return _to_messages(embeds)
+
+def _to_messages(embeds: List[Tuple[Dict, List[str]]]) -> List[Dict]:
+    messages = []
+    position = 0
+    for group in pack_embeds([embed for embed, _ in embeds]):
+        user_ids = [user_id for _, ids in embeds[position:position + len(group)] for user_id in ids]
+        position += len(group)
+        messages.append({"payload": {"embeds": group}, "user_ids": user_ids})
+    return messages
+
+def _header_float(headers, name: str) -> Optional[float]:
+    value = headers.get(name)
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+class WebhookRateLimiter:
+    '''Tracks the rate limit bucket of one webhook URL from the response headers'''
+    def __init__(self, fallback_interval: float = 1.0):
+        self.fallback_interval = fallback_interval
+        self.remaining = None
+        self.reset_at = 0.0
+        self.blocked_until = 0.0
+        self.lock = asyncio.Lock()  # Requests to the same webhook are sent one at a time, in order
+
+    async def wait(self) -> None:
+        '''Sleep until the bucket allows another request'''
+        now = time.monotonic()
+        wait_until = self.blocked_until
+        if self.remaining is not None and self.remaining <= 0:
+            wait_until = max(wait_until, self.reset_at)
+        if wait_until > now:
+            await asyncio.sleep(wait_until - now)
+
+    def update(self, headers) -> None:
+        '''Read X-RateLimit-Remaining / X-RateLimit-Reset-After from a response'''
+        now = time.monotonic()
+        remaining = _header_float(headers, "X-RateLimit-Remaining")
+        reset_after = _header_float(headers, "X-RateLimit-Reset-After")
+
+        if remaining is None and reset_after is None:
+            # The platform does not report its limits, fall back to the configured spacing
+            self.remaining = 0
+            self.reset_at = now + self.fallback_interval
+            return
+
+        if remaining is not None:
+            self.remaining = int(remaining)
+        if reset_after is not None:
+            self.reset_at = now + reset_after
+
+    def block(self, retry_after: float) -> None:
+        '''Pause the bucket after a 429'''
+        self.remaining = 0
+        self.blocked_until = max(self.blocked_until, time.monotonic() + retry_after)
+
+class WebhookDispatcher:
+    '''Sends webhook payloads over a shared aiohttp session.
+
+    Every webhook URL has its own rate limit bucket: messages for the same URL go out in order and
+    as fast as the bucket allows, while different URLs (e.g. Discord and Guilded) are sent concurrently.
+    '''
+    MAX_ATTEMPTS = 5
+    REQUEST_TIMEOUT = 15
+    DEFAULT_RETRY_AFTER = 1.0
+
+    def __init__(self, session: aiohttp.ClientSession, fallback_interval: float = 1.0):
+        self.session = session
+        self.fallback_interval = fallback_interval
+        self.limiters: Dict[str, WebhookRateLimiter] = {}
+
+    def _limiter(self, webhook_url: str) -> WebhookRateLimiter:
+        if webhook_url not in self.limiters:
+            self.limiters[webhook_url] = WebhookRateLimiter(self.fallback_interval)
+        return self.limiters[webhook_url]
+
+    async def send(self, platform: str, webhook_url: str, payload: Dict, headers: Optional[Dict[str, str]] = None) -> str:
+        '''Post a payload, retrying 429s and transient errors. Returns SEND_DELIVERED on a 2xx response,
+        SEND_REJECTED on other 4xx responses and SEND_FAILED when all attempts failed.'''
+        limiter = self._limiter(webhook_url)
+        name = platform.capitalize()
+
+        async with limiter.lock:
+            for attempt in range(1, self.MAX_ATTEMPTS + 1):
+                if attempt > 1:
+                    METRICS.record_retry(webhook_url)
+                started = time.perf_counter()
+                await limiter.wait()
+                sent = time.perf_counter()
+                METRICS.record_limiter_wait(webhook_url, sent - started)
+                responded = False
+                try:
+                    async with self.session.post(webhook_url, json=payload, headers=headers,
+                                                 timeout=aiohttp.ClientTimeout(total=self.REQUEST_TIMEOUT)) as response:
+                        body = await response.read()
+                        responded = True
+                        METRICS.record_response(webhook_url, response.status, time.perf_counter() - sent, len(body))
+                        if response.status != 429:
+                            limiter.update(response.headers)
+
+                        if 200 <= response.status < 300:
+                            logger.debug(f"[{name}] - OK")
+                            return SEND_DELIVERED
+
+                        if response.status == 429:
+                            retry_after = _header_float(response.headers, "Retry-After")
+                            try:
+                                data = await response.json(content_type=None)
+                                retry_after = float(data.get("retry_after", retry_after))
+                            except (ValueError, TypeError, AttributeError, aiohttp.ContentTypeError):
+                                pass
+                            retry_after = retry_after if retry_after is not None else self.DEFAULT_RETRY_AFTER
+                            logger.warning(f"[{name}] - Rate limited, retrying in {retry_after:.2f}s (attempt {attempt}/{self.MAX_ATTEMPTS})")
+                            limiter.block(retry_after)
+                            continue
+
+                        text = await response.text()
+                        if response.status < 500:
+                            # Client errors (bad URL, invalid payload) will not succeed on retry
+                            logger.error(f"[{name}] - Error: {response.status}, {text}")
+                            return SEND_REJECTED
+                        logger.warning(f"[{name}] - Error: {response.status}, attempt {attempt}/{self.MAX_ATTEMPTS}")
+
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    if not responded:
+                        METRICS.record_failure(webhook_url, time.perf_counter() - sent, timeout=isinstance(e, asyncio.TimeoutError))
+                    logger.warning(f"[{name}] - Request failed: {e!r}, attempt {attempt}/{self.MAX_ATTEMPTS}")
+
+                limiter.block(min(2 ** attempt, 30))
+
+        logger.error(f"[{name}] - Giving up after {self.MAX_ATTEMPTS} attempts")
+        return SEND_FAILED
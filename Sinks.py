@@ -0,0 +1,327 @@
+# pylint: disable=W1203 # Use lazy % formatting...
+# pylint: disable=C0301 # Line too long
+# pylint: disable=W0718 # Catching too general exception
+'''Notification sinks: the destinations webhook messages are delivered to.
+
+Every configured destination (a Discord or Guilded webhook, a generic JSON HTTP endpoint, a JSONL
+file, stdout or a Unix socket) is one sink with its own bounded queue and worker task. Messages for
+one sink are delivered in order while different sinks are served concurrently. A slow or broken
+sink only fills its own queue: once it is full, further messages are refused instead of holding up
+the crawl, and the caller leaves them in the outbox (or drops them without one).
+'''
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from Metrics import METRICS, endpoint_label
+from SendEmbed import WebhookDispatcher, SEND_DELIVERED, SEND_FAILED
+
+logger = logging.getLogger("RobloxTracker")
+
+DEFAULT_SINK_QUEUE_SIZE = 1000  # Messages waiting per sink before new ones are refused
+SINK_FAILURE_COOLDOWN = 60.0  # Seconds outbox messages skip a sink after a failed delivery
+
+# Awaited with (sink, entry, outcome) after every message, before the sink sends the next one
+ResultCallback = Callable[["Sink", Dict, Optional[str]], Awaitable[None]]
+
+async def _ignore_result(sink: "Sink", entry: Dict, outcome: Optional[str]) -> None:
+    """Default result callback of a sink that is not part of a registry."""
+    del sink, entry, outcome
+
+class Sink:
+    '''One destination with a bounded queue, served by its own worker task.
+
+    Subclasses implement `deliver` and return one of the SEND_* outcomes. Queued entries are the
+    outbox entries built by the tracker: target_key, webhook_type, payload (the embeds), user_ids.
+    '''
+    kind = ""
+
+    def __init__(self, address: str, queue_size: int = DEFAULT_SINK_QUEUE_SIZE):
+        self.address = address
+        self.queue_size = max(1, queue_size)
+        self.name = f"{self.kind}:{self.label()}"
+        self.queue: Optional[asyncio.Queue] = None
+        self.worker: Optional[asyncio.Task] = None
+        self.suspended_until = 0.0
+        self.on_result: ResultCallback = _ignore_result
+
+    def label(self) -> str:
+        """Name used in logs and metrics, must not contain secrets."""
+        return self.address
+
+    @staticmethod
+    def problem(spec: Dict) -> Optional[str]:
+        """Why a sink spec of this kind cannot be used, None if it is fine."""
+        del spec  # Every spec passes unless a sink type checks it
+        return None
+
+    async def deliver(self, entry: Dict) -> str:
+        """Send one entry, returns SEND_DELIVERED, SEND_FAILED or SEND_REJECTED."""
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        """Release connections, called once the queue is empty."""
+
+    def submit(self, entry: Dict) -> bool:
+        """Queue an entry without waiting. Returns False when the queue is full."""
+        if self.queue is None:
+            self.queue = asyncio.Queue(self.queue_size)
+            self.worker = asyncio.create_task(self._run())
+        try:
+            self.queue.put_nowait(entry)
+        except asyncio.QueueFull:
+            METRICS.record_sink(self.name, "overflow")
+            return False
+        METRICS.record_sink(self.name, "queued")
+        METRICS.record_sink_depth(self.name, self.queue.qsize())
+        return True
+
+    async def _run(self) -> None:
+        while True:
+            entry = await self.queue.get()
+            try:
+                if entry["id"] is not None and time.monotonic() < self.suspended_until:
+                    # The outbox keeps it, sending it now would only repeat the failure
+                    METRICS.record_sink(self.name, "skipped")
+                    await self._report(entry, None)
+                    continue
+
+                started = time.perf_counter()
+                try:
+                    outcome = await self.deliver(entry)
+                except Exception as e:
+                    logger.error(f"[{self.name}] Delivery failed: {e}")
+                    outcome = SEND_FAILED
+                METRICS.record_sink(self.name, outcome)
+                METRICS.record_sink(self.name, "send_seconds", time.perf_counter() - started)
+                self.suspended_until = time.monotonic() + SINK_FAILURE_COOLDOWN if outcome == SEND_FAILED else 0.0
+                await self._report(entry, outcome)
+            finally:
+                self.queue.task_done()
+                METRICS.record_sink_depth(self.name, self.queue.qsize())
+
+    async def _report(self, entry: Dict, outcome: Optional[str]) -> None:
+        try:
+            await self.on_result(self, entry, outcome)
+        except Exception as e:  # The worker must keep draining the queue
+            logger.error(f"[{self.name}] Failed to record the delivery result: {e}")
+
+    async def join(self) -> None:
+        """Wait until everything queued so far was handled."""
+        if self.queue is not None:
+            await self.queue.join()
+
+    async def stop(self) -> None:
+        """Cancel the worker and close the sink, entries still queued are not sent."""
+        if self.worker is not None:
+            self.worker.cancel()
+            try:
+                await self.worker
+            except asyncio.CancelledError:
+                pass
+            self.worker = None
+        await self.close()
+
+def event_from_entry(entry: Dict) -> Dict:
+    """Message as seen by the generic sinks: which target, what happened, who, and the rendered embeds."""
+    return {
+        "target": entry["target_key"],
+        "type": entry["webhook_type"],
+        "user_ids": entry.get("user_ids", []),
+        "payload": entry["payload"],
+        "created": int(time.time()),
+    }
+
+class WebhookSink(Sink):
+    '''Chat webhook (Discord or Guilded), paced by the platform's rate limit headers'''
+    url_prefix = ""
+
+    def __init__(self, address: str, dispatcher: WebhookDispatcher, queue_size: int = DEFAULT_SINK_QUEUE_SIZE):
+        self.dispatcher = dispatcher
+        super().__init__(address, queue_size)
+
+    def label(self) -> str:
+        """Host and path of the webhook without its token."""
+        return endpoint_label(self.address)  # Drops the webhook token
+
+    @classmethod
+    def problem(cls, spec: Dict) -> Optional[str]:
+        """Reject URLs that do not point at the platform's webhooks."""
+        if not spec["url"].startswith(cls.url_prefix):
+            return f"Invalid {cls.kind.capitalize()} webhook URL"
+        return None
+
+    async def deliver(self, entry: Dict) -> str:
+        """Post the rendered embeds to the webhook."""
+        return await self.dispatcher.send(self.kind, self.address, entry["payload"])
+
+class DiscordSink(WebhookSink):
+    '''Discord channel webhook'''
+    kind = "discord"
+    url_prefix = "https://discord.com/api/webhooks/"
+
+class GuildedSink(WebhookSink):
+    '''Guilded channel webhook'''
+    kind = "guilded"
+    url_prefix = "https://media.guilded.gg/webhooks/"
+
+class HttpJsonSink(Sink):
+    '''POSTs every event as JSON to an arbitrary endpoint, with optional extra headers (e.g. auth)'''
+    kind = "http"
+
+    def __init__(self, address: str, dispatcher: WebhookDispatcher, headers: Optional[Dict[str, str]] = None,
+                 queue_size: int = DEFAULT_SINK_QUEUE_SIZE):
+        self.dispatcher = dispatcher
+        self.headers = headers or {}
+        super().__init__(address, queue_size)
+
+    def label(self) -> str:
+        """Host and path of the endpoint, IDs and tokens in it are masked."""
+        return endpoint_label(self.address)
+
+    @staticmethod
+    def problem(spec: Dict) -> Optional[str]:
+        """Reject URLs that are not HTTP(S)."""
+        if not spec["url"].startswith(("http://", "https://")):
+            return "HTTP sink URL must start with http:// or https://"
+        return None
+
+    async def deliver(self, entry: Dict) -> str:
+        """POST the event as JSON with the configured headers."""
+        return await self.dispatcher.send(self.kind, self.address, event_from_entry(entry), self.headers)
+
+class JsonlFileSink(Sink):
+    '''Appends one JSON line per event to a local file'''
+    kind = "jsonl"
+
+    async def deliver(self, entry: Dict) -> str:
+        """Append the event as one line."""
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.address)), exist_ok=True)
+            with open(self.address, 'a', encoding='utf-8') as file:
+                file.write(json.dumps(event_from_entry(entry)) + "\n")
+        except OSError as e:
+            logger.error(f"[{self.name}] Cannot append to {self.address}: {e}")
+            return SEND_FAILED
+        return SEND_DELIVERED
+
+class StdoutSink(Sink):
+    '''Prints one JSON line per event, e.g. to pipe the tracker into another program'''
+    kind = "stdout"
+
+    async def deliver(self, entry: Dict) -> str:
+        """Print the event as one line."""
+        print(json.dumps(event_from_entry(entry)), flush=True)
+        return SEND_DELIVERED
+
+class UnixSocketSink(Sink):
+    '''Writes one JSON line per event to a local Unix stream socket, reconnecting when needed'''
+    kind = "unix"
+
+    def __init__(self, address: str, queue_size: int = DEFAULT_SINK_QUEUE_SIZE):
+        super().__init__(address, queue_size)
+        self.writer: Optional[asyncio.StreamWriter] = None
+
+    @staticmethod
+    def problem(spec: Dict) -> Optional[str]:
+        """Unix sockets are not available on every platform (Windows)."""
+        if not hasattr(socket, "AF_UNIX"):
+            return f"Unix socket sinks are not supported on {sys.platform} ({spec['path']})"
+        return None
+
+    async def deliver(self, entry: Dict) -> str:
+        """Write the event as one line, connecting first if needed."""
+        line = (json.dumps(event_from_entry(entry)) + "\n").encode('utf-8')
+        for attempt in range(2):  # The listener may have restarted since the last message
+            try:
+                if self.writer is None:
+                    _, self.writer = await asyncio.open_unix_connection(self.address)
+                self.writer.write(line)
+                await self.writer.drain()
+                return SEND_DELIVERED
+            except (OSError, ConnectionError) as e:
+                await self.close()
+                if attempt == 1:
+                    logger.error(f"[{self.name}] Cannot write to {self.address}: {e}")
+        return SEND_FAILED
+
+    async def close(self) -> None:
+        """Close the connection, the next message reconnects."""
+        if self.writer is not None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except (OSError, ConnectionError):
+                pass
+            self.writer = None
+
+SINK_TYPES = {sink.kind: sink for sink in (DiscordSink, GuildedSink, HttpJsonSink, JsonlFileSink, StdoutSink, UnixSocketSink)}
+
+def normalize_sink_spec(spec: Dict, script_directory: str) -> Dict:
+    """Check the shape of a configured sink and fill in defaults. Raises ValueError for invalid specs."""
+    if not isinstance(spec, dict) or spec.get("type") not in SINK_TYPES:
+        raise ValueError(f"Unknown sink {spec!r}, valid types: {', '.join(SINK_TYPES)}")
+    kind = spec["type"]
+    normalized = {"type": kind, "queue_size": int(spec.get("queue_size", DEFAULT_SINK_QUEUE_SIZE))}
+    if kind in ("discord", "guilded", "http"):
+        if not spec.get("url"):
+            raise ValueError(f"{kind} sink is missing its url")
+        normalized["url"] = spec["url"]
+        if kind == "http":
+            normalized["headers"] = dict(spec.get("headers", {}))
+    elif kind in ("jsonl", "unix"):
+        if not spec.get("path"):
+            raise ValueError(f"{kind} sink is missing its path")
+        normalized["path"] = os.path.join(script_directory, spec["path"])
+    return normalized
+
+def sink_key(spec: Dict) -> Tuple[str, str]:
+    """(kind, address) identifying the destination of a spec, also stored with every outbox entry."""
+    return spec["type"], spec.get("url") or spec.get("path") or spec["type"]
+
+def sink_problem(spec: Dict) -> Optional[str]:
+    """Why a normalized spec cannot be used on this system, None if it is fine."""
+    return SINK_TYPES[spec["type"]].problem(spec)
+
+class SinkRegistry:
+    '''The sinks of a tracker process. Targets sending to the same destination share one sink (and queue).'''
+    def __init__(self, dispatcher: WebhookDispatcher, on_result: ResultCallback):
+        self.dispatcher = dispatcher
+        self.on_result = on_result
+        self.sinks: Dict[Tuple[str, str], Sink] = {}
+
+    def get(self, spec: Dict) -> Sink:
+        """Return the sink of a normalized spec, creating it on first use."""
+        key = sink_key(spec)
+        if key not in self.sinks:
+            kind, address = key
+            queue_size = spec.get("queue_size", DEFAULT_SINK_QUEUE_SIZE)
+            if kind in ("discord", "guilded"):
+                sink = SINK_TYPES[kind](address, self.dispatcher, queue_size)
+            elif kind == "http":
+                sink = HttpJsonSink(address, self.dispatcher, spec.get("headers"), queue_size)
+            else:
+                sink = SINK_TYPES[kind](address, queue_size)
+            sink.on_result = self.on_result
+            self.sinks[key] = sink
+        return self.sinks[key]
+
+    def find(self, kind: str, address: str) -> Optional[Sink]:
+        """Sink of an outbox entry, None if that destination is no longer configured."""
+        return self.sinks.get((kind, address))
+
+    def for_specs(self, specs: List[Dict]) -> List[Sink]:
+        """Sinks of a target's normalized specs."""
+        return [self.get(spec) for spec in specs]
+
+    async def join(self) -> None:
+        """Wait until every sink delivered (or gave up on) everything queued so far."""
+        await asyncio.gather(*(sink.join() for sink in self.sinks.values()))
+
+    async def close(self) -> None:
+        """Stop every sink."""
+        await asyncio.gather(*(sink.stop() for sink in self.sinks.values()))
@@ -0,0 +1,262 @@
+# pylint: disable=W1203 # Use lazy % formatting...
+# pylint: disable=C0301 # Line too long
+'''Compact on-disk snapshots of relationship lists stored as sorted 64-bit user IDs.'''
+import os
+import sys
+import mmap
+import struct
+import logging
+import tempfile
+from array import array
+from bisect import bisect_left
+from itertools import groupby
+from typing import Iterable, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # Optional, the sorted-array operations below fall back to pure Python
+    np = None
+
+logger = logging.getLogger("RobloxTracker")
+
+SNAPSHOT_MAGIC = b"RFTSNAP1"
+SNAPSHOT_HEADER = struct.Struct("<8sQ")  # magic, number of IDs
+SNAPSHOT_EXTENSION = ".snap"
+
+class SnapshotError(Exception):
+    '''Raised when a snapshot file exists but cannot be read'''
+
+class Snapshot:
+    '''Read-only view of a snapshot file, memory-mapped when possible.
+
+    The IDs are exposed as a sorted sequence of ints. Close the snapshot (or use it as a
+    context manager) before the file gets replaced, Windows refuses to rename over a mapped file.
+    '''
+    def __init__(self, ids: Sequence[int], mapping: mmap.mmap = None, views: Tuple[memoryview, ...] = ()):
+        self.ids = ids
+        self._mapping = mapping
+        self._views = views
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __contains__(self, user_id: int) -> bool:
+        index = bisect_left(self.ids, user_id)
+        return index < len(self.ids) and self.ids[index] == user_id
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self) -> None:
+        '''Release the memory mapping, the IDs are no longer accessible afterwards'''
+        if self._mapping is not None:
+            for view in self._views:
+                view.release()
+            self._views = ()
+            self._mapping.close()
+            self._mapping = None
+            self.ids = array('q')
+
+def load_snapshot(path: str) -> Snapshot:
+    """Open a snapshot file. A missing or empty file is treated as an empty snapshot."""
+    if not os.path.isfile(path) or os.path.getsize(path) == 0:
+        return Snapshot(array('q'))
+
+    with open(path, 'rb') as file:
+        header = file.read(SNAPSHOT_HEADER.size)
+        if len(header) < SNAPSHOT_HEADER.size:
+            raise SnapshotError(f"Snapshot {path} is truncated")
+        magic, count = SNAPSHOT_HEADER.unpack(header)
+        if magic != SNAPSHOT_MAGIC:
+            raise SnapshotError(f"{path} is not a snapshot file")
+        expected_size = SNAPSHOT_HEADER.size + count * 8
+        if os.path.getsize(path) != expected_size:
+            raise SnapshotError(f"Snapshot {path} has unexpected size (expected {expected_size} bytes)")
+        if count == 0:
+            return Snapshot(array('q'))
+
+        if sys.byteorder != "little":
+            ids = array('q')
+            ids.frombytes(file.read(count * 8))
+            ids.byteswap()
+            return Snapshot(ids)
+
+        mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    body = memoryview(mapping)[SNAPSHOT_HEADER.size:]
+    ids = body.cast('q')
+    return Snapshot(ids, mapping, (ids, body))
+
+def write_snapshot(path: str, sorted_ids: Iterable[int]) -> None:
+    """Atomically replace a snapshot: write a temp file, fsync it and rename it over the old one."""
+    ids = sorted_ids if isinstance(sorted_ids, array) and sorted_ids.typecode == 'q' else array('q', sorted_ids)
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+
+    fd, temp_path = tempfile.mkstemp(prefix=".snapshot-", dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            file.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, len(ids)))
+            if sys.byteorder != "little":
+                ids = array('q', ids)
+                ids.byteswap()
+            file.write(ids.tobytes())
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    # Persist the rename itself, not supported on Windows
+    if hasattr(os, "O_DIRECTORY"):
+        dir_fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+def _to_numpy(ids: Sequence[int]):
+    """View an array('q') or a snapshot memoryview as an int64 NumPy array without copying."""
+    if isinstance(ids, (array, memoryview)):
+        return np.frombuffer(ids, dtype=np.int64)
+    return np.asarray(ids, dtype=np.int64)
+
+def _from_numpy(values) -> array:
+    ids = array('q')
+    ids.frombytes(values.astype(np.int64, copy=False).tobytes())
+    return ids
+
+def sorted_unique(ids: Sequence[int]) -> array:
+    """Sort a collected ID list and drop duplicates (pages can overlap while the list changes)."""
+    if np is not None:
+        return _from_numpy(np.unique(_to_numpy(ids)))
+    return array('q', (uid for uid, _ in groupby(sorted(ids))))  # No intermediate set of a million ints
+
+def diff_sorted(previous: Sequence[int], current: Sequence[int]) -> Tuple[array, array]:
+    """Difference of two sorted, duplicate-free ID sequences.
+
+    Returns (added, removed): IDs only present in `current` and IDs only present in `previous`,
+    both sorted. Vectorized with NumPy when it is installed, a linear merge otherwise.
+    """
+    if np is not None:
+        previous_ids, current_ids = _to_numpy(previous), _to_numpy(current)
+        return (_from_numpy(np.setdiff1d(current_ids, previous_ids, assume_unique=True)),
+                _from_numpy(np.setdiff1d(previous_ids, current_ids, assume_unique=True)))
+
+    added = array('q')
+    removed = array('q')
+    i = j = 0
+    len_previous, len_current = len(previous), len(current)
+
+    while i < len_previous and j < len_current:
+        old, new = previous[i], current[j]
+        if old == new:
+            i += 1
+            j += 1
+        elif old < new:
+            removed.append(old)
+            i += 1
+        else:
+            added.append(new)
+            j += 1
+
+    removed.extend(previous[i:])
+    added.extend(current[j:])
+    return added, removed
+
+def difference_sorted(ids: Sequence[int], excluded: Sequence[int]) -> array:
+    """IDs of the sorted, duplicate-free `ids` that are not in the sorted, duplicate-free `excluded`."""
+    if np is not None:
+        return _from_numpy(np.setdiff1d(_to_numpy(ids), _to_numpy(excluded), assume_unique=True))
+    return diff_sorted(excluded, ids)[0]
+
+def intersect_sorted(first: Sequence[int], second: Sequence[int]) -> array:
+    """IDs present in both sorted, duplicate-free sequences."""
+    if np is not None:
+        return _from_numpy(np.intersect1d(_to_numpy(first), _to_numpy(second), assume_unique=True))
+
+    common = array('q')
+    i = j = 0
+    len_first, len_second = len(first), len(second)
+    while i < len_first and j < len_second:
+        a, b = first[i], second[j]
+        if a == b:
+            common.append(a)
+            i += 1
+            j += 1
+        elif a < b:
+            i += 1
+        else:
+            j += 1
+    return common
+
+def merge_sorted(existing: Sequence[int], additions: Sequence[int]) -> array:
+    """Union of two sorted, duplicate-free ID sequences as a new sorted array."""
+    if np is not None:
+        return _from_numpy(np.union1d(_to_numpy(existing), _to_numpy(additions)))
+
+    merged = array('q')
+    i = j = 0
+    len_existing, len_additions = len(existing), len(additions)
+
+    while i < len_existing and j < len_additions:
+        old, new = existing[i], additions[j]
+        if old == new:
+            merged.append(old)
+            i += 1
+            j += 1
+        elif old < new:
+            merged.append(old)
+            i += 1
+        else:
+            merged.append(new)
+            j += 1
+
+    merged.extend(existing[i:])
+    merged.extend(additions[j:])
+    return merged
+
+def migrate_text_snapshot(text_path: str, snapshot_path: str) -> bool:
+    """One-time conversion of an old newline separated ID file into a snapshot.
+
+    Does nothing when the snapshot already exists or there is no text file to convert.
+    The text file is left untouched so it can still be used by older versions.
+    """
+    if os.path.exists(snapshot_path) or not os.path.isfile(text_path) or os.path.getsize(text_path) == 0:
+        return False
+
+    with open(text_path, 'r', encoding='utf-8') as file:
+        ids = sorted({int(line) for line in (raw.strip() for raw in file) if line})
+
+    write_snapshot(snapshot_path, ids)
+    logger.info(f"Migrated {len(ids)} IDs from {text_path} to {snapshot_path}, the old file is no longer used")
+    return True
+
+def read_snapshot_ids(path: str) -> array:
+    """Copy the IDs of a snapshot file into memory, the file is closed again right away."""
+    with load_snapshot(path) as snapshot:
+        ids = array('q')
+        if isinstance(snapshot.ids, memoryview):
+            ids.frombytes(snapshot.ids.tobytes())
+        else:
+            ids.extend(snapshot.ids)
+    return ids
+
+class SnapshotCache:
+    '''Keeps the latest snapshot of every target in memory between passes (watch mode).'''
+    def __init__(self):
+        self._ids = {}
+
+    def load(self, path: str) -> Snapshot:
+        """Return the cached snapshot, reading it from disk the first time."""
+        if path not in self._ids:
+            self._ids[path] = read_snapshot_ids(path)
+        return Snapshot(self._ids[path])
+
+    def store(self, path: str, sorted_ids: Sequence[int]) -> None:
+        """Remember the list that was just written to `path`."""
+        self._ids[path] = sorted_ids if isinstance(sorted_ids, array) else array('q', sorted_ids)